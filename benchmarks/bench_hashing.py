@@ -0,0 +1,96 @@
+from datetime import datetime
+import hashlib
+import timeit
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.models import Article
+from core import hashing
+
+"""Compare the canonical hashing engine against the __dict__ based _hash_table."""
+
+"""Hashes ROW_COUNT transient articles with short bodies and LARGE_ROW_COUNT with
+LARGE_BODY_SIZE character bodies, base hash plus chain hash per row as the save
+pipeline does.  No database is touched.  Run from the repository root:
+
+    python benchmarks/bench_hashing.py
+"""
+
+ROW_COUNT = 10000
+LARGE_ROW_COUNT = 200
+LARGE_BODY_SIZE = 1000000
+REPEAT = 3
+
+
+def legacy_hash_table(db_object, chain=False):
+    """_hash_table as it was before the hashing engine"""
+    to_hash_dict = {}
+    if chain:
+        key_values_to_ignore = ["_sa_instance_state"]
+    else:
+        key_values_to_ignore = ["_sa_instance_state", "_hash", "_hash_chain"]
+    for key, value in db_object.__dict__.items():
+        if key not in key_values_to_ignore:
+            if "datetime" in str(type(value)):
+                to_hash_dict[key] = str(value)
+            else:
+                to_hash_dict[key] = value
+    return hashlib.sha256(json.dumps(to_hash_dict).encode()).hexdigest()
+
+
+def build_articles(count, body_size):
+    now = datetime.utcnow()
+    body = (
+        "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>"
+        * (body_size // 64 + 1)
+    )[:body_size]
+    return [
+        Article(
+            _id=number,
+            _version=1,
+            _node_id=number,
+            _hash=None,
+            _hash_chain=None,
+            _timestamp=now,
+            _lock="",
+            _state=None,
+            _perms=None,
+            title=f"Article {number}",
+            body=body,
+        )
+        for number in range(count)
+    ]
+
+
+def main():
+    for label, articles in (
+        (f"{ROW_COUNT} short rows", build_articles(ROW_COUNT, 2000)),
+        (
+            f"{LARGE_ROW_COUNT} rows of {LARGE_BODY_SIZE // 1000}k",
+            build_articles(LARGE_ROW_COUNT, LARGE_BODY_SIZE),
+        ),
+    ):
+        candidates = [
+            ("legacy _hash_table", legacy_hash_table),
+            ("hash_row sha256", lambda row, chain=False: hashing.hash_row(row, chain)),
+            (
+                "hash_row blake2b",
+                lambda row, chain=False: hashing.hash_row(row, chain, "blake2b"),
+            ),
+        ]
+        for name, hash_function in candidates:
+
+            def run():
+                for article in articles:
+                    hash_function(article)
+                    hash_function(article, chain=True)
+
+            best = min(timeit.repeat(run, number=1, repeat=REPEAT))
+            print(f"{label:<22} {name:<20} {best * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
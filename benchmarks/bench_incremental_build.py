@@ -0,0 +1,75 @@
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+"""Static build time after a one article edit, full against incremental."""
+
+"""Saves ARTICLE_COUNT articles to a throwaway SQLite database, builds the site, edits
+one article and builds it again with the manifest of the first build, then once more
+from scratch.  Run from the repository root:
+
+    python benchmarks/bench_incremental_build.py [ARTICLE_COUNT]
+"""
+
+ARTICLE_COUNT = 2000
+
+build_dir = tempfile.mkdtemp()
+# Spawned build workers run this module again, they keep the parent's database
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(build_dir, 'bench.db')}"
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import app, db
+from core import builders
+from core.controllers import save_article
+
+
+def timed(label, data):
+    start = time.perf_counter()
+    result = builders.build_static_site(data)
+    print(f"{label:<12} {time.perf_counter() - start:8.2f}s  {result}")
+
+
+def main(count):
+    with app.test_request_context():
+        db.create_all()
+        import core.init_cms  # Content types and the root user
+
+        node_ids = [
+            save_article(
+                {
+                    "hidden_node_id": "",
+                    "hidden_node_version": "",
+                    "title": f"Article {number}",
+                    "body": f"<p>Body of article {number}.</p>",
+                }
+            )["node"]._id
+            for number in range(count)
+        ]
+    db.session.remove()
+
+    static_files_dir = os.path.join(app.root_path, "static")
+    data = {
+        "local_build_dir": os.path.join(build_dir, "site"),
+        "static_files_dir": static_files_dir,
+    }
+    with app.test_request_context():
+        timed("first build", data)
+        save_article(
+            {
+                "hidden_node_id": node_ids[count // 2],
+                "hidden_node_version": 1,
+                "title": "Edited article",
+                "body": "<p>Edited body.</p>",
+            }
+        )
+        timed("incremental", data)
+        shutil.rmtree(data["local_build_dir"])
+        timed("full", data)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ARTICLE_COUNT)
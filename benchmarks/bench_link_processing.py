@@ -0,0 +1,106 @@
+from bs4 import BeautifulSoup
+import lxml.html
+import tempfile
+import time
+import sys
+import os
+
+"""Link extraction and rewriting of large pages, BeautifulSoup against lxml."""
+
+"""Generates a page of PARAGRAPHS paragraphs with site, external and href-less links
+and runs it through the BeautifulSoup link processing the builder used before, once
+for the two passes of find_links() and htmlify_links(), once as a single pass, and
+through process_links() on lxml.  Checks they find and rewrite the same links.  Run
+from the repository root:
+
+    python benchmarks/bench_link_processing.py [PARAGRAPHS]
+"""
+
+PARAGRAPHS = 5000
+ROUNDS = 5
+
+build_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(build_dir, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.builders import process_links, static_path
+
+
+def page(paragraphs):
+    body = "".join(
+        f'<p>Paragraph {number} <a href="/view/article/{number}">article</a> '
+        f'<a href="/view/articles-list?before=cursor{number}">older</a> '
+        '<a href="https://example.com/">external</a> <a name="anchor">anchor</a> '
+        + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4
+        + "</p>\n"
+        for number in range(paragraphs)
+    )
+    return (
+        "<!DOCTYPE html>\n<html><head><title>Bench</title></head><body>"
+        f'<a href="/">home</a> <a href="/index">index</a>{body}</body></html>'
+    )
+
+
+def bs4_find_links(page_data):
+    links = {}
+    for link in BeautifulSoup(page_data, "html.parser").find_all("a"):
+        link_href = link.get("href") or ""
+        if link_href.startswith("/") and link_href not in ("/index", "/"):
+            links[link_href] = True
+    return list(links)
+
+
+def bs4_htmlify_links(page_data):
+    soup = BeautifulSoup(page_data, "html.parser")
+    for link in soup.find_all("a"):
+        link_href = link.get("href") or ""
+        if link_href.startswith("/") and link_href != "/":
+            link["href"] = f"{static_path(link_href)}.html"
+    return str(soup)
+
+
+def bs4_two_passes(page_data):
+    return bs4_htmlify_links(page_data), bs4_find_links(page_data)
+
+
+def bs4_single_pass(page_data):
+    links = {}
+    soup = BeautifulSoup(page_data, "html.parser")
+    for link in soup.find_all("a"):
+        link_href = link.get("href") or ""
+        if link_href.startswith("/") and link_href not in ("/index", "/"):
+            links[link_href] = True
+        if link_href.startswith("/") and link_href != "/":
+            link["href"] = f"{static_path(link_href)}.html"
+    return str(soup), list(links)
+
+
+def hrefs(page_data):
+    return [
+        link.get("href") for link in lxml.html.document_fromstring(page_data).iter("a")
+    ]
+
+
+def timed(label, function, page_data):
+    start = time.perf_counter()
+    for round_number in range(ROUNDS):
+        result = function(page_data)
+    elapsed = (time.perf_counter() - start) / ROUNDS
+    print(f"{label:<16} {elapsed * 1000:9.1f} ms/page")
+    return result
+
+
+def main(paragraphs):
+    page_data = page(paragraphs)
+    print(f"{len(page_data) // 1024} KB page, {page_data.count('<a ')} links")
+    two_passes = timed("bs4 two passes", bs4_two_passes, page_data)
+    single_pass = timed("bs4 single pass", bs4_single_pass, page_data)
+    processed = timed("lxml", process_links, page_data)
+    for label, (rewritten, links) in (("two", two_passes), ("single", single_pass)):
+        assert links == processed[1], f"bs4 {label} found other links"
+        assert hrefs(rewritten) == hrefs(processed[0]), f"bs4 {label} rewrote others"
+    print(f"{len(processed[1])} site links, every path found and rewrote the same")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else PARAGRAPHS)
@@ -0,0 +1,92 @@
+from sqlalchemy import select
+import random
+import tempfile
+import time
+import sys
+import os
+
+"""Bytes stored per article revision, full copies against reverse deltas."""
+
+"""Saves EDIT_COUNT edits of a long article through save_article(), each rewriting one
+paragraph, against a throwaway SQLite database.  Reports the bytes of the revision
+rows' text columns as full copies and as stored, and the time to reconstruct every
+version.  Run from the repository root:
+
+    python benchmarks/bench_revision_storage.py [EDIT_COUNT]
+"""
+
+EDIT_COUNT = 200
+PARAGRAPHS = 100
+
+build_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(build_dir, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import app, db
+from core import revisions
+from core.controllers import save_article
+from core.models import ArticleRevision
+
+
+def paragraph(number, edit):
+    return (
+        f"<p>Paragraph {number} edit {edit}. "
+        + "Lorem ipsum dolor sit. " * 30
+        + "</p>\n"
+    )
+
+
+def stored_bytes(row, columns):
+    size = sum(len((row[key] or "").encode()) for key in columns)
+    return size + len(row["_delta"] or b"")
+
+
+def main(count):
+    random.seed(0)
+    with app.test_request_context():
+        db.create_all()
+        import core.init_cms  # Content types and the root user
+
+        paragraphs = [paragraph(number, 0) for number in range(PARAGRAPHS)]
+        node_id = save_article(
+            {
+                "hidden_node_id": "",
+                "hidden_node_version": "",
+                "title": "Long article",
+                "body": "".join(paragraphs),
+            }
+        )["node"]._id
+        for edit in range(1, count + 1):
+            number = random.randrange(PARAGRAPHS)
+            paragraphs[number] = paragraph(number, edit)
+            save_article(
+                {
+                    "hidden_node_id": node_id,
+                    "hidden_node_version": edit,
+                    "title": "Long article",
+                    "body": "".join(paragraphs),
+                }
+            )
+
+        columns = revisions.delta_columns(ArticleRevision)
+        table = ArticleRevision.__table__
+        rows = [dict(row) for row in db.session.execute(select([table]))]
+        stored = sum(stored_bytes(row, columns) for row in rows)
+        full = sum(
+            stored_bytes(row, columns)
+            for row in revisions.expand(ArticleRevision, rows)
+        )
+        print(f"{len(rows)} revisions")
+        print(f"full copies {full / len(rows):9.0f} bytes/revision")
+        print(f"stored      {stored / len(rows):9.0f} bytes/revision")
+        print(f"{full / stored:.1f}x smaller")
+
+        start = time.perf_counter()
+        for version in range(1, count + 1):
+            revisions.reconstruct(node_id, version)
+        elapsed = time.perf_counter() - start
+        print(f"reconstruct {elapsed * 1000 / count:.2f} ms/version")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else EDIT_COUNT)
@@ -0,0 +1,68 @@
+from lxml.html.clean import clean_html
+import tempfile
+import time
+import sys
+import os
+
+"""Sanitization time of large article bodies, inline, pooled and cached."""
+
+"""Cleans BODY_COUNT distinct bodies of about BODY_SIZE characters, as pasted from the
+editor, with lxml's clean_html() one after the other, then with sanitize_many() in one
+batch through the pool and once more from the cache.  Run from the repository root:
+
+    python benchmarks/bench_sanitize.py [BODY_COUNT]
+"""
+
+BODY_COUNT = 8
+BODY_SIZE = 300 * 1024
+
+build_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(build_dir, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import app
+from core import sanitize
+
+
+def body(number):
+    paragraph = (
+        f'<p class="pasted" style="margin:0">Body {number} <b>bold</b> '
+        '<a href="https://example.com" onclick="track()">link</a> '
+        + "Lorem ipsum dolor sit amet. " * 20
+        + "</p>\n<script>track()</script>\n"
+    )
+    return paragraph * (BODY_SIZE // len(paragraph))
+
+
+def timed(label, count, function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed * 1000 / count:8.1f} ms/body")
+    return result
+
+
+def main(count):
+    records = [
+        {"title": f"Body {number}", "body": body(number)} for number in range(count)
+    ]
+    print(f"{count} bodies of {len(records[0]['body']) // 1024} KB")
+
+    inline = timed(
+        "clean_html()",
+        count,
+        lambda: [clean_html(record["body"]) for record in records],
+    )
+    sanitize._get_executor().submit(sanitize.clean, "html", "<p></p>").result()
+    pooled = timed(
+        f"pool of {app.config['SANITIZE_WORKERS']}",
+        count,
+        lambda: sanitize.sanitize_many("Article", records),
+    )
+    timed("cached", count, lambda: sanitize.sanitize_many("Article", records))
+    assert [record["body"] for record in pooled] == inline
+    print(sanitize.stats())
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else BODY_COUNT)
@@ -0,0 +1,85 @@
+from sqlalchemy import event
+import tempfile
+import time
+import sys
+import os
+
+"""Count the commits and queries of the save pipeline per saved article."""
+
+"""Creates and then updates SAVE_COUNT articles through save_article() against a
+throwaway SQLite database, so commits are real fsyncs.  Run from the repository root:
+
+    python benchmarks/bench_save_pipeline.py [SAVE_COUNT]
+"""
+
+SAVE_COUNT = 200
+
+build_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(build_dir, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import app, db
+from core.controllers import save_article
+
+counters = {"commits": 0, "queries": 0}
+
+
+def count_commit(connection):
+    counters["commits"] += 1
+
+
+def count_query(connection, cursor, statement, parameters, context, executemany):
+    counters["queries"] += 1
+
+
+def measure(label, count, function):
+    counters["commits"] = counters["queries"] = 0
+    start = time.perf_counter()
+    for number in range(count):
+        function(number)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<8} {count} saves: {counters['commits'] / count:5.1f} commits/save"
+        f" {counters['queries'] / count:6.1f} queries/save"
+        f" {elapsed * 1000 / count:7.2f} ms/save"
+    )
+
+
+def main(count):
+    with app.test_request_context():
+        db.create_all()
+        import core.init_cms  # Content types and the root user
+
+        event.listen(db.engine, "commit", count_commit)
+        event.listen(db.engine, "before_cursor_execute", count_query)
+
+        created = []
+
+        def create(number):
+            created.append(
+                save_article(
+                    {
+                        "hidden_node_id": "",
+                        "hidden_node_version": "",
+                        "title": f"Article {number}",
+                        "body": f"<p>Body of article {number}</p>",
+                    }
+                )["node"]._id
+            )
+
+        def update(number):
+            save_article(
+                {
+                    "hidden_node_id": created[number],
+                    "hidden_node_version": 1,
+                    "title": f"Article {number} updated",
+                    "body": f"<p>Updated body of article {number}</p>",
+                }
+            )
+
+        measure("create", count, create)
+        measure("update", count, update)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else SAVE_COUNT)
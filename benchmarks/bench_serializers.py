@@ -0,0 +1,110 @@
+from datetime import datetime
+import timeit
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.models import Node, Article, ContentType
+from core.controllers import dictify_content
+from core.serializers import stream_json
+
+"""Compare the compiled serializers against the type sniffing dictify_content."""
+
+"""Builds NODE_COUNT transient node/article/content type triples in memory, no database
+is touched.  Run from the repository root:
+
+    python benchmarks/bench_serializers.py [NODE_COUNT]
+"""
+
+NODE_COUNT = 10000
+REPEAT = 3
+
+
+def legacy_dictify_content(contents):
+    """dictify_content as it was before the compiled serializers"""
+    content_dict = {}
+    for content in contents:
+        content_dict[content.__tablename__] = {}
+        for attr, value in content.__dict__.items():
+            if not attr == "_sa_instance_state":
+                if "datetime" in str(type(value)):
+                    content_dict[content.__tablename__][attr] = str(value)
+                elif (
+                    "str" in str(type(value))
+                    and value.startswith("[")
+                    or "str" in str(type(value))
+                    and value.startswith("{")
+                ):
+                    content_dict[content.__tablename__][attr] = json.loads(value)
+                else:
+                    content_dict[content.__tablename__][attr] = value
+    return content_dict
+
+
+def build_contents(count):
+    now = datetime.utcnow()
+    content_type = ContentType(
+        _id=1,
+        _version=1,
+        _node_id=3,
+        _timestamp=now,
+        name="article",
+        content_class="Article",
+        editable_fields=json.dumps({"title": "input", "body": "textarea"}),
+        viewable_fields=json.dumps({"title": "h1", "body": "div"}),
+    )
+    contents = []
+    for number in range(1, count + 1):
+        node = Node(
+            _id=number,
+            _version=1,
+            _timestamp=now,
+            _hash="0" * 64,
+            _hash_chain="0" * 64,
+            user_id=1,
+            first_child=json.dumps({"content_type": "article", "id": number}),
+            content_id=number,
+            content_revision=1,
+            content_type_id=3,
+        )
+        article = Article(
+            _id=number,
+            _version=1,
+            _node_id=number,
+            _timestamp=now,
+            _hash="0" * 64,
+            _hash_chain="0" * 64,
+            title=f"Article {number}",
+            body="<p>" + "Lorem ipsum dolor sit amet. " * 40 + "</p>",
+        )
+        contents.append([node, article, content_type])
+    return contents
+
+
+def main(count):
+    contents = build_contents(count)
+
+    def run_legacy():
+        return [legacy_dictify_content(content) for content in contents]
+
+    def run_compiled():
+        return [dictify_content(content) for content in contents]
+
+    def run_streamed():
+        return "".join(stream_json(contents, encode=dictify_content))
+
+    assert run_legacy() == run_compiled(), "Serializers disagree with dictify_content"
+
+    for label, function in (
+        ("legacy dictify_content", run_legacy),
+        ("compiled serializers", run_compiled),
+        ("compiled + stream_json", run_streamed),
+    ):
+        best = min(timeit.repeat(function, number=1, repeat=REPEAT))
+        print(f"{label:<24} {count} nodes: {best * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else NODE_COUNT)
@@ -0,0 +1,116 @@
+import subprocess
+import tempfile
+import requests
+import time
+import sys
+import os
+
+"""Page rendering time of a static site build by worker count and over HTTP."""
+
+"""Saves ARTICLE_COUNT articles to a throwaway SQLite database and renders the pages
+of a site build with render_pages() for each of JOB_COUNTS worker processes, then once
+fetched over HTTP from a development server on BENCH_PORT as the builder did before.
+Checks every build wrote the same pages.  Run from the repository root:
+
+    python benchmarks/bench_static_build.py [ARTICLE_COUNT]
+"""
+
+ARTICLE_COUNT = 200
+JOB_COUNTS = (1, 2, 4)
+BENCH_PORT = 5077
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+build_dir = tempfile.mkdtemp()
+# Spawned build workers run this module again, they keep the parent's database
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(build_dir, 'bench.db')}"
+)
+sys.path.insert(0, root_dir)
+
+from core import app, db
+from core import builders
+from core.controllers import save_article
+
+
+def http_capture(uri="", client=None):
+    """The builder's former capture_page(), a GET to the running server"""
+    return requests.get(f"http://localhost:{BENCH_PORT}{uri}").text
+
+
+def start_server():
+    server = subprocess.Popen(
+        [sys.executable, "-m", "flask", "run", "--port", str(BENCH_PORT)],
+        cwd=root_dir,
+        env=dict(os.environ, FLASK_APP="ochyro.py"),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    for attempt in range(150):
+        try:
+            requests.get(f"http://localhost:{BENCH_PORT}/index")
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("The development server did not start")
+
+
+def read_pages(directory):
+    pages = {}
+    for path, dirs, files in os.walk(directory):
+        for name in files:
+            file_name = os.path.join(path, name)
+            with open(file_name) as page:
+                pages[os.path.relpath(file_name, directory)] = page.read()
+    return pages
+
+
+def timed(label, directory, jobs):
+    start = time.perf_counter()
+    workers, pages = builders.render_pages(directory, jobs)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {len(pages)} pages {len(pages) / elapsed:8.1f} pages/s")
+    for worker in workers:
+        rate = worker["pages"] / worker["seconds"]
+        print(f"    worker {worker['worker']} {rate:.1f} pages/s")
+    return read_pages(directory)
+
+
+def main(count):
+    with app.test_request_context():
+        db.create_all()
+        import core.init_cms  # Content types and the root user
+
+        for number in range(count):
+            save_article(
+                {
+                    "hidden_node_id": "",
+                    "hidden_node_version": "",
+                    "title": f"Article {number}",
+                    "body": f"<p>Body of article {number}.</p>",
+                }
+            )
+    db.session.remove()
+
+    with app.app_context():
+        builds = {}
+        for jobs in JOB_COUNTS:
+            directory = os.path.join(build_dir, f"jobs-{jobs}")
+            builds[jobs] = timed(f"{jobs} jobs", directory, jobs)
+
+        server = start_server()
+        capture_page = builders.capture_page
+        builders.capture_page = http_capture
+        try:
+            crawled = timed("http crawl", os.path.join(build_dir, "http"), 1)
+        finally:
+            builders.capture_page = capture_page
+            server.terminate()
+
+    for jobs, pages in builds.items():
+        assert pages == crawled, f"The pages of {jobs} jobs differ from the crawl"
+    print("Every build wrote the same pages")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ARTICLE_COUNT)
@@ -1,4 +1,5 @@
 import os 
+import tempfile
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -11,3 +12,63 @@ class Config(object):
     OPEN_REGISTRATION = True
 
     FREEZER_DEFAULT_MIMETYPE = "text/html"
+
+    # Graph traversals stop at this depth so cycles in the content graph terminate
+    GRAPH_MAX_DEPTH = 64
+
+    # Read through cache of loaded content, entries are per process
+    CONTENT_CACHE_SIZE = int(os.environ.get("CONTENT_CACHE_SIZE") or 1024)
+    CONTENT_CACHE_TTL = 60  # Seconds
+
+    # Keyset paginated listings
+    FRONT_PAGE_SIZE = 20
+    ARTICLE_LIST_PAGE_SIZE = 100
+
+    # Server side paging of the content control table
+    CONTENT_CONTROL_PAGE_SIZE = 50
+    CONTENT_CONTROL_MAX_PAGE_SIZE = 500
+    CONTENT_CONTROL_BODY_PREVIEW = 200  # Characters of body sent per row
+
+    # Headless JSON API, only these content types are served
+    API_CONTENT_TYPES = ["Article Content Type"]
+    API_PAGE_SIZE = 20
+    API_MAX_BATCH_SIZE = 100
+    API_CACHE_MAX_AGE = 0  # Seconds, clients and CDNs revalidate with the ETag
+
+    # Rows per transaction of "flask ochyro import"
+    IMPORT_BATCH_SIZE = 1000
+
+    # Row hashing, digests of other algorithms than sha256 are prefixed with the name
+    HASH_ALGORITHM = os.environ.get("HASH_ALGORITHM") or "sha256"
+
+    # "flask ochyro verify", rows per chunk of work and the incremental checkpoint
+    VERIFY_CHUNK_SIZE = 10000
+    VERIFY_CHECKPOINT = os.environ.get("VERIFY_CHECKPOINT") or os.path.join(
+        tempfile.gettempdir(), "ochyro-verify-checkpoint.json"
+    )
+
+    # Site Merkle trees, content of these types belongs to every site, node ids must
+    # stay below MERKLE_FANOUT ** MERKLE_DEPTH
+    SITE_CONTENT_TYPES = ["Article Content Type"]
+    MERKLE_FANOUT = 64
+    MERKLE_DEPTH = 5
+    MERKLE_MAX_DESCENT = 100  # Changed subtrees looked up by range before a full scan
+
+    # Revisions between these full snapshots are stored as deltas, see core.revisions
+    REVISION_SNAPSHOT_INTERVAL = 10
+
+    # Background jobs, site builds run in this many threads per process
+    JOB_WORKERS = 2
+    JOB_PROGRESS_INTERVAL = 1  # Seconds between progress commits
+    JOB_STALE_AFTER = 600  # Seconds without progress before a job counts as abandoned
+
+    # Static site builds, see core.builders.render_pages
+    BUILD_JOBS = None  # Worker processes of builds run as jobs, None for every CPU
+    BUILD_SHARD_SIZE = 100  # Pages rendered per task of a worker
+    BUILD_MAX_DEPTH = None  # Links followed from the index, None for no limit
+    BUILD_MAX_PAGES = None  # Pages per build, None for no limit
+
+    # HTML sanitization of saved fields, see core.sanitize
+    SANITIZE_CACHE_SIZE = 256  # Sanitized values cached per process
+    SANITIZE_POOL_THRESHOLD = 64 * 1024  # Characters, larger values go to the pool
+    SANITIZE_WORKERS = int(os.environ.get("SANITIZE_WORKERS") or 2)  # 0 for no pool
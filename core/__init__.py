@@ -36,4 +36,4 @@ if not app.debug:
     app.logger.setLevel(logging.INFO)
     app.logger.info("Ochyro startup")
 
-from core import routes, models
+from core import routes, models, api, cli
@@ -0,0 +1,254 @@
+from flask import request, jsonify, Response, url_for, stream_with_context
+from sqlalchemy.orm import Load
+from core import app
+from core import registry
+from core.controllers import (
+    ALWAYS_LOADED_FIELDS,
+    load_many,
+    query_content_of_type,
+    keyset_page,
+    list_revisions,
+    load_revision,
+)
+from core.serializers import serializer_for, viewable_serializer, stream_json
+import hashlib
+import logging
+
+"""Read only JSON API for headless clients."""
+
+"""Every response carries an ETag derived from the _hash_chain columns of the nodes and
+content rows it is built from.  Those are loaded first with the content bodies
+deferred, so a matching If-None-Match is answered with a 304 before any body is read.
+Only content types listed in API_CONTENT_TYPES are served and only their viewable
+fields are serialized.
+"""
+
+# Node columns included with every piece of content
+API_NODE_FIELDS = [
+    "_id",
+    "_version",
+    "_timestamp",
+    "_hash",
+    "_hash_chain",
+    "content_type_id",
+]
+
+
+def _served_type(content_type_id):
+    """The registry entry of a content type the API serves or None"""
+    registered_type = registry.get_by_node_id(content_type_id)
+    if (
+        registered_type
+        and registered_type["type"].name in app.config["API_CONTENT_TYPES"]
+    ):
+        return registered_type
+    return None
+
+
+def _served(contents):
+    """Filter content dicts to the content types the API serves"""
+    served = []
+    for content in contents:
+        node = content["node"]
+        registered_type = _served_type(node.content_type_id)
+        # Content type nodes are the type definitions themselves, never served
+        if registered_type and node._id != registered_type["type"]._node_id:
+            served.append(content)
+    return served
+
+
+def _etag(contents):
+    """A digest of the hash chains of every node and content row in a response"""
+    digest = hashlib.sha256()
+    for content in contents:
+        digest.update(
+            f"{content['node']._hash_chain}:{content['content']._hash_chain};".encode()
+        )
+    return digest.hexdigest()
+
+
+def _cache_headers(response, etag):
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config["API_CACHE_MAX_AGE"]
+    response.cache_control.must_revalidate = True
+    return response
+
+
+def _not_modified(etag):
+    """The 304 response if the client already holds this ETag, otherwise None"""
+    if request.if_none_match.contains(etag):
+        return _cache_headers(Response(status=304), etag)
+    return None
+
+
+def _api_error(message, status):
+    response = jsonify({"error": message})
+    response.status_code = status
+    return response
+
+
+def serialize_api_content(content):
+    """Serialize a content dict with its node metadata and viewable fields only"""
+    registered_type = _served_type(content["node"].content_type_id)
+    return {
+        "node": serializer_for(type(content["node"]), API_NODE_FIELDS)(content["node"]),
+        "content": viewable_serializer(registered_type, ALWAYS_LOADED_FIELDS)(
+            content["content"]
+        ),
+        "type": registered_type["type"].name,
+    }
+
+
+def _json_list(contents):
+    # Streamed after the view returns, the request and app context are kept for it
+    return Response(
+        stream_with_context(stream_json(contents, encode=serialize_api_content)),
+        mimetype="application/json",
+    )
+
+
+def _page_size():
+    try:
+        page_size = int(request.args.get("limit", app.config["API_PAGE_SIZE"]))
+    except ValueError:
+        page_size = app.config["API_PAGE_SIZE"]
+    return max(1, min(page_size, app.config["API_MAX_BATCH_SIZE"]))
+
+
+def _parse_ids(ids):
+    """Node ids from a comma separated list, None if any of them is not an integer"""
+    try:
+        return [int(node_id) for node_id in ids.split(",") if node_id.strip()]
+    except ValueError:
+        logging.error(
+            f"Security Warning: api ids={ids} failed to convert input to integers!"
+        )
+        return None
+
+
+@app.route("/api/nodes/<int:node_id>", methods=["GET"])
+def api_node(node_id):
+    """A single piece of content"""
+    # Hashes only, bodies are deferred unless the content cache already holds them
+    contents = _served(load_many([node_id], fields=[]))
+    if not contents:
+        return _api_error(f"Node {node_id} not found", 404)
+
+    etag = _etag(contents)
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+
+    content = _served(load_many([node_id]))[0]
+    return _cache_headers(jsonify(serialize_api_content(content)), etag)
+
+
+@app.route("/api/nodes", methods=["GET"])
+def api_nodes():
+    """A batch of content by node ids, in the order given, unknown ids are left out"""
+    node_ids = _parse_ids(request.args.get("ids", ""))
+    if node_ids is None:
+        return _api_error("ids must be a comma separated list of integers", 400)
+    if len(node_ids) > app.config["API_MAX_BATCH_SIZE"]:
+        return _api_error(
+            f"At most {app.config['API_MAX_BATCH_SIZE']} ids per request", 400
+        )
+
+    contents = _served(load_many(node_ids, fields=[]))
+    etag = _etag(contents)
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+
+    contents = _served(load_many([content["node"]._id for content in contents]))
+    return _cache_headers(_json_list(contents), etag)
+
+
+@app.route("/api/types/<name>/nodes", methods=["GET"])
+def api_type_nodes(name):
+    """The content of one type newest first, paged with the "before" cursor"""
+
+    """The cursor of the next page is sent in a Link header with rel="next", it is
+    absent on the last page.
+    """
+    registered_type = registry.get_by_name(name)
+    if not registered_type or name not in app.config["API_CONTENT_TYPES"]:
+        return _api_error(f"Content type '{name}' not found", 404)
+
+    page_size = _page_size()
+    ContentClass = registered_type["content_class"]
+    query = query_content_of_type(name).options(
+        Load(ContentClass).load_only(*ALWAYS_LOADED_FIELDS)
+    )
+    rows, next_cursor = keyset_page(
+        query, ContentClass, request.args.get("before"), page_size
+    )
+    contents = [{"node": node, "content": content} for node, content in rows]
+
+    etag = _etag(contents)
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+
+    contents = load_many([content["node"]._id for content in contents])
+    response = _json_list(contents)
+    if next_cursor:
+        next_url = url_for(
+            "api_type_nodes", name=name, before=next_cursor, limit=page_size
+        )
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return _cache_headers(response, etag)
+
+
+@app.route("/api/nodes/<int:node_id>/revisions", methods=["GET"])
+def api_node_revisions(node_id):
+    """The versions of a piece of content newest first, paged by the "before" cursor"""
+
+    """Each version is listed with its _version, _timestamp and hashes, the cursor of
+    the next page is sent in a Link header with rel="next".
+    """
+    if not _served(load_many([node_id], fields=[])):
+        return _api_error(f"Node {node_id} not found", 404)
+
+    page_size = _page_size()
+    page = list_revisions(node_id, request.args.get("before"), page_size)
+    if page is None:
+        return _api_error("before must be an integer version", 400)
+    versions, next_cursor = page
+
+    digest = hashlib.sha256()
+    for version in versions:
+        digest.update(f"{version['_version']}:{version['_hash_chain']};".encode())
+    etag = digest.hexdigest()
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+
+    for version in versions:
+        version["_timestamp"] = str(version["_timestamp"])
+    response = jsonify(versions)
+    if next_cursor:
+        next_url = url_for(
+            "api_node_revisions", node_id=node_id, before=next_cursor, limit=page_size
+        )
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return _cache_headers(response, etag)
+
+
+@app.route("/api/nodes/<int:node_id>/revisions/<int:version>", methods=["GET"])
+def api_node_revision(node_id, version):
+    """One version of a piece of content, the current one or a revision"""
+    if not _served(load_many([node_id], fields=[])):
+        return _api_error(f"Node {node_id} not found", 404)
+
+    content = load_revision(node_id, version)
+    if not content:
+        return _api_error(f"Version {version} of node {node_id} not found", 404)
+
+    # A version never changes once it is saved, its own hash chain identifies it
+    etag = content["content"]._hash_chain or f"{node_id}:{version}"
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+    return _cache_headers(jsonify(serialize_api_content(content)), etag)
@@ -1,11 +1,19 @@
 import os
-import sys
-import requests
+import time
 import shutil
-from bs4 import BeautifulSoup
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+import lxml.html
 import logging
 import traceback
-from pprint import pprint
+from core import app, db
+from core import registry
+from core import merkle
+from core import manifest
+from core import cache as content_cache
+from core.controllers import _unit_of_work, query_content_of_type
+from core.models import Node, Site
 
 # For SO snippet
 import errno
@@ -34,136 +42,341 @@ def safe_open_w(path):
 # End Stack Overflow snippet
 
 
-def capture_page(domain="http://localhost:5000", uri=""):
-    """Simple GET or fail wrapper"""
+def static_path(uri):
+    """Map a site URI to the path of its static page, without the .html extension"""
+
+    """Query strings such as the "?before=<cursor>" of paged listings can't be served
+    from static files, so they are folded into the file name.
+    """
+    path, _, query = uri.partition("?")
+    if path in ("", "/"):
+        path = "/index"
+    if query:
+        parts = [part.replace("=", "-") for part in query.split("&") if part]
+        path = "-".join([path] + parts)
+    return path
+
+
+class BuildError(Exception):
+    """A page of a static site could not be rendered"""
+
+
+def capture_page(uri="", client=None):
+    """Render a page in process through the app's routes, as a visitor gets it"""
+
+    """Pages are requested with the Flask test client, no server has to be listening
+    and no HTTP round trip is made.  A client is shared by the pages of one build,
+    redirects are followed as a browser would.  A server error raises BuildError.
+    """
+    if client is None:
+        client = app.test_client()
+    response = client.get(uri or "/", follow_redirects=True)
+    if response.status_code >= 500:
+        raise BuildError(f"GET {uri or '/'} returned {response.status_code}")
+    return response.get_data(as_text=True)
+
+
+def content_uris():
+    """The view URIs of the content every site publishes, from the content graph"""
+    uris = []
+    for content_type_name in app.config["SITE_CONTENT_TYPES"]:
+        registered_type = registry.get_by_name(content_type_name)
+        if registered_type:
+            view_url = registered_type["type"].view_url
+            uris.extend(
+                f"{view_url}/{node_id}"
+                for (node_id,) in query_content_of_type(content_type_name)
+                .with_entities(Node._id)
+                .order_by(Node._id)
+            )
+    return uris
+
+
+def process_links(page_data):
+    """Point the site links of a page at the static pages, parsing the page once"""
+
+    """The page is parsed by lxml, the href of every <a> is read and rewritten in the
+    same walk of the tree.  Returns the rewritten page and the site links found on it,
+    in order, without the index.
+    """
+    if not page_data.strip():
+        return page_data, []
+    links = {}  # Ordered and a constant time membership test
+    document = lxml.html.document_fromstring(page_data)
+    for link in document.iter("a"):
+        link_href = link.get("href") or ""
+        if not link_href.startswith("/") or link_href == "/":
+            continue
+        if link_href != "/index":
+            links[link_href] = True
+        link.set("href", f"{static_path(link_href)}.html")
+    page_data = lxml.html.tostring(
+        document, encoding="unicode", doctype=document.getroottree().docinfo.doctype
+    )
+    return page_data, list(links)
+
+
+_worker_client = None
+
+
+def _init_worker():
+    """Give a pool worker its own database connections, app context and client"""
+    global _worker_client
+
+    # No connection of the parent process is ever used by a worker
+    db.engine.dispose()
+    app.app_context().push()
+    _worker_client = app.test_client()
+
+
+def _write_page(path, page_content):
+    """Write a page to a new file, so a hard linked copy of the last build is kept"""
+    mkdir_p(os.path.dirname(path))
+    with open(f"{path}.tmp", "w") as file:
+        file.write(page_content)
+    os.replace(f"{path}.tmp", path)
+
+
+def render_shard(uris, build_dir):
+    """Render a shard of pages and write them into the build directory"""
+
+    """Runs in a pool worker, or inline for a single job.  Returns the worker's process
+    id, the seconds taken and for each page its file, the site links found on it and
+    the sources it was rendered from, see core.manifest.
+    """
+    client = _worker_client or app.test_client()
+    start = time.perf_counter()
+    pages = {}
+    for uri in uris:
+        with manifest.recording() as sources:
+            page_content = capture_page(uri, client)
+        page_content, links = process_links(page_content)
+        page_file_name = f"{static_path(uri)}.html"
+        _write_page(f"{build_dir}{page_file_name}", page_content)
+        pages[uri] = {
+            "file": page_file_name,
+            "links": links,
+            "sources": sorted(sources),
+        }
+    return {
+        "worker": os.getpid(),
+        "seconds": time.perf_counter() - start,
+        "pages": pages,
+    }
+
+
+def _run_inline(function, *args):
+    future = Future()
     try:
-        url = f"{domain}{uri}"
-        r = requests.get(url)
-        return r.text
+        future.set_result(function(*args))
     except Exception as e:
-        logging.error(traceback.format_exc())
-        sys.exit(1)
-
-
-def find_links(page_data):
-    """Find all <a> tag href values"""
-    links = []
-    soup = BeautifulSoup(page_data, "html.parser")
-    for link in soup.find_all("a"):
-        link_href = link.get("href")
-        if (
-            link_href.startswith("/")
-            and link_href != "/index"
-            and link_href != "/"
-            and link_href not in links
-        ):
-            links.append(link_href)
-
-    if links:
-        return links
-    else:
-        return False
-
-
-def find_and_crawl(pages, links):
-    start_state = len(pages)
-    new_pages = {}
-    for page, data in pages.items():
-        found_links = find_links(data["page_content"])
-        if found_links:
-            for new_link in found_links:
-                if new_link not in links:
-                    links.append(new_link)
-                    new_pages[new_link] = {
-                        "page_file_name": f"{new_link}.html",
-                        "page_content": capture_page(
-                            uri=new_link
-                        ),  # Again need to add base here
-                    }
-    updated_pages = {**pages, **new_pages}
-
-    stop_state = len(updated_pages)
-    if stop_state != start_state:
-        return find_and_crawl(updated_pages, links)
-    else:  # Exit condition
-        return updated_pages
-
-
-def spider_pages(index_url):
-    """Set the base condition for the recursive crawl"""
-    links = []
-    # collect index
-    if index_url:
-        pages = {
-            index_url: {
-                "page_file_name": "/index.html",
-                "page_content": capture_page(uri=index_url),
-            }
-        }
-    else:  # Assume the front page is the index
-        pages = {
-            "_index_": {
-                "page_file_name": "/index.html",
-                "page_content": capture_page(uri=index_url),
-            }
-        }
+        future.set_exception(e)
+    return future
+
 
-    returned_pages = find_and_crawl(pages=pages, links=links)
+def render_pages(
+    build_dir, jobs=None, progress=None, previous=None, signatures=None
+):
+    """Render the pages of the site into build_dir, returns the workers and pages"""
+
+    """The index and the content of the site, enumerated from the content graph, are
+    split into shards of at most BUILD_SHARD_SIZE pages rendered by a pool of "jobs"
+    worker processes, the number of CPUs when None.  The pages they link to that were
+    not rendered yet become the next shards.  The first error raised by a shard stops
+    the build, the shards not started are cancelled.  "progress" is called with the
+    pages done and found so far.
+
+    The crawl is breadth first from the index at depth 0, the content at depth 1.
+    Links deeper than BUILD_MAX_DEPTH or beyond BUILD_MAX_PAGES pages are not
+    followed, when those are set.
+
+    Pages of the "previous" manifest whose sources still have their recorded
+    "signatures" are not rendered again, their file in build_dir is kept and their
+    stored links are followed.  Returns the stats of each worker and the manifest
+    entry of every page of the site.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    max_depth = app.config["BUILD_MAX_DEPTH"]
+    max_pages = app.config["BUILD_MAX_PAGES"]
+    frontier = deque()
+    seen = {}  # uri -> depth
+    not_followed = {"depth": 0, "pages": 0}
+    pages = {}
 
-    return returned_pages
+    def discover(uri, depth):
+        if uri in seen:
+            return
+        if max_depth is not None and depth > max_depth:
+            not_followed["depth"] += 1
+        elif max_pages is not None and len(seen) >= max_pages:
+            not_followed["pages"] += 1
+        else:
+            seen[uri] = depth
+            frontier.append(uri)
+
+    def follow(uri, page):
+        for link in page["links"]:
+            discover(link, seen[uri] + 1)
+
+    def next_shard():
+        shard = []
+        while frontier and len(shard) < shard_size:
+            uri = frontier.popleft()
+            if manifest.is_current(previous, signatures, uri):
+                pages[uri] = previous["pages"][uri]
+                follow(uri, pages[uri])
+            else:
+                shard.append(uri)
+        return shard
+
+    discover("/", 0)
+    for uri in content_uris():
+        discover(uri, 1)
+    shard_size = max(1, min(app.config["BUILD_SHARD_SIZE"], -(-len(frontier) // jobs)))
+
+    if jobs == 1:
+        executor = None
+        submit = _run_inline
+    else:
+        db.session.commit()  # The workers read what is committed
+        # Builds run on a thread of the web process, fresh interpreters don't inherit
+        # its locks or connections the way forked children would
+        executor = ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        submit = executor.submit
+    workers = {}
+    pending = set()
+    try:
+        while frontier or pending:
+            # Two shards per worker keep them busy while results are collected
+            while frontier and len(pending) < 2 * jobs:
+                shard = next_shard()
+                if shard:
+                    pending.add(submit(render_shard, shard, build_dir))
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()  # The first error of a shard stops the build
+                worker = workers.setdefault(
+                    result["worker"],
+                    {"worker": result["worker"], "pages": 0, "seconds": 0},
+                )
+                worker["pages"] += len(result["pages"])
+                worker["seconds"] += result["seconds"]
+                for uri, page in result["pages"].items():
+                    pages[uri] = page
+                    follow(uri, page)
+            if progress:
+                progress(len(pages), len(seen))
+    finally:
+        for future in pending:
+            future.cancel()
+        if executor:
+            executor.shutdown()
+    if not_followed["depth"] or not_followed["pages"]:
+        logging.warning(
+            f"Site build links not followed: {not_followed['depth']} deeper than"
+            f" BUILD_MAX_DEPTH, {not_followed['pages']} beyond BUILD_MAX_PAGES"
+        )
+    return list(workers.values()), pages
 
 
-def htmlify_links(page_data):
-    soup = BeautifulSoup(page_data, "html.parser")
-    for link in soup.find_all("a"):
-        if link["href"].startswith("/") and link["href"] != "/":
-            # So convoluted, I kind of like it
-            link["href"] = link["href"].replace(link["href"], f'{link["href"]}.html')
-    return str(soup)
+def _throughput(workers, pages, removed, elapsed):
+    rendered = sum(worker["pages"] for worker in workers)
+    report = [
+        f"{rendered} pages rendered, {len(pages) - rendered} unchanged,"
+        f" {removed} removed in {elapsed:.1f}s"
+    ]
+    for worker in workers:
+        rate = worker["pages"] / worker["seconds"] if worker["seconds"] else 0
+        report.append(f"worker {worker['worker']} {worker['pages']} at {rate:.0f}/s")
+    return ", ".join(report)
 
 
-def build_static_site(data):
+def build_static_site(data, site_node_id=None, progress=None, jobs=None):
     """Build a static site"""
 
-    index_page = ""
-    pages_to_build = spider_pages(index_page)
-
-    if pages_to_build:
-        # Change a links to point to html pages
-        for key, value in pages_to_build.items():
-            pages_to_build[key]["page_content"] = htmlify_links(value["page_content"])
-
-        # validate the build dir exists wipe it and rebuild at this endpoint
-        if data["local_build_dir"] and os.path.isdir(data["local_build_dir"]):
-            try:
-                shutil.rmtree(data["local_build_dir"])
-            except Exception as e:
-                logging.error("There has been a problem removing the old site build.")
-                logging.error(traceback.format_exc())
-                return "Build Failed"
-
-        # Create new build directory
-        try:
-            os.makedirs(data["local_build_dir"])
-        except Exception as e:
-            logging.error(traceback.format_exc())
-            return "Build Failed"
-
-        # Copy over the static files directory
-        try:
-            shutil.copytree(
-                data["static_files_dir"], f"{data['local_build_dir']}/static"
-            )
-        except Exception as e:
-            logging.error(traceback.format_exc())
-            return "Build Failed"
-
-        # Loop through the pages dict and create each page in the correct build dir
-        for key, page in pages_to_build.items():
-            # print(f"{data['local_build_dir']}{page['page_file_name']}")
-            with safe_open_w(
-                f"{data['local_build_dir']}{page['page_file_name']}"
-            ) as file:
-                file.write(page["page_content"])
-
-    return "Site build received"
+    """With the site's node id the build is skipped when the Merkle root of the site's
+    content matches the root published by the last build, see core.merkle, and that
+    build is still in place with its manifest and the same templates and static files.
+    Builds run as background jobs, see core.jobs, "progress" is called with the stage,
+    the pages done and the pages in total.  Pages are rendered by "jobs" worker
+    processes, see render_pages(), into a staging directory that replaces the build
+    directory once every page is written, a failed build leaves the last one in place.
+    Only the pages whose sources changed since the last build are rendered, see
+    core.manifest.
+    """
+    build_dir = data["local_build_dir"].rstrip("/")
+    try:
+        inputs = manifest.inputs_digest(data["static_files_dir"])
+    except Exception:
+        logging.error(traceback.format_exc())
+        return "Build Failed"
+    previous = manifest.load(build_dir)  # None when the last build is gone
+    if previous and previous["inputs"] != inputs:
+        previous = None  # Templates or static files changed, render every page
+    site = None
+    changed_nodes = []
+    if site_node_id:
+        site = Site.query.filter_by(_node_id=int(site_node_id)).first()
+    if site:
+        if previous and merkle.is_published(site):
+            return "Site unchanged since the last build"
+        changed_nodes = merkle.changed_nodes(site)
+
+    staging_dir = f"{build_dir}.building"
+    render_progress = (
+        (lambda done, total: progress("rendering", done, total)) if progress else None
+    )
+
+    start = time.perf_counter()
+    try:
+        signatures = manifest.snapshot()
+
+        # Wipe any staging left by an interrupted build, then stage the last build as
+        # hard links, or the static files when every page is rendered
+        if os.path.isdir(staging_dir):
+            shutil.rmtree(staging_dir)
+        if previous:
+            shutil.copytree(build_dir, staging_dir, copy_function=os.link)
+        else:
+            shutil.copytree(data["static_files_dir"], f"{staging_dir}/static")
+        workers, pages = render_pages(
+            staging_dir, jobs, render_progress, previous, signatures
+        )
+
+        # Outputs of pages no longer linked from the site
+        removed = 0
+        if previous:
+            page_files = {page["file"] for page in pages.values()}
+            for page in previous["pages"].values():
+                page_file = f"{staging_dir}{page['file']}"
+                if page["file"] not in page_files and os.path.exists(page_file):
+                    os.remove(page_file)
+                    removed += 1
+    except Exception:
+        logging.error(traceback.format_exc())
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        return "Build Failed"
+
+    # Swap the new build in for the old
+    try:
+        if os.path.isdir(build_dir):
+            shutil.rmtree(build_dir)
+        os.rename(staging_dir, build_dir)
+        manifest.save(build_dir, inputs, signatures, pages)
+    except Exception:
+        logging.error("There has been a problem replacing the old site build.")
+        logging.error(traceback.format_exc())
+        return "Build Failed"
+    throughput = _throughput(workers, pages, removed, time.perf_counter() - start)
+    logging.info(f"Site build of {build_dir}: {throughput}")
+
+    if site:
+        with _unit_of_work():
+            merkle.publish(site)
+        content_cache.evict(site_node_id)
+        return f"Site build received, {len(changed_nodes)} changed nodes, {throughput}"
+    return f"Site build received, {throughput}"
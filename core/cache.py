@@ -0,0 +1,146 @@
+from collections import OrderedDict
+from core import app, db
+from core import manifest
+import threading
+import time
+
+"""Bounded LRU read through cache of assembled content dicts."""
+
+"""Entries are keyed by (node_id, _version) of the content row and an index from node id
+to the cached version finds them.  Cached dicts hold detached copies of the node and
+content rows so they can be shared between requests.  Every hit is validated against
+the _version and _hash of the stored content row, looked up by the indexed _node_id
+instead of loading the node, content and type, so content saved by another process is
+never served from here.  get_many() validates its hits with one query per class.
+
+The cache lives in each process, the save_* controllers evict the nodes they write and
+entries expire after CONTENT_CACHE_TTL seconds.  Set CONTENT_CACHE_SIZE to 0 to disable
+caching.
+"""
+
+_cache_lock = threading.Lock()
+_entries = OrderedDict()  # (node_id, version) -> {"content", "hash", "expires"}
+_versions = {}  # node_id -> cached version
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _detached_copy(row):
+    """A transient copy of a database row with every column value loaded"""
+    copied_row = type(row)()
+    for column in row.__table__.columns:
+        setattr(copied_row, column.key, getattr(row, column.key))
+    return copied_row
+
+
+def _drop(node_id):
+    version = _versions.pop(node_id, None)
+    if version is not None:
+        _entries.pop((node_id, version), None)
+        _stats["evictions"] += 1
+
+
+def _drop_stale(node_id, version):
+    """Drop an entry found stale, unless it was replaced meanwhile"""
+    with _cache_lock:
+        if _versions.get(node_id) == version:
+            _drop(node_id)
+        _stats["misses"] += 1
+
+
+def get_many(node_ids):
+    """Return the cached content dicts of some node ids, by node id"""
+
+    """The hits are validated together, one query per content class reads the _version
+    and _hash of their stored rows.
+    """
+    hits = {}  # node_id -> (version, entry)
+    now = time.monotonic()
+    with _cache_lock:
+        for node_id in node_ids:
+            version = _versions.get(node_id)
+            entry = _entries.get((node_id, version)) if version is not None else None
+            if entry is None or entry["expires"] < now:
+                if entry is not None:
+                    _drop(node_id)
+                _stats["misses"] += 1
+                continue
+            hits[node_id] = (version, entry)
+
+    node_ids_by_class = {}
+    for node_id, (version, entry) in hits.items():
+        ContentClass = type(entry["content"]["content"])
+        node_ids_by_class.setdefault(ContentClass, []).append(node_id)
+    stored = {}
+    for ContentClass, class_node_ids in node_ids_by_class.items():
+        for node_id, version, content_hash in db.session.query(
+            ContentClass._node_id, ContentClass._version, ContentClass._hash
+        ).filter(ContentClass._node_id.in_(class_node_ids)):
+            stored[node_id] = (version, content_hash)
+
+    contents = {}
+    for node_id, (version, entry) in hits.items():
+        if stored.get(node_id) != (version, entry["hash"]):
+            _drop_stale(node_id, version)
+            continue
+        with _cache_lock:
+            if (node_id, version) in _entries:
+                _entries.move_to_end((node_id, version))
+            _stats["hits"] += 1
+        manifest.record_node(node_id)  # A build depends on it as if read from the db
+        contents[node_id] = entry["content"]
+    return contents
+
+
+def get(node_id):
+    """Return the cached content dict for a node id or None"""
+    return get_many([node_id]).get(node_id)
+
+
+def put(content):
+    """Cache a complete content dict, content without a _hash is never cached"""
+    max_size = app.config["CONTENT_CACHE_SIZE"]
+    if not max_size or not content or not content["content"]._hash:
+        return
+
+    node_id = content["node"]._id
+    version = content["content"]._version
+    cached_content = {
+        "node": _detached_copy(content["node"]),
+        "content": _detached_copy(content["content"]),
+        "type": content["type"],  # Registry rows are already detached
+    }
+    with _cache_lock:
+        _drop(node_id)
+        _entries[(node_id, version)] = {
+            "content": cached_content,
+            "hash": cached_content["content"]._hash,
+            "expires": time.monotonic() + app.config["CONTENT_CACHE_TTL"],
+        }
+        _versions[node_id] = version
+        while len(_entries) > max_size:
+            (evicted_node_id, evicted_version), entry = _entries.popitem(last=False)
+            if _versions.get(evicted_node_id) == evicted_version:
+                del _versions[evicted_node_id]
+            _stats["evictions"] += 1
+
+
+def evict(node_id):
+    """Drop a node from the cache, called by the write paths"""
+    try:
+        safe_node_id = int(node_id)  # Typecast as a security measure
+    except (ValueError, TypeError):
+        return
+    with _cache_lock:
+        _drop(safe_node_id)
+
+
+def clear():
+    with _cache_lock:
+        _entries.clear()
+        _versions.clear()
+
+
+def stats():
+    """Hit, miss and eviction counters plus the current size"""
+    with _cache_lock:
+        return dict(_stats, size=len(_entries), max_size=app.config["CONTENT_CACHE_SIZE"])
@@ -0,0 +1,147 @@
+from flask.cli import AppGroup
+from core import app
+from core import importer
+from core import verify
+from core import builders
+from core.models import User, Site
+import click
+import json
+import time
+
+"""Command line tools, run as "flask ochyro <command>"."""
+
+ochyro_cli = AppGroup("ochyro", help="Ochyro content management commands.")
+
+
+@ochyro_cli.command("import")
+@click.argument("input_file", type=click.File("r", encoding="utf-8"))
+@click.option(
+    "--format",
+    "input_format",
+    type=click.Choice(["jsonl", "csv"]),
+    help="Input format, guessed from the file extension when not given.",
+)
+@click.option(
+    "--type",
+    "content_type_name",
+    default="Article Content Type",
+    show_default=True,
+    help="Name of the content type the records are imported as.",
+)
+@click.option(
+    "--username",
+    default="root",
+    show_default=True,
+    help="User the imported nodes belong to.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(1),
+    default=lambda: app.config["IMPORT_BATCH_SIZE"],
+    help="Records inserted per transaction.",
+)
+def import_command(input_file, input_format, content_type_name, username, batch_size):
+    """Bulk import content from a JSONL or CSV file ("-" reads stdin)."""
+    if input_format is None:
+        input_format = "csv" if input_file.name.lower().endswith(".csv") else "jsonl"
+
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        raise click.ClickException(f"User '{username}' not found")
+
+    start = time.perf_counter()
+    imported = skipped = 0
+    try:
+        for imported, skipped in importer.import_records(
+            importer.read_records(input_file, input_format),
+            content_type_name,
+            user._id,
+            batch_size,
+        ):
+            elapsed = time.perf_counter() - start
+            click.echo(
+                f"{imported} imported, {skipped} skipped,"
+                f" {imported / elapsed if elapsed else 0:.0f} rows/s"
+            )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    elapsed = time.perf_counter() - start
+    click.echo(
+        f"Done: {imported} imported, {skipped} skipped in {elapsed:.1f}s"
+        f" ({imported / elapsed if elapsed else 0:.0f} rows/s)"
+    )
+
+
+@ochyro_cli.command("verify")
+@click.option(
+    "--jobs",
+    type=click.IntRange(1),
+    help="Worker processes, defaults to the number of CPUs.",
+)
+@click.option(
+    "--checkpoint",
+    "checkpoint_path",
+    type=click.Path(dir_okay=False),
+    help="Checkpoint file, defaults to VERIFY_CHECKPOINT.",
+)
+@click.option(
+    "--table",
+    "tables",
+    multiple=True,
+    type=click.Choice(sorted(verify.VERIFIED_MODELS)),
+    help="Only verify this table, may be repeated.",
+)
+@click.option("--full", is_flag=True, help="Verify every chunk, ignore the checkpoint.")
+@click.option(
+    "--rehash",
+    is_flag=True,
+    help="First replace the stored hashes with canonical ones, once after upgrading"
+    " from the JSON hashes.",
+)
+@click.option(
+    "--output",
+    type=click.File("w", encoding="utf-8"),
+    default="-",
+    help="Where to write the JSON report, stdout by default.",
+)
+def verify_command(jobs, checkpoint_path, tables, full, rehash, output):
+    """Recompute the _hash and _hash_chain of every row and report mismatches."""
+    if rehash:
+        for table_name, rows in verify.rehash(tables).items():
+            click.echo(f"Rehashed {rows} rows of {table_name}", err=True)
+        full = True
+    report = verify.verify(checkpoint_path, jobs, tables, full)
+    json.dump(report, output, indent=2)
+    output.write("\n")
+    if report["mismatches"]:
+        raise SystemExit(1)
+
+
+@ochyro_cli.command("build")
+@click.argument("site_node_id", type=int)
+@click.option(
+    "--jobs",
+    type=click.IntRange(1),
+    help="Worker processes rendering pages, defaults to the number of CPUs.",
+)
+def build_command(site_node_id, jobs):
+    """Build the static pages of the site with the node id SITE_NODE_ID."""
+    site = Site.query.filter_by(_node_id=site_node_id).first()
+    if not site:
+        raise click.ClickException(f"Site node {site_node_id} not found")
+
+    def progress(stage, done, total):
+        click.echo(f"{stage} {done} of {total} pages")
+
+    data = {
+        "local_build_dir": site.local_build_dir,
+        "static_files_dir": site.static_files_dir,
+    }
+    result = builders.build_static_site(data, site_node_id, progress, jobs)
+    if result == "Build Failed":
+        raise click.ClickException("Build failed, see the log for the error")
+    click.echo(result)
+
+
+app.cli.add_command(ochyro_cli)
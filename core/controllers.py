@@ -1,6 +1,14 @@
-from flask import flash
 from flask_login import current_user
 from core import db, login
+from core import registry
+from core import hashing
+from core import merkle
+from core import sanitize
+from core import manifest
+from core import revisions
+from core import graph
+from core import cache as content_cache
+from core.serializers import serializer_for
 from core.models import (
     Node,
     NodeRevision,
@@ -13,15 +21,16 @@ from core.models import (
     Site,
     SiteRevision,
 )
+from sqlalchemy import or_, and_, inspect
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.attributes import set_committed_value
+from contextlib import contextmanager
 from datetime import datetime
-import hashlib
 import traceback
 import logging
 import json
 import base64
 import html
-import copy
-from lxml.html.clean import clean_html
 import re
 
 # Crawl and build imports
@@ -55,62 +64,89 @@ def _dictify_sqlalchemy_object(db_object):
 def _hash_table(db_object, chain=False):
     """Hashes an SQL Alchemy database object"""
 
-    """NOTE: Make sure the object __dict__ is loaded, so after a db.session.commit() or a
-    db.session.flush(), a db.session.refresh(db_object) is needed to populate the dict.
-
-    By default this just hashes values that are not hashes themselves and are not SQL
-    Alchemy instance state objects, by passing chain=True it will also hash existing
-    hashes building a Merkel chain (if previous _hash_chain exists) which ensures we can
-    check transactional integrity.
+    """By default this just hashes values that are not hashes themselves, by passing
+    chain=True it will also hash existing hashes building a Merkel chain (if previous
+    _hash_chain exists) which ensures we can check transactional integrity.  The row is
+    hashed canonically in column order by core.hashing, so a flush to get the id is
+    enough, no refresh is needed.
 
     Parameters: "db_object", an SQL Alchemy db object, "chain" boolean
-    Returns: a SHA256 hash digest string
+    Returns: a hash digest string, see core.hashing for the algorithm
     """
-    to_hash_dict = {}
-    if chain:
-        key_values_to_ignore = ["_sa_instance_state"]
-    else:
-        key_values_to_ignore = ["_sa_instance_state", "_hash", "_hash_chain"]
-    for key, value in db_object.__dict__.items():
-        if key not in key_values_to_ignore:
-            if "datetime" in str(
-                type(value)
-            ):  # Convoluted but reliable way to spot datetime objects
-                to_hash_dict[key] = str(value)
-            else:
-                to_hash_dict[key] = value
-    return hashlib.sha256(json.dumps(to_hash_dict).encode()).hexdigest()
-
-
-# Sample Node lock{
-#     "user_id": current_user.id,
-#     "username": current_user.username,
-#     "timestamp": str(datetime.utcnow()),
-# }
-def _check_node_lock(lock):
-    """Future state node locks to prevent changes during editing or long running query"""
-    if lock:
-        locked = json.loads(lock)
-        if locked["user_id"] == current_user._id:
-            return False
-        flash(
-            f"This node has been locked by {locked['username']} since {locked['timestamp']}."
+    return hashing.hash_row(db_object, chain)
+
+
+class EditConflict(Exception):
+    """A save found the content changed since the editor loaded it"""
+
+    """"expected_version" is the content version the edit was based on, the edit is
+    rolled back and the current content is left for the merge view to load.
+    """
+
+    def __init__(self, node_id, expected_version):
+        super().__init__(
+            f"Node {node_id} changed since version {expected_version} was loaded"
         )
-        return True
-    return False
-
-
-def _check_content_lock(lock):
-    """Future state content locks for rows to prevent changes during operations."""
-    if lock:
-        locked = json.loads(lock)
-        if locked["user_id"] == current_user._id:
-            return False
-        flash(
-            f"This content has been locked by {locked['username']} since {locked['timestamp']}."
+        self.node_id = node_id
+        self.expected_version = expected_version
+
+
+def _check_version(existing_content, expected_version):
+    """Raise EditConflict if the content is no longer at the version the form loaded"""
+    if not expected_version:
+        return  # Callers without a hidden_content_version write over the loaded row
+    try:
+        expected_version = int(expected_version)
+    except ValueError:
+        logging.error(
+            f"Security Warning: _check_version({expected_version}) failed to convert input to a integer!"
         )
-        return True
-    return False
+        raise EditConflict(existing_content["node"]._id, expected_version)
+    if existing_content["content"]._version != expected_version:
+        raise EditConflict(existing_content["node"]._id, expected_version)
+
+
+def _compare_and_swap(content):
+    """Write the changes of a loaded content row only if it is still at its version"""
+
+    """A conditional UPDATE ... WHERE _id=? AND _version=<version loaded>, no other
+    save committed in between when exactly one row matched.  Otherwise EditConflict is
+    raised and the caller's unit of work rolls the whole save back.  The row is left
+    clean, so the session doesn't flush the same changes again unconditionally.
+    """
+    state = inspect(content)
+    version_history = state.attrs._version.history
+    loaded_version = (version_history.deleted or version_history.unchanged)[0]
+    values = {attr.key: attr.value for attr in state.attrs if attr.history.added}
+
+    ContentClass = type(content)
+    with db.session.no_autoflush:
+        updated = ContentClass.query.filter(
+            ContentClass._id == content._id, ContentClass._version == loaded_version
+        ).update(values, synchronize_session=False)
+    if updated != 1:
+        raise EditConflict(content._node_id, loaded_version)
+    for key, value in values.items():
+        set_committed_value(content, key, value)
+
+
+@contextmanager
+def _unit_of_work():
+    """Run a save pipeline as one transaction, committed once or rolled back"""
+
+    """Everything inside flushes to get ids and hashes rows before the single commit
+    at the end, any exception rolls the whole pipeline back and is raised again.
+    """
+    try:
+        yield db.session
+        db.session.commit()
+    except EditConflict:
+        db.session.rollback()  # Expected, the editor gets the merge view
+        raise
+    except Exception as e:
+        db.session.rollback()
+        logging.error(traceback.format_exc())
+        raise
 
 
 def _register_node():
@@ -124,27 +160,68 @@ def _register_node():
     else:
         node = Node(_version=1, _timestamp=datetime.utcnow(), user_id=0)
     db.session.add(node)
-    db.session.commit()
+    db.session.flush()  # Gets the node id, the caller's unit of work commits
     return node
 
 
-def _associate_node(node, content, content_type):
+def _layer_parents(data):
+    """The parent node ids in a save's "layer_parents", None when it has none"""
+
+    """A list of node ids, or a JSON list or comma separated string of them.  Ids that
+    are not integers or not nodes are dropped.
+    """
+    value = data.get("layer_parents")
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = json.loads(value) if value.strip() else []
+        except ValueError:
+            value = value.split(",")
+    if not isinstance(value, list):
+        value = [value]
+    parent_ids = []
+    for parent_id in value:
+        try:
+            parent_ids.append(int(parent_id))  # Typecast as a security measure
+        except (ValueError, TypeError):
+            logging.error(
+                f"Security Warning: _layer_parents({parent_id}) failed to convert input to a integer!"
+            )
+    existing_ids = {
+        node_id
+        for (node_id,) in db.session.query(Node._id).filter(Node._id.in_(parent_ids))
+    }
+    return [parent_id for parent_id in parent_ids if parent_id in existing_ids]
+
+
+def _link_parents(node, data):
+    """Keep the layer edges above a node in step with the layer_parents of a save"""
+    parent_ids = _layer_parents(data)
+    if parent_ids is not None:  # Saves without layer_parents leave the edges alone
+        graph.set_parents(node._id, parent_ids)
+
+
+def _associate_node(node, content, content_type, data=None):
     """Complete a node that was registered with a first_child association and hash"""
 
-    """After content row creation link the row back to it's first parent node.
+    """After content row creation link the row back to it's first parent node, and to
+    the parent nodes of the "layer_parents" in data, see core.graph.
     Returns: full content dict."""
-    db.session.refresh(node)
+    node.content_id = content._id
+    node.content_revision = content._version
+    node.content_type_id = content_type._node_id
     node.first_child = json.dumps(
         {
-            "content_id": content._id,
-            "content_revision": content._version,
-            "content_type_id": content_type["type"]._id,
+            "content_id": node.content_id,
+            "content_revision": node.content_revision,
+            "content_type_id": node.content_type_id,
         }
     )
     node._hash = _hash_table(node)
     node._hash_chain = _hash_table(node, chain=True)
     db.session.add(node)
-    db.session.commit()
+    _link_parents(node, data or {})
 
     return {"node": node, "content": content, "type": content_type}
 
@@ -152,24 +229,22 @@ def _associate_node(node, content, content_type):
 def content_type_check_and_load(content_type_name):
     """Common function of saving content is to check and load the content type first"""
 
-    content_type_content = ContentType.query.filter_by(
-        name=content_type_name
-    ).first()  # Filter sanity check, this is internal only input
-    if not content_type_content:
+    registered_type = registry.get_by_name(content_type_name)
+    if not registered_type:
         logging.error(f"Content Type '{content_type_name}' not found' crash and burn")
         exit(1)
     else:
-        # Kind of redundant to load this again, but it sticks to the content model
-        content_type = load(content_type_content._node_id)
-        return content_type
+        return registered_type["type"]
 
 
-def load_and_revise(node_id, content_revision_object):
+def load_and_revise(node_id, content_revision_object, expected_version=None):
     """Common function to save a revision of the existing content before updating"""
 
-    existing_content = load(node_id)
+    """Raises EditConflict if the content is no longer at the "expected_version".
+    """
+    existing_content = load_content(load_node(node_id))  # Never a cached copy
     # @TODO Check hashes here just cause we can
-    # @TODO Check locks here, if locked restore form and return user
+    _check_version(existing_content, expected_version)
 
     content_revision = save_revision(
         existing_content["content"], content_revision_object
@@ -177,9 +252,98 @@ def load_and_revise(node_id, content_revision_object):
     return existing_content
 
 
+# Columns listed per version by list_revisions()
+REVISION_FIELDS = ["_version", "_timestamp", "_hash", "_hash_chain"]
+
+
+def list_revisions(node_id, cursor=None, limit=20):
+    """A page of the versions of a node newest first, the current version included"""
+
+    """Each version is a dict of the REVISION_FIELDS, the "cursor" is the version the
+    page starts below.  Older versions are paged from the revision table on its
+    (_node_id, _version) index, so a page costs the same however long the history is.
+    Returns: the page and the cursor of the next page (None on the last page), or None
+    if the node doesn't exist.
+    """
+    node = load_node(node_id)
+    if not node:
+        return None
+    registered_type = registry.get_by_node_id(node.content_type_id)
+    if not registered_type:
+        return None
+    ContentClass = registered_type["content_class"]
+    RevisionModel = revisions.REVISION_MODELS[ContentClass]
+    try:
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        logging.error(
+            f"Security Warning: list_revisions({node_id}, {cursor}) failed to convert the cursor to a integer!"
+        )
+        return None
+
+    versions = []
+    current = (
+        db.session.query(*[getattr(ContentClass, key) for key in REVISION_FIELDS])
+        .filter(ContentClass._id == node.content_id)
+        .first()
+    )
+    if current and (cursor is None or current._version < cursor):
+        versions.append(current)
+        cursor = current._version
+    if len(versions) < limit:
+        query = db.session.query(
+            *[getattr(RevisionModel, key) for key in REVISION_FIELDS]
+        ).filter(RevisionModel._node_id == node._id)
+        if cursor is not None:
+            query = query.filter(RevisionModel._version < cursor)
+        versions.extend(
+            query.order_by(RevisionModel._version.desc())
+            .limit(limit - len(versions) + 1)
+            .all()
+        )
+
+    next_cursor = None
+    if len(versions) > limit:
+        versions = versions[:limit]
+        next_cursor = str(versions[-1]._version)
+    return [row._asdict() for row in versions], next_cursor
+
+
+def load_revision(node_id, version):
+    """Load a version of a piece of content, the current one or a revision"""
+
+    """Returns the usual content dict, "content" is a transient object of the content
+    class holding the version's values, never added to the session.  None if the node
+    or the version doesn't exist.
+    """
+    node = load_node(node_id)
+    if not node:
+        return None
+    registered_type = registry.get_by_node_id(node.content_type_id)
+    if not registered_type:
+        return None
+    try:
+        values = revisions.reconstruct(node._id, int(version))
+    except ValueError:
+        logging.error(traceback.format_exc())
+        return None
+    if values is None:
+        return None
+    return {
+        "node": node,
+        "content": registered_type["content_class"](**values),
+        "type": registered_type["type"],
+    }
+
+
 def update_object_hash_and_save(existing_content, data):
     """Update the content object values filtering according to content type settings"""
 
+    """The content row is fully loaded, so it is hashed as soon as the values are set,
+    then written with a compare and swap on its version, committing is left to the
+    caller's unit of work.
+    """
+
     new_version_number = existing_content["content"]._version + 1
 
     # Set common update fields
@@ -188,9 +352,11 @@ def update_object_hash_and_save(existing_content, data):
 
     # Derive per field settings from content type unless this is a content type update
     if existing_content["content"]._hash != existing_content["type"]._hash:
-        editable_fields = json.loads(existing_content["type"].editable_fields)
+        editable_fields = registry.get_by_node_id(existing_content["type"]._node_id)[
+            "editable_fields"
+        ]
 
-        already_set_values = ["_version", "_node_id", "_lock"]
+        already_set_values = ["_version", "_node_id", "_lock", "layer_parents"]
         for key in data:
             print(key)
             # Security filter routines, not likely ever finalized
@@ -208,35 +374,41 @@ def update_object_hash_and_save(existing_content, data):
 
                 setattr(existing_content["content"], key, set_data)
 
-        db.session.add(existing_content["content"])
-        db.session.commit()
-        db.session.refresh(existing_content["content"])
         existing_content["content"]._hash = _hash_table(existing_content["content"])
         existing_content["content"]._hash_chain = _hash_table(
             existing_content["content"], chain=True
         )
-        db.session.commit()
-        db.session.refresh(existing_content["content"])
-
+        _compare_and_swap(existing_content["content"])
         return existing_content
     else:
         for key in data:
-            setattr(existing_content["content"], key, data[key])
-        db.session.add(existing_content["content"])
-        db.session.commit()
-        db.session.refresh(existing_content["content"])
+            if key != "layer_parents":  # Edges of the node, see _link_parents()
+                setattr(existing_content["content"], key, data[key])
         existing_content["content"]._hash = _hash_table(existing_content["content"])
         existing_content["content"]._hash_chain = _hash_table(
             existing_content["content"], chain=True
         )
-        db.session.commit()
-        db.session.refresh(existing_content["content"])
+        _compare_and_swap(existing_content["content"])
 
 
-def load(node_id):
+def load(node_id, fields=None):
     """A simple wrapper for loading the node and then the first child"""
+
+    """Read through the content cache, cached dicts hold detached copies so anything
+    that modifies and saves the content must use load_content(load_node()) instead.
+    See load_content() for "fields", partially loaded content is never cached.
+    """
+    try:
+        content = content_cache.get(int(node_id))
+    except (ValueError, TypeError):
+        content = None
+    if content:
+        return content
+
     node = load_node(node_id)
-    content = load_content(node)
+    content = load_content(node, fields) if node else None
+    if fields is None:
+        content_cache.put(content)
     return content
 
 
@@ -260,78 +432,255 @@ def load_node(node_id):
         pass
 
 
-def load_content(node):
+# Columns loaded whatever the projection, the loader and the views depend on them
+ALWAYS_LOADED_FIELDS = [
+    "_id",
+    "_version",
+    "_node_id",
+    "_timestamp",
+    "_hash",
+    "_hash_chain",
+]
+
+
+def _projection(ContentClass, registered_type, fields):
+    """The query options loading only the requested fields of a content class"""
+
+    """"fields" is a list of column names or "viewable" for the content type's
+    viewable_fields, every other column (including large UnicodeText ones) is deferred
+    until accessed.  No fields means everything is loaded, as do content type rows.
+    """
+    if fields is None or ContentClass is ContentType:
+        return []
+    if fields == "viewable":
+        fields = registered_type["viewable_fields"].keys()
+    columns = ContentClass.__table__.columns
+    field_names = [
+        name for name in ALWAYS_LOADED_FIELDS + list(fields) if name in columns
+    ]
+    return [load_only(*dict.fromkeys(field_names))]
+
+
+def load_content(node, fields=None):
     """Given an node load it's first child content row and content type row"""
 
     """Returns the complete content dict which consists of three objects: the node, the
-    content object, and the content type object."""
-    first_child = json.loads(node.first_child)
-
-    try:
-        safe_content_id = int(
-            first_child["content_id"]
-        )  # Typecast as a security measure
-    except Exception as e:
-        logging.error(traceback.format_exc())
-        logging.error(
-            f"Security Warning: load_content({node_id}) failed to convert input to a integer!"
-        )
+    content object, and the content type object.  Passing "fields" (a list of column
+    names or "viewable") loads only those columns of the content row."""
+    if not node.content_id or not node.content_type_id:
+        return False
 
-    content_type = ContentType.query.filter_by(
-        _node_id=first_child["content_type_id"]
-    ).first()
-    if not content_type:
+    registered_type = registry.get_by_node_id(node.content_type_id)
+    if not registered_type:
         return False
+    content_type = registered_type["type"]
 
     # Check here if the content type _node_id matches the given node._id this signifies
     # a content type node and not a normal piece of content
     if node._id == content_type._node_id:
-        return {
-            "node": node,
-            "content": content_type,
-            "type": copy.deepcopy(content_type),
-        }
+        ContentClass = ContentType
     else:
-        # Dynamically load the database model for the content type
-        content_module = __import__(
-            "core.models", fromlist=[content_type.content_class]
+        ContentClass = registered_type["content_class"]
+    content = (
+        db.session.query(ContentClass)
+        .options(*_projection(ContentClass, registered_type, fields))
+        .get(node.content_id)
+    )
+
+    return {"node": node, "content": content, "type": content_type}
+
+
+def load_many(node_ids, fields=None):
+    """A batched wrapper for loading many nodes and then their first children"""
+
+    """Cached content is served from the content cache, the rest of the node ids are
+    loaded with a single IN query and resolved with load_content_many(), the returned
+    content dicts keep the order of the given ids.  See load_content() for "fields".
+    """
+    safe_node_ids = []
+    for node_id in node_ids:
+        try:
+            safe_node_ids.append(int(node_id))  # Typecast as a security measure
+        except Exception as e:
+            logging.error(traceback.format_exc())
+            logging.error(
+                f"Security Warning: load_many({node_id}) failed to convert input to a integer!"
+            )
+
+    contents = content_cache.get_many(safe_node_ids)
+
+    missing_node_ids = set(safe_node_ids) - set(contents)
+    if missing_node_ids:
+        nodes = Node.query.filter(Node._id.in_(missing_node_ids)).all()
+        for content in load_content_many(nodes, fields):
+            if fields is None:
+                content_cache.put(content)
+            contents[content["node"]._id] = content
+
+    return [contents[node_id] for node_id in safe_node_ids if node_id in contents]
+
+
+def load_content_many(nodes, fields=None):
+    """Given a list of nodes load their first child content rows and content type rows"""
+
+    """The batched version of load_content(), content types come from the registry and
+    there is one IN query per content class no matter how many nodes are given.  Returns a
+    list of content dicts in the same order as the nodes, nodes that can't be resolved
+    to a content row are left out.  See load_content() for "fields".
+    """
+    registered_types = {}
+    for node in nodes:
+        if node.content_type_id and node.content_type_id not in registered_types:
+            registered_types[node.content_type_id] = registry.get_by_node_id(
+                node.content_type_id
+            )
+
+    # Group the content ids by class so each class is a single IN query, content type
+    # nodes hold their own row in the content type table
+    content_classes = {}
+    content_ids_by_class = {}
+    class_types = {}
+    for node in nodes:
+        registered_type = registered_types.get(node.content_type_id)
+        if not registered_type or not node.content_id:
+            continue
+        if node._id == registered_type["type"]._node_id:
+            ContentClass = ContentType
+        else:
+            ContentClass = registered_type["content_class"]
+        content_classes[node._id] = ContentClass
+        content_ids_by_class.setdefault(ContentClass, set()).add(node.content_id)
+        class_types[ContentClass] = registered_type
+
+    contents = {}
+    for ContentClass, content_ids in content_ids_by_class.items():
+        for content in (
+            db.session.query(ContentClass)
+            .options(*_projection(ContentClass, class_types[ContentClass], fields))
+            .filter(ContentClass._id.in_(content_ids))
+            .all()
+        ):
+            contents[(ContentClass, content._id)] = content
+
+    loaded = []
+    for node in nodes:
+        if node._id not in content_classes:
+            continue
+        content = contents.get((content_classes[node._id], node.content_id))
+        if content is not None:
+            loaded.append(
+                {
+                    "node": node,
+                    "content": content,
+                    "type": registered_types[node.content_type_id]["type"],
+                }
+            )
+    return loaded
+
+
+def query_content_of_type(content_type_name):
+    """Query the nodes of one content type joined to their content rows"""
+
+    """Returns a query of (node, content) rows that callers can filter, order and page
+    further, the join runs on the indexed typed first child columns of the node.
+    """
+    registered_type = registry.get_by_name(content_type_name)
+    ContentClass = registered_type["content_class"]
+    content_type_node_id = registered_type["type"]._node_id
+    return (
+        db.session.query(Node, ContentClass)
+        .join(ContentClass, Node.content_id == ContentClass._id)
+        .filter(Node.content_type_id == content_type_node_id)
+        # The content type's own node points at its content type row, not this class
+        .filter(Node._id != content_type_node_id)
+    )
+
+
+def load_content_of_type(content_type_name):
+    """Load all the content dicts of one content type with a single joined query"""
+    content_type = registry.get_by_name(content_type_name)["type"]
+    return [
+        {"node": node, "content": content, "type": content_type}
+        for node, content in query_content_of_type(content_type_name).all()
+    ]
+
+
+def encode_cursor(content):
+    """Opaque keyset paging cursor from a content row's _timestamp and _id"""
+    key = f"{content._timestamp.isoformat()}|{content._id}"
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Returns the (_timestamp, _id) key of a paging cursor or None if it is invalid"""
+    try:
+        padded_cursor = cursor + "=" * (-len(cursor) % 4)
+        timestamp, content_id = (
+            base64.urlsafe_b64decode(padded_cursor.encode()).decode().split("|")
+        )
+        return (datetime.fromisoformat(timestamp), int(content_id))
+    except Exception as e:
+        logging.error(
+            f"Security Warning: decode_cursor({cursor}) failed to decode the cursor!"
         )
-        ContentClass = getattr(content_module, content_type.content_class)
-        content = db.session.query(ContentClass).get(first_child["content_id"])
+        return None
 
-        return {"node": node, "content": content, "type": content_type}
+
+def keyset_page(query, ContentClass, before=None, page_size=20):
+    """Page a query newest first by the indexed _timestamp, with _id breaking ties"""
+
+    """Each page is a bounded range scan starting after the "before" cursor, rather than
+    an offset that has to skip every row of the pages before it.  The query may return
+    ContentClass rows or tuples that include one.
+    Returns: the page of rows and the cursor of the next page (None on the last page).
+    """
+    manifest.record_list(ContentClass)  # A rendered page depends on the whole listing
+    key = decode_cursor(before) if before else None
+    if key:
+        timestamp, content_id = key
+        query = query.filter(
+            or_(
+                ContentClass._timestamp < timestamp,
+                and_(
+                    ContentClass._timestamp == timestamp, ContentClass._id < content_id
+                ),
+            )
+        )
+    rows = (
+        query.order_by(ContentClass._timestamp.desc(), ContentClass._id.desc())
+        .limit(page_size + 1)
+        .all()
+    )
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last_row = rows[-1]
+        if not isinstance(last_row, ContentClass):
+            last_row = next(row for row in last_row if isinstance(row, ContentClass))
+        next_cursor = encode_cursor(last_row)
+    return rows, next_cursor
 
 
 def dictify_content(contents):
     """Given a a list of db objects that make up a piece of content, convert to dict"""
 
-    """Within our simple content model this is reasonable to do as we can catch the objects
-    that won't convert to json and deal with them.
+    """Each object is converted by the serializer compiled for its class, see
+    core.serializers, and keyed by its table name.
     """
     content_dict = {}
     for content in contents:
-        content_dict[content.__tablename__] = {}
-        for attr, value in content.__dict__.items():
-            if not attr == "_sa_instance_state":
-                # For timestamps get the string representation instead of the object
-                if "datetime" in str(type(value)):
-                    content_dict[content.__tablename__][attr] = str(value)
-                # For values that are JSON documents import as native types
-                elif (
-                    "str" in str(type(value))
-                    and value.startswith("[")
-                    or "str" in str(type(value))
-                    and value.startswith("{")
-                ):
-                    content_dict[content.__tablename__][attr] = json.loads(value)
-                # Everything else just assign and store
-                else:
-                    content_dict[content.__tablename__][attr] = value
+        content_dict[content.__tablename__] = serializer_for(type(content))(content)
     return content_dict
 
 
 def save_revision(content, content_revision_class):
     """Always save a revision of any row that is updated or deleted."""
+
+    """The revision is left pending, its INSERT must not be flushed before the
+    caller's _compare_and_swap() so a concurrent save of the same version is an
+    EditConflict rather than an IntegrityError on the revision key.
+    """
     content_revision = content_revision_class(
         _id=content._id, _version=content._version
     )
@@ -340,8 +689,9 @@ def save_revision(content, content_revision_class):
         if key != "_sa_instance_state":
             content_revision.__dict__[key] = value
 
-    db.session.add(content_revision)
-    db.session.commit()
+    with db.session.no_autoflush:
+        db.session.add(content_revision)
+        revisions.deltify_previous(content_revision)
 
     return content_revision
 
@@ -352,70 +702,61 @@ def save_user(data):
     """Parameters: form, object.  A WTForms like object.
     """
     # Test content exists first
-    content_type_content = ContentType.query.filter_by(name="User Content Type").first()
+    registered_type = registry.get_by_name("User Content Type")
 
-    if not content_type_content:
+    if not registered_type:
         error_out = json.dumps(data)
         logging.error(f"Content type not found or not loaded: data={error_out}")
         exit(1)
     else:
-        # Kind of redundant to load this again, but it sticks to the content model
-        content_type = load_content(load_node(content_type_content._node_id))
+        content_type = registered_type["type"]
 
     if data["hidden_node_id"] and data["hidden_node_version"]:  # Assume update
         node = load_node(data["node_id"])
-        if _check_node_lock(node._lock):
-            return form
-
         existing_user = content_load(node)
-        if _check_content_lock(existing_user._lock):
-            return form
-
-        user_revision = save_revision(existing_user, UserRevision)
-        new_version_number = user_revision.version + 1
-        existing_user["content"] = User(
-            _version=new_version_number,
-            _lock="",
-            username=html.escape(data["username"], quote=True),
-            email=html.escape(data["email"], quote=True),
-        )
-        if data["password"]:
-            existing_user["content"].set_password(data["password"])
-        existing_user["content"]._hash = _hash_table(existing_user["content"])
-        existing_user["content"]._hash_chain = _hash_table(
-            existing_user["content"], chain=True
-        )
-        existing_user["content"]._hash = _hash_table(
-            article
-        )  # Hash after updating object values
-        existing_user["content"]._hash_chain = _hash_table(article, chain=True)
-        db.session.add(existing_user["content"])
-        db.session.commit()
-        db.session.refresh(existing_user)
+
+        with _unit_of_work():
+            user_revision = save_revision(existing_user, UserRevision)
+            new_version_number = user_revision.version + 1
+            existing_user["content"] = User(
+                _version=new_version_number,
+                _lock="",
+                username=html.escape(data["username"], quote=True),
+                email=html.escape(data["email"], quote=True),
+            )
+            if data["password"]:
+                existing_user["content"].set_password(data["password"])
+            existing_user["content"]._hash = _hash_table(existing_user["content"])
+            existing_user["content"]._hash_chain = _hash_table(
+                existing_user["content"], chain=True
+            )
+            existing_user["content"]._hash = _hash_table(
+                article
+            )  # Hash after updating object values
+            existing_user["content"]._hash_chain = _hash_table(article, chain=True)
+            db.session.add(existing_user["content"])
+        content_cache.evict(node._id)
 
         return existing_user
 
     else:  # Assume we are creating a new user
-        node = _register_node()
-
-        user = User(
-            _version=1,
-            _lock="",
-            _node_id=node._id,
-            username=html.escape(data["username"], quote=True),
-            email=html.escape(data["email"], quote=True),
-        )
-        user.set_password(data["password"])
-        db.session.add(user)
-        db.session.commit()
-        db.session.refresh(user)
-        user._hash = _hash_table(user)  # Now that we have the id we can hash
-        user._hash_chain = _hash_table(user, chain=True)
-        db.session.add(user)
-        db.session.commit()
-        db.session.refresh(user)
+        with _unit_of_work():
+            node = _register_node()
+
+            user = User(
+                _version=1,
+                _lock="",
+                _node_id=node._id,
+                username=html.escape(data["username"], quote=True),
+                email=html.escape(data["email"], quote=True),
+            )
+            user.set_password(data["password"])
+            db.session.add(user)
+            db.session.flush()
+            user._hash = _hash_table(user)  # Now that we have the id we can hash
+            user._hash_chain = _hash_table(user, chain=True)
 
-        content = _associate_node(node, user, content_type)
+            content = _associate_node(node, user, content_type, data)
 
         return content
 
@@ -428,67 +769,68 @@ def save_article(data):
     node create --> article create --> node assoicate to article --> node hash
     """
     # Test content type exists first
-    content_type_content = ContentType.query.filter_by(
-        name="Article Content Type"
-    ).first()
-    if not content_type_content:
-        logging.error("Content Type 'Article' not found' crash and burn")
-        exit(1)
-    else:
-        # Kind of redundant to load this again, but it sticks to the content model
-        content_type = load_content(load_node(content_type_content._node_id))
+    content_type = content_type_check_and_load("Article Content Type")
 
     if data["hidden_node_id"] and data["hidden_node_version"]:  # Assume update
 
-        existing_content = load_content(load_node(data["hidden_node_id"]))
-        # @TODO Check hashes here just cause we can
-        # @TODO Check locks here, if locked restore form and return user
-
-        content_revision = save_revision(existing_content["content"], ArticleRevision)
-
-        new_version_number = existing_content["content"]._version + 1
-        existing_content["content"]._version = new_version_number
-        existing_content["content"]._node_id = existing_content["node"]._id
-        existing_content["content"]._lock = ""
-        existing_content["content"].title = clean_html(data["title"])
-        existing_content["content"].body = clean_html(data["body"])
-        existing_content["content"]._hash = _hash_table(existing_content["content"])
-        existing_content["content"]._hash_chain = _hash_table(
-            existing_content["content"], chain=True
-        )
-        existing_content["content"]._hash = _hash_table(
-            existing_content["content"]
-        )  # Hash after updating object values
-        existing_content["content"]._hash_chain = _hash_table(
-            existing_content["content"], chain=True
+        # Sanitized before the transaction, so no lock is held while the pool works
+        fields = sanitize.sanitize(
+            "Article", {"title": data["title"], "body": data["body"]}
         )
-        db.session.add(existing_content["content"])
-        db.session.commit()
-        db.session.refresh(existing_content["content"])
+        with _unit_of_work():
+            existing_content = load_content(load_node(data["hidden_node_id"]))
+            # @TODO Check hashes here just cause we can
+            _check_version(existing_content, data.get("hidden_content_version"))
+
+            save_revision(existing_content["content"], ArticleRevision)
+
+            new_version_number = existing_content["content"]._version + 1
+            existing_content["content"]._version = new_version_number
+            existing_content["content"]._node_id = existing_content["node"]._id
+            existing_content["content"]._lock = ""
+            existing_content["content"].title = fields["title"]
+            existing_content["content"].body = fields["body"]
+            existing_content["content"]._hash = _hash_table(
+                existing_content["content"]
+            )  # Hash after updating object values
+            existing_content["content"]._hash_chain = _hash_table(
+                existing_content["content"], chain=True
+            )
+            _compare_and_swap(existing_content["content"])
+            _link_parents(existing_content["node"], data)
+            site_node_ids = merkle.node_saved(
+                existing_content["node"], existing_content["content"]
+            )
+        content_cache.evict(existing_content["node"]._id)
+        for site_node_id in site_node_ids:
+            content_cache.evict(site_node_id)
 
         return existing_content
 
     else:  # Assume new article
-        node = _register_node()
-
-        article = Article(
-            _version=1,
-            _node_id=node._id,
-            _lock="",
-            title=data["title"],
-            body=data["body"],
+        fields = sanitize.sanitize(
+            "Article", {"title": data["title"], "body": data["body"]}
         )
-        # First save get's our article ID to include in the hash
-        db.session.add(article)
-        db.session.commit()
-        db.session.refresh(article)
-        article._hash = _hash_table(article)  # Hash after getting id
-        article._hash_chain = _hash_table(article, chain=True)
-        db.session.add(article)
-        db.session.commit()
-        db.session.refresh(article)
+        with _unit_of_work():
+            node = _register_node()
+
+            article = Article(
+                _version=1,
+                _node_id=node._id,
+                _lock="",
+                title=fields["title"],
+                body=fields["body"],
+            )
+            # Flushing get's our article ID to include in the hash
+            db.session.add(article)
+            db.session.flush()
+            article._hash = _hash_table(article)  # Hash after getting id
+            article._hash_chain = _hash_table(article, chain=True)
 
-        content_obj = _associate_node(node, article, content_type)
+            content_obj = _associate_node(node, article, content_type, data)
+            site_node_ids = merkle.node_saved(node, article)
+        for site_node_id in site_node_ids:
+            content_cache.evict(site_node_id)
 
         return content_obj
 
@@ -499,41 +841,48 @@ def save_site(data):
     content_type = content_type_check_and_load("Site Content Type")
 
     if data["hidden_node_id"] and data["hidden_node_version"]:  # Assume update
-        existing_content = load_and_revise(data["hidden_node_id"], SiteRevision)
-        update_object_hash_and_save(existing_content, data)
+        with _unit_of_work():
+            existing_content = load_and_revise(
+                data["hidden_node_id"], SiteRevision, data.get("hidden_content_version")
+            )
+            update_object_hash_and_save(existing_content, data)
+            _link_parents(existing_content["node"], data)
+            site_node_ids = merkle.node_saved(
+                existing_content["node"], existing_content["content"]
+            )
+        content_cache.evict(existing_content["node"]._id)
+        for site_node_id in site_node_ids:
+            content_cache.evict(site_node_id)
 
         return existing_content
 
     else:  # Assume new site
-        node = _register_node()
-
-        site = Site(
-            _version=1,
-            _node_id=node._id,
-            _lock="",
-            site_name=data["site_name"],
-            environment_name=data["environment_name"],
-            local_build_dir=data["local_build_dir"],
-            static_files_dir=data["static_files_dir"],
-            hosting_type=data["hosting_type"],
-            index_content=data["index_content"],
-            menu_content=data["menu_content"],
-            groups_content=data["groups_content"],
-        )
-        # First save get's our article ID to include in the hash
-        #!!! <- being first save
-        db.session.add(site)
-        db.session.commit()
-        db.session.refresh(site)
-        #!!! -> end first saved
-        ### reuse hash and save here
-        site._hash = _hash_table(site)  # Hash after getting id
-        site._hash_chain = _hash_table(site, chain=True)
-        db.session.add(site)
-        db.session.commit()
-        db.session.refresh(site)
+        with _unit_of_work():
+            node = _register_node()
+
+            site = Site(
+                _version=1,
+                _node_id=node._id,
+                _lock="",
+                site_name=data["site_name"],
+                environment_name=data["environment_name"],
+                local_build_dir=data["local_build_dir"],
+                static_files_dir=data["static_files_dir"],
+                hosting_type=data["hosting_type"],
+                index_content=data["index_content"],
+                menu_content=data["menu_content"],
+                groups_content=data["groups_content"],
+            )
+            # Flushing get's our site ID to include in the hash
+            db.session.add(site)
+            db.session.flush()
+            site._hash = _hash_table(site)  # Hash after getting id
+            site._hash_chain = _hash_table(site, chain=True)
 
-        content_obj = _associate_node(node, site, content_type)
+            content_obj = _associate_node(node, site, content_type, data)
+            site_node_ids = merkle.node_saved(node, site)
+        for site_node_id in site_node_ids:
+            content_cache.evict(site_node_id)
 
         return content_obj
 
@@ -544,9 +893,16 @@ def save_content_type(data):
     content_type = "Content Type Content Type"  # Special exception
 
     if data["hidden_node_id"] and data["hidden_node_version"]:  # Assume update
-        existing_content = load_and_revise(data["hidden_node_id"], ContentTypeRevision)
-
-        update_object_hash_and_save(existing_content, data)
+        with _unit_of_work():
+            existing_content = load_and_revise(
+                data["hidden_node_id"],
+                ContentTypeRevision,
+                data.get("hidden_content_version"),
+            )
+            update_object_hash_and_save(existing_content, data)
+            _link_parents(existing_content["node"], data)
+        content_cache.evict(existing_content["node"]._id)
+        registry.invalidate()
 
         return existing_content
 
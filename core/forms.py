@@ -113,6 +113,7 @@ class EditArticleForm(FlaskForm):
     hidden_node_version = HiddenField()
     hidden_node_hash = HiddenField()
     hidden_content_hash = HiddenField()
+    hidden_content_version = HiddenField()
     hidden_content_type = HiddenField()
     submit = SubmitField("Save")
 
@@ -183,6 +184,7 @@ class EditSiteForm(FlaskForm):
     hidden_node_version = HiddenField()
     hidden_node_hash = HiddenField()
     hidden_content_hash = HiddenField()
+    hidden_content_version = HiddenField()
     hidden_content_type = HiddenField()
     submit = SubmitField("Save")
 
@@ -211,6 +213,12 @@ class BuildSiteForm(FlaskForm):
     button_send = SubmitField("Save")
 
 
+class StartSiteBuildForm(FlaskForm):
+    """Start a build of a site, the build settings are read from the stored site"""
+
+    submit = SubmitField("Build Site")
+
+
 class EditContentTypeForm(FlaskForm):
     name = StringField(
         "Content Type Name",
@@ -246,6 +254,7 @@ class EditContentTypeForm(FlaskForm):
     hidden_node_version = HiddenField()
     hidden_node_hash = HiddenField()
     hidden_content_hash = HiddenField()
+    hidden_content_version = HiddenField()
     hidden_content_type = HiddenField()
     submit = SubmitField("Save")
 
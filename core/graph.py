@@ -0,0 +1,148 @@
+from sqlalchemy import select, literal, and_, func
+from core import app, db
+from core.models import Node, NodeEdge
+from datetime import datetime
+
+"""Traversals of the content graph held in the node_edge table."""
+
+"""Every traversal is a single recursive CTE that works on both SQLite and PostgreSQL.
+The CTE walks (node_id, depth) pairs with UNION so each node is expanded at most once per
+depth, and depth is always bounded (by GRAPH_MAX_DEPTH when not given) so cycles in the
+graph terminate.
+"""
+
+# Edge kinds
+EDGE_LAYER = "layer"  # The parent/child layers formerly held in Node.layer_* fields
+
+
+def _walk(node_id, depth, kind, upward):
+    """Build the recursive CTE of nodes reachable from node_id, root at depth 0"""
+    if depth is None:
+        depth = app.config["GRAPH_MAX_DEPTH"]
+    edges = NodeEdge.__table__
+    if upward:
+        from_column, to_column = edges.c.child_id, edges.c.parent_id
+    else:
+        from_column, to_column = edges.c.parent_id, edges.c.child_id
+
+    walk = select(
+        [
+            literal(int(node_id), type_=db.Integer).label("node_id"),
+            literal(0, type_=db.Integer).label("depth"),
+        ]
+    ).cte(name="walk", recursive=True)
+    walk = walk.union(
+        select([to_column, walk.c.depth + 1]).where(
+            and_(
+                from_column == walk.c.node_id,
+                edges.c.kind == kind,
+                walk.c.depth < depth,
+            )
+        )
+    )
+    return walk
+
+
+def _nearest(walk):
+    """Collapse a walk to one row per node at the shortest depth it was reached"""
+    return (
+        select([walk.c.node_id, func.min(walk.c.depth).label("depth")])
+        .group_by(walk.c.node_id)
+        .alias("nearest")
+    )
+
+
+def _query_walk(nearest, node_id, include_root=False):
+    query = db.session.query(Node, nearest.c.depth).join(
+        nearest, Node._id == nearest.c.node_id
+    )
+    if not include_root:
+        query = query.filter(Node._id != int(node_id))
+    return query.order_by(nearest.c.depth, Node._id)
+
+
+def ancestors(node_id, depth=None, kind=EDGE_LAYER):
+    """Nodes above node_id, nearest first, as a list of (node, depth) tuples"""
+    nearest = _nearest(_walk(node_id, depth, kind, upward=True))
+    return _query_walk(nearest, node_id).all()
+
+
+def descendants(node_id, depth=None, kind=EDGE_LAYER):
+    """Nodes below node_id, nearest first, as a list of (node, depth) tuples"""
+    nearest = _nearest(_walk(node_id, depth, kind, upward=False))
+    return _query_walk(nearest, node_id).all()
+
+
+def subgraph(node_id, depth=None, kind=EDGE_LAYER):
+    """The subtree rooted at node_id down to depth, nodes and the edges between them"""
+
+    """Returns a dict of "nodes", a list of (node, depth) tuples starting with the root,
+    and "edges", the NodeEdge rows that connect those nodes.
+    """
+    nearest = _nearest(_walk(node_id, depth, kind, upward=False))
+    nodes = _query_walk(nearest, node_id, include_root=True).all()
+    subgraph_ids = select([nearest.c.node_id])
+    edges = (
+        NodeEdge.query.filter(
+            NodeEdge.kind == kind,
+            NodeEdge.parent_id.in_(subgraph_ids),
+            NodeEdge.child_id.in_(subgraph_ids),
+        )
+        .order_by(NodeEdge.parent_id, NodeEdge.ordinal)
+        .all()
+    )
+    return {"nodes": nodes, "edges": edges}
+
+
+def add_edge(parent_id, child_id, kind=EDGE_LAYER, ordinal=None):
+    """Link two nodes, the caller commits"""
+    edge = NodeEdge(
+        _version=1,
+        _timestamp=datetime.utcnow(),
+        parent_id=int(parent_id),  # Typecast as a security measure
+        child_id=int(child_id),
+        kind=kind,
+        ordinal=ordinal,
+    )
+    db.session.add(edge)
+    return edge
+
+
+def remove_edge(parent_id, child_id, kind=EDGE_LAYER):
+    """Unlink two nodes, the caller commits"""
+    return NodeEdge.query.filter_by(
+        parent_id=int(parent_id), child_id=int(child_id), kind=kind
+    ).delete(synchronize_session=False)
+
+
+def set_parents(child_id, parent_ids, kind=EDGE_LAYER):
+    """Make the parents of a node exactly parent_ids, the caller commits"""
+
+    """Edges to parents no longer listed are removed and new ones added after the
+    existing children of the parent, edges that stay keep their ordinal.
+    """
+    child_id = int(child_id)  # Typecast as a security measure
+    existing = {
+        parent_id
+        for (parent_id,) in db.session.query(NodeEdge.parent_id).filter_by(
+            child_id=child_id, kind=kind
+        )
+    }
+    wanted = [int(parent_id) for parent_id in parent_ids]
+    for parent_id in existing - set(wanted):
+        remove_edge(parent_id, child_id, kind)
+    for parent_id in wanted:
+        if parent_id in existing:
+            continue
+        last_ordinal = (
+            db.session.query(func.max(NodeEdge.ordinal))
+            .filter_by(parent_id=parent_id, kind=kind)
+            .scalar()
+        )
+        add_edge(
+            parent_id,
+            child_id,
+            kind,
+            ordinal=0 if last_ordinal is None else last_ordinal + 1,
+        )
+        existing.add(parent_id)
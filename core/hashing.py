@@ -0,0 +1,150 @@
+from sqlalchemy import DateTime, Integer, Boolean, LargeBinary
+from functools import lru_cache
+from core import app
+import hashlib
+
+"""Canonical hashing of database rows."""
+
+"""A row is hashed as a fixed byte encoding of its columns in column name order, each
+column contributing its name, a type tag and its value, so the digest depends only on
+the values and never on which attributes happen to be loaded or in what order.  A
+revision row hashes the same as the content row it copies.  The column plan of each
+model is computed once.  Columns marked info={"hashed": False} are left out, they
+hold values derived from the hashes of other rows.
+
+Digests of the default SHA-256 are plain hex as they always have been, any other
+algorithm is prefixed with its name ("blake2b:...") so stored hashes stay verifiable
+after HASH_ALGORITHM changes.  Long text values are fed to the hash in chunks.
+"""
+
+HASH_COLUMNS = ("_hash", "_hash_chain")
+HASH_CHUNK_SIZE = 65536  # Characters encoded per update of large text values
+DEFAULT_ALGORITHM = "sha256"
+ALGORITHMS = {
+    "sha256": hashlib.sha256,
+    "sha512": hashlib.sha512,
+    "sha3_256": hashlib.sha3_256,
+    "blake2b": lambda: hashlib.blake2b(digest_size=32),
+}
+
+
+def _encode_none(update, value):
+    update(b"n")
+
+
+def _encode_text(update, value):
+    if not isinstance(value, str):
+        value = str(value)
+    update(b"s%d:" % len(value))
+    if len(value) <= HASH_CHUNK_SIZE:
+        update(value.encode("utf-8", "surrogatepass"))
+        return
+    for start in range(0, len(value), HASH_CHUNK_SIZE):
+        chunk = value[start : start + HASH_CHUNK_SIZE]
+        update(chunk.encode("utf-8", "surrogatepass"))
+
+
+def _encode_integer(update, value):
+    try:
+        update(b"i%d;" % int(value))
+    except (ValueError, TypeError):
+        _encode_text(update, value)  # Form input that never made it to an integer
+
+
+def _encode_boolean(update, value):
+    update(b"t" if value else b"f")
+
+
+def _encode_datetime(update, value):
+    if isinstance(value, str):
+        _encode_text(update, value)
+    else:
+        update(b"d%s;" % value.isoformat().encode())
+
+
+def _encode_binary(update, value):
+    update(b"b%d:" % len(value))
+    update(bytes(value))
+
+
+def _column_encoder(column):
+    if isinstance(column.type, DateTime):
+        return _encode_datetime
+    if isinstance(column.type, Boolean):
+        return _encode_boolean
+    if isinstance(column.type, Integer):
+        return _encode_integer
+    if isinstance(column.type, LargeBinary):
+        return _encode_binary
+    return _encode_text
+
+
+@lru_cache(maxsize=None)
+def _compile(Model, chain):
+    """The (column name, name bytes, encoder) plan hashing the rows of a model"""
+    plan = []
+    for column in sorted(Model.__table__.columns, key=lambda column: column.key):
+        if column.info.get("hashed", True) is False:
+            continue
+        if not chain and column.key in HASH_COLUMNS:
+            continue
+        plan.append((column.key, column.key.encode() + b"=", _column_encoder(column)))
+    return tuple(plan)
+
+
+def new_hash(algorithm=None):
+    """A new hash object of the algorithm, HASH_ALGORITHM by default"""
+    algorithm = algorithm or app.config["HASH_ALGORITHM"]
+    try:
+        return ALGORITHMS[algorithm]()
+    except KeyError:
+        raise ValueError(f"Unsupported hash algorithm '{algorithm}'")
+
+
+def algorithm_of(digest):
+    """The algorithm a stored digest was made with"""
+    if digest and ":" in digest:
+        return digest.split(":", 1)[0]
+    return DEFAULT_ALGORITHM
+
+
+def format_digest(hash_object, algorithm=None):
+    algorithm = algorithm or app.config["HASH_ALGORITHM"]
+    if algorithm == DEFAULT_ALGORITHM:
+        return hash_object.hexdigest()
+    return f"{algorithm}:{hash_object.hexdigest()}"
+
+
+def _hash(Model, get_value, chain, algorithm):
+    hash_object = new_hash(algorithm)
+    update = hash_object.update
+    for key, encoded_key, encode in _compile(Model, chain):
+        update(encoded_key)
+        value = get_value(key)
+        if value is None:
+            _encode_none(update, value)
+        else:
+            encode(update, value)
+        update(b"\n")
+    return format_digest(hash_object, algorithm)
+
+
+def hash_row(row, chain=False, algorithm=None):
+    """Hash a database object, chain=True includes its _hash and _hash_chain"""
+
+    """Columns are read as attributes, so a row only needs flushing to have its id, no
+    refresh.  Deferred or expired columns are loaded as they are read.
+    """
+    loaded = row.__dict__
+
+    def get_value(key):
+        if key in loaded:
+            return loaded[key]
+        return getattr(row, key)
+
+    return _hash(type(row), get_value, chain, algorithm)
+
+
+def hash_mapping(Model, values, chain=False, algorithm=None):
+    """Hash a dict of column values of a Model row, missing columns hash as None"""
+    return _hash(Model, values.get, chain, algorithm)
@@ -0,0 +1,186 @@
+from sqlalchemy import func, text
+from core import db
+from core import registry
+from core.models import Node
+from core import hashing
+from core import merkle
+from core import cache as content_cache
+from core import sanitize
+from datetime import datetime
+import traceback
+import logging
+import json
+import csv
+
+"""Bulk import of content from JSONL or CSV exports of other systems."""
+
+"""Rows are read as a stream and written in batches: ids are allocated up front so a
+batch of nodes and content rows can be linked, hashed and inserted with executemany
+in a single transaction, instead of the several statements per row of the save_*
+controllers.  Only one batch is ever held in memory.
+
+The importer allocates ids from the current maximum of each table, so it must not run
+while the CMS is saving content to the same database.
+"""
+
+
+def read_records(stream, input_format):
+    """Yield (line number, record dict) from a JSONL or CSV stream"""
+    if input_format == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logging.error(f"Import line {line_number} is not valid JSON, skipped")
+                yield line_number, None
+                continue
+            yield line_number, record
+
+
+def _next_id(Model):
+    return (db.session.query(func.max(Model._id)).scalar() or 0) + 1
+
+
+def _parse_timestamp(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except (ValueError, TypeError):
+        return None
+
+
+def _hash_mappings(Model, mappings):
+    """Set _hash and _hash_chain of new row mappings, as _hash_table() would"""
+    for mapping in mappings:
+        mapping["_hash"] = hashing.hash_mapping(Model, mapping)
+        mapping["_hash_chain"] = hashing.hash_mapping(Model, mapping, chain=True)
+
+
+def _sync_sequence(Model):
+    """Move a PostgreSQL id sequence past the ids the importer allocated"""
+    if db.engine.dialect.name != "postgresql":
+        return
+    table_name = Model.__table__.name
+    db.session.execute(
+        text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table_name}\"', '_id'), "
+            f"(SELECT max(_id) FROM \"{table_name}\"))"
+        )
+    )
+
+
+def _insert_batch(ContentClass, content_type, user_id, batch, node_id, content_id):
+    """Link, hash and insert one batch of records, returns the next free ids"""
+
+    """The id sequences are moved past the batch in the same commit, so the batches
+    committed before a failing one never collide with the ids of later saves.
+    """
+    nodes = []
+    contents = []
+    sanitized = sanitize.sanitize_many(
+        ContentClass.__name__, [fields for fields, timestamp in batch]
+    )
+    for fields, (_, timestamp) in zip(sanitized, batch):
+        contents.append(
+            dict(
+                fields,
+                _id=content_id,
+                _version=1,
+                _node_id=node_id,
+                _timestamp=timestamp,
+                _lock="",
+            )
+        )
+        nodes.append(
+            {
+                "_id": node_id,
+                "_version": 1,
+                "_timestamp": timestamp,
+                "user_id": user_id,
+                "content_id": content_id,
+                "content_revision": 1,
+                "content_type_id": content_type._node_id,
+                "first_child": json.dumps(
+                    {
+                        "content_id": content_id,
+                        "content_revision": 1,
+                        "content_type_id": content_type._node_id,
+                    }
+                ),
+            }
+        )
+        node_id += 1
+        content_id += 1
+
+    # Second pass, the rows are complete so they can be hashed before the insert
+    _hash_mappings(ContentClass, contents)
+    _hash_mappings(Node, nodes)
+
+    try:
+        db.session.bulk_insert_mappings(Node, nodes)
+        db.session.bulk_insert_mappings(ContentClass, contents)
+        _sync_sequence(Node)
+        _sync_sequence(ContentClass)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(traceback.format_exc())
+        raise
+    return node_id, content_id
+
+
+def import_records(records, content_type_name, user_id, batch_size=1000):
+    """Import records as content of a type, yields (imported, skipped) per batch"""
+
+    """"records" are (line number, record dict) tuples as read by read_records().  Only
+    the editable fields of the content type are imported, sanitized as the save_*
+    controllers do.  An optional "_timestamp" in ISO 8601 keeps the original creation
+    time.  Records that can't be read are skipped.
+    """
+    registered_type = registry.get_by_name(content_type_name)
+    if not registered_type:
+        raise ValueError(f"Content type '{content_type_name}' not found")
+    content_type = registered_type["type"]
+    ContentClass = registered_type["content_class"]
+    columns = ContentClass.__table__.columns
+    field_names = [
+        name for name in registered_type["editable_fields"] if name in columns
+    ]
+
+    node_id = _next_id(Node)
+    content_id = _next_id(ContentClass)
+    imported = 0
+    skipped = 0
+    batch = []
+    for line_number, record in records:
+        if not isinstance(record, dict):
+            skipped += 1
+            continue
+        fields = {name: record.get(name) for name in field_names}
+        timestamp = _parse_timestamp(record.get("_timestamp")) or datetime.utcnow()
+        batch.append((fields, timestamp))
+
+        if len(batch) >= batch_size:
+            node_id, content_id = _insert_batch(
+                ContentClass, content_type, user_id, batch, node_id, content_id
+            )
+            imported += len(batch)
+            batch = []
+            yield imported, skipped
+
+    if batch:
+        _insert_batch(ContentClass, content_type, user_id, batch, node_id, content_id)
+        imported += len(batch)
+    if imported:
+        site_node_ids = merkle.rebuild_all()
+        db.session.commit()
+        for site_node_id in site_node_ids:
+            content_cache.evict(site_node_id)
+    yield imported, skipped
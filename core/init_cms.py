@@ -1,5 +1,5 @@
 from core import db
-from core import models, controllers
+from core import models, controllers, registry
 import json
 import os
 from pathlib import Path
@@ -15,43 +15,44 @@ def init_content_type(build_content_type):
         name=build_content_type["content_type_name"]
     ).first()
     if not content_type_content:
-        node = controllers._register_node()
+        with controllers._unit_of_work():
+            node = controllers._register_node()
 
-        content_type = models.ContentType(
-            _version=1,
-            _node_id=node._id,
-            _hash="",
-            _lock="",
-            name=build_content_type["content_type_name"],
-            content_class=build_content_type["content_class"],
-            editable_fields=build_content_type["editable_fields"],
-            viewable_fields=build_content_type["viewable_fields"],
-            edit_url=build_content_type["edit_url"],
-            view_url=build_content_type["view_url"],
-        )
-        db.session.add(content_type)
-        db.session.commit()
-        db.session.refresh(content_type)
-        content_type._hash = controllers._hash_table(content_type)
-        content_type._hash_chain = controllers._hash_table(content_type, chain=True)
-        db.session.add(content_type)
-        db.session.commit()
-        db.session.refresh(content_type)
+            content_type = models.ContentType(
+                _version=1,
+                _node_id=node._id,
+                _hash="",
+                _lock="",
+                name=build_content_type["content_type_name"],
+                content_class=build_content_type["content_class"],
+                editable_fields=build_content_type["editable_fields"],
+                viewable_fields=build_content_type["viewable_fields"],
+                edit_url=build_content_type["edit_url"],
+                view_url=build_content_type["view_url"],
+            )
+            db.session.add(content_type)
+            db.session.flush()
+            content_type._hash = controllers._hash_table(content_type)
+            content_type._hash_chain = controllers._hash_table(
+                content_type, chain=True
+            )
 
-        db.session.refresh(node)
-        node.first_child = json.dumps(
-            {
-                "content_id": content_type._id,
-                "content_revision": content_type._version,
-                "content_type_id": node._id,
-                "content_type_name": build_content_type["content_type_name"],
-                "content_type_class": build_content_type["content_class"],
-            }
-        )
-        node._hash = controllers._hash_table(node)
-        node._hash_chain = controllers._hash_table(node, chain=True)
-        db.session.add(node)
-        db.session.commit()
+            node.content_id = content_type._id
+            node.content_revision = content_type._version
+            node.content_type_id = node._id
+            node.first_child = json.dumps(
+                {
+                    "content_id": content_type._id,
+                    "content_revision": content_type._version,
+                    "content_type_id": node._id,
+                    "content_type_name": build_content_type["content_type_name"],
+                    "content_type_class": build_content_type["content_class"],
+                }
+            )
+            node._hash = controllers._hash_table(node)
+            node._hash_chain = controllers._hash_table(node, chain=True)
+            db.session.add(node)
+        registry.invalidate()
 
         return {"node": node, "content": content_type, "type": content_type}
     else:
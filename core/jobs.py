@@ -0,0 +1,175 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import IntegrityError
+from core import app, db
+from core.models import Job
+from datetime import datetime, timedelta
+import threading
+import traceback
+import logging
+import json
+import time
+
+"""Background jobs persisted in the job table and run in a thread pool."""
+
+"""Site builds render every page of the site, run inside a request they would hold a
+worker for the whole build.  A build is submitted as a Job row instead and run by a
+pool of JOB_WORKERS threads, the request returns at once and the job's progress is
+polled from /jobs/<id>.
+
+Only one job per site can be queued or running at a time, enforced by the unique
+active_site_node_id across every process sharing the database.  A job that has made no
+progress for JOB_STALE_AFTER seconds, because the process running it went away, is
+failed so the site can be built again.
+"""
+
+BUILD_SITE = "build_site"
+ACTIVE_STATUSES = ("queued", "running")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config["JOB_WORKERS"], thread_name_prefix="ochyro-job"
+            )
+        return _executor
+
+
+def _finish(job, status, result=None, errors=None):
+    job.status = status
+    job.active_site_node_id = None
+    job.finished = datetime.utcnow()
+    job._timestamp = job.finished
+    job.result = result
+    if errors:
+        job.errors = json.dumps(json.loads(job.errors or "[]") + errors)
+    db.session.add(job)
+
+
+def _expire_stale(site_node_id):
+    """Fail the site's active job if it has stopped making progress"""
+    stale_before = datetime.utcnow() - timedelta(seconds=app.config["JOB_STALE_AFTER"])
+    job = Job.query.filter_by(active_site_node_id=site_node_id).first()
+    if job and job._timestamp and job._timestamp < stale_before:
+        _finish(job, "failed", errors=["Abandoned, no progress since the last update"])
+        db.session.commit()
+
+
+def active_job(site_node_id):
+    """The queued or running job of a site or None"""
+    return Job.query.filter_by(active_site_node_id=site_node_id).first()
+
+
+def latest_job(site_node_id):
+    """The most recent job of a site or None"""
+    return (
+        Job.query.filter_by(site_node_id=site_node_id).order_by(Job._id.desc()).first()
+    )
+
+
+def load_job(job_id):
+    return Job.query.get(int(job_id))
+
+
+def submit_build(site_node_id, data):
+    """Queue a build of a site, returns (job, True) or (active job, False)"""
+
+    """"data" is the normalized build form, it is stored with the job.  A site with a
+    queued or running build gets no second one, its active job is returned instead.
+    """
+    site_node_id = int(site_node_id)
+    _expire_stale(site_node_id)
+    now = datetime.utcnow()
+    job = Job(
+        _version=1,
+        _timestamp=now,
+        kind=BUILD_SITE,
+        site_node_id=site_node_id,
+        active_site_node_id=site_node_id,
+        status="queued",
+        parameters=json.dumps(data),
+        pages_done=0,
+        pages_total=0,
+    )
+    try:
+        db.session.add(job)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return active_job(site_node_id), False
+
+    _get_executor().submit(_run, job._id)
+    return job, True
+
+
+def _run(job_id):
+    """Run a job in a pool thread with its own app context and session"""
+    with app.app_context():
+        job = Job.query.get(job_id)
+        if job is None or job.status != "queued":
+            return
+        job.status = "running"
+        job.started = datetime.utcnow()
+        job._timestamp = job.started
+        db.session.commit()
+
+        last_commit = [time.monotonic()]
+
+        def progress(stage, done, total):
+            job.stage = stage
+            job.pages_done = done
+            job.pages_total = total
+            now = time.monotonic()
+            if now - last_commit[0] >= app.config["JOB_PROGRESS_INTERVAL"]:
+                job._timestamp = datetime.utcnow()
+                db.session.commit()
+                last_commit[0] = now
+
+        try:
+            from core.builders import build_static_site
+
+            result = build_static_site(
+                json.loads(job.parameters),
+                job.site_node_id,
+                progress,
+                app.config["BUILD_JOBS"],
+            )
+            if result == "Build Failed":
+                _finish(job, "failed", result, [result])
+            else:
+                _finish(job, "done", result)
+            db.session.commit()
+        except Exception as e:
+            logging.error(traceback.format_exc())
+            db.session.rollback()
+            job = Job.query.get(job_id)
+            _finish(job, "failed", "Build Failed", [repr(e)])
+            db.session.commit()
+
+
+def status(job):
+    """A job's progress as a JSON ready dict"""
+    if job.started:
+        elapsed = ((job.finished or datetime.utcnow()) - job.started).total_seconds()
+    else:
+        elapsed = 0
+    return {
+        "id": job._id,
+        "kind": job.kind,
+        "site_node_id": job.site_node_id,
+        "status": job.status,
+        "stage": job.stage,
+        "pages_done": job.pages_done,
+        "pages_total": job.pages_total,
+        "elapsed": round(elapsed, 3),
+        "queued": str(job._timestamp) if job.status == "queued" else None,
+        "started": None if job.started is None else str(job.started),
+        "finished": None if job.finished is None else str(job.finished),
+        "errors": json.loads(job.errors or "[]"),
+        "result": job.result,
+    }
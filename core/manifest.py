@@ -0,0 +1,159 @@
+from sqlalchemy import event
+from contextlib import contextmanager
+from core import app, db
+from core import registry
+from core.models import Node
+import threading
+import hashlib
+import logging
+import json
+import os
+
+"""Build manifests, the sources of every page of a static site build."""
+
+"""While a page is rendered for a build, every content row it reads is recorded as
+"node:<node id>", and every keyset paged listing of a content class as "list:<class>".
+The manifest written next to the build directory maps each page to its output file,
+the links found on it and those sources, with the signature each source had when the
+build started: the _hash and _version of a node's content, a digest of the node ids
+of a listed class.  It also holds a digest of the templates and static files.
+
+The next build renders only the pages whose sources changed since, follows the stored
+links of the others and removes the output of pages no longer linked.  A change to the
+templates or static files rebuilds every page.
+"""
+
+MANIFEST_FORMAT = 2  # 2: pages serialized by lxml, every page is rendered again
+
+_recorder = threading.local()
+
+
+def record(source):
+    """Add a source to the page being rendered by this thread, if any"""
+    sources = getattr(_recorder, "sources", None)
+    if sources is not None:
+        sources.add(source)
+
+
+def record_node(node_id):
+    record(f"node:{node_id}")
+
+
+def record_list(ContentClass):
+    record(f"list:{ContentClass.__name__}")
+
+
+def _content_node_id(row):
+    if isinstance(row, Node):
+        return None
+    return row.__dict__.get("_node_id")
+
+
+@event.listens_for(db.Model, "load", propagate=True)
+def _content_loaded(row, context):
+    node_id = _content_node_id(row)
+    if node_id is not None:
+        record_node(node_id)
+
+
+@event.listens_for(db.Model, "refresh", propagate=True)
+def _content_refreshed(row, context, attrs):
+    _content_loaded(row, context)
+
+
+@contextmanager
+def recording():
+    """Record the sources read in the block, yields the set they are added to"""
+    # Rows already in the session are expired, reading them again fires "refresh"
+    for row in list(db.session.identity_map.values()):
+        if _content_node_id(row) is not None:
+            db.session.expire(row)
+    sources = set()
+    _recorder.sources = sources
+    try:
+        yield sources
+    finally:
+        _recorder.sources = None
+
+
+def snapshot():
+    """The current signature of every source"""
+    signatures = {}
+    content_classes = {entry["content_class"] for entry in registry.all_types()}
+    for ContentClass in sorted(content_classes, key=lambda cls: cls.__name__):
+        node_ids = []
+        for node_id, content_hash, version in db.session.query(
+            ContentClass._node_id, ContentClass._hash, ContentClass._version
+        ).order_by(ContentClass._node_id):
+            signatures[f"node:{node_id}"] = f"{content_hash}:{version}"
+            node_ids.append(str(node_id))
+        signatures[f"list:{ContentClass.__name__}"] = hashlib.sha256(
+            ",".join(node_ids).encode()
+        ).hexdigest()
+    return signatures
+
+
+def inputs_digest(static_files_dir):
+    """A digest of the names and contents of the templates and static files"""
+    digest = hashlib.sha256(f"{MANIFEST_FORMAT}".encode())
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    for directory in (template_dir, static_files_dir):
+        for path, dirs, files in sorted(os.walk(directory)):
+            dirs.sort()
+            for name in sorted(files):
+                file_name = os.path.join(path, name)
+                digest.update(f"{os.path.relpath(file_name, directory)}\0".encode())
+                with open(file_name, "rb") as file:
+                    digest.update(hashlib.sha256(file.read()).digest())
+    return digest.hexdigest()
+
+
+def manifest_path(build_dir):
+    """The manifest is kept beside the build directory, never published with it"""
+    return f"{build_dir.rstrip('/')}.manifest.json"
+
+
+def load(build_dir):
+    """The manifest of the last build into build_dir, None without a usable one"""
+    if not os.path.isdir(build_dir):
+        return None
+    try:
+        with open(manifest_path(build_dir)) as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logging.error(f"Unreadable build manifest {manifest_path(build_dir)}, ignored")
+        return None
+    if manifest.get("format") != MANIFEST_FORMAT:
+        return None
+    return manifest
+
+
+def save(build_dir, inputs, signatures, pages):
+    """Write the manifest of a build, with the signatures of its pages' sources"""
+    sources = {}
+    for page in pages.values():
+        for source in page["sources"]:
+            sources[source] = signatures.get(source)
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "inputs": inputs,
+        "sources": sources,
+        "pages": pages,
+    }
+    path = manifest_path(build_dir)
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(manifest, file, separators=(",", ":"))
+    os.replace(f"{path}.tmp", path)
+
+
+def is_current(manifest, signatures, uri):
+    """Whether a page of the manifest is unchanged, none of its sources changed"""
+    if not manifest or uri not in manifest["pages"]:
+        return False
+    recorded = manifest["sources"]
+    return all(
+        signatures.get(source) == recorded.get(source)
+        for source in manifest["pages"][uri]["sources"]
+    )
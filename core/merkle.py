@@ -0,0 +1,340 @@
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
+from core import app, db
+from core import registry
+from core.models import Node, Site, MerkleNode
+from datetime import datetime
+import hashlib
+
+"""Merkle trees over the content of each site, the root is the site's content_hash."""
+
+"""The members of a site are its own node and every node of the SITE_CONTENT_TYPES.
+Each member is a leaf at level 0 (its position is its node id) with a digest of its
+content row's _hash, and each of the MERKLE_DEPTH levels above groups MERKLE_FANOUT
+positions of the level below, so the single digest at the top is the root.
+
+Saving a node recomputes its leaf and the MERKLE_DEPTH digests above it in the trees
+of every site it belongs to, a few small queries no matter how large or how many the
+sites are.  A build compares the root with the root published by the last build and
+stops right away when they match, otherwise the changed nodes are found by descending
+only into the subtrees whose digests differ.
+None of these functions commit, they run within the caller's unit of work, and the
+cached content of the sites whose content_hash they change is evicted by the caller
+after the commit.
+"""
+
+
+def _leaf_digest(node_id, content_hash):
+    return hashlib.sha256(f"{node_id}:{content_hash}".encode()).hexdigest()
+
+
+def _parent_digest(children):
+    """Digest of a list of (position, digest) children in position order"""
+    digest = hashlib.sha256()
+    for position, child_digest in children:
+        digest.update(f"{position}:{child_digest};".encode())
+    return digest.hexdigest()
+
+
+def _member_type_ids():
+    type_ids = []
+    for content_type_name in app.config["SITE_CONTENT_TYPES"]:
+        registered_type = registry.get_by_name(content_type_name)
+        if registered_type:
+            type_ids.append(registered_type["type"]._node_id)
+    return type_ids
+
+
+def _members(site):
+    """(node id, content _hash) of every member of a site"""
+    from core.controllers import query_content_of_type
+
+    members = [(site._node_id, site._hash)]
+    for content_type_name in app.config["SITE_CONTENT_TYPES"]:
+        registered_type = registry.get_by_name(content_type_name)
+        if registered_type:
+            ContentClass = registered_type["content_class"]
+            members.extend(
+                query_content_of_type(content_type_name)
+                .with_entities(Node._id, ContentClass._hash)
+                .all()
+            )
+    return members
+
+
+def _set_root(site, root):
+    site.content_hash = root
+    db.session.add(site)
+
+
+def _has_tree(site):
+    return (
+        db.session.query(MerkleNode._id)
+        .filter_by(site_node_id=site._node_id, level=app.config["MERKLE_DEPTH"])
+        .first()
+        is not None
+    )
+
+
+def rebuild(site):
+    """Compute every digest of a site's tree, the published digests are kept"""
+    fanout = app.config["MERKLE_FANOUT"]
+    levels = [
+        {
+            node_id: _leaf_digest(node_id, content_hash)
+            for node_id, content_hash in _members(site)
+        }
+    ]
+    for level in range(1, app.config["MERKLE_DEPTH"] + 1):
+        grouped = {}
+        for position in sorted(levels[-1]):
+            grouped.setdefault(position // fanout, []).append(
+                (position, levels[-1][position])
+            )
+        levels.append(
+            {
+                position: _parent_digest(children)
+                for position, children in grouped.items()
+            }
+        )
+
+    existing = {
+        (row.level, row.position): row
+        for row in MerkleNode.query.options(
+            load_only("_id", "level", "position", "digest")
+        ).filter_by(site_node_id=site._node_id)
+    }
+    now = datetime.utcnow()
+    inserts = []
+    updates = []
+    for level, digests in enumerate(levels):
+        for position, digest in digests.items():
+            row = existing.pop((level, position), None)
+            if row is None:
+                inserts.append(
+                    {
+                        "_version": 1,
+                        "_timestamp": now,
+                        "site_node_id": site._node_id,
+                        "level": level,
+                        "position": position,
+                        "digest": digest,
+                    }
+                )
+            elif row.digest != digest:
+                updates.append({"_id": row._id, "digest": digest})
+    # Positions with no members left, they differ from any published digest
+    for row in existing.values():
+        if row.digest is not None:
+            updates.append({"_id": row._id, "digest": None})
+    db.session.bulk_insert_mappings(MerkleNode, inserts)
+    db.session.bulk_update_mappings(MerkleNode, updates)
+
+    root = levels[-1].get(0)
+    _set_root(site, root)
+    return root
+
+
+def _lock_roots(site_node_ids):
+    """Lock the roots of the trees of some sites, the node ids of those with a tree"""
+
+    """Saves updating the same trees take turns, each one reads the children of the
+    digests it recomputes only once the save before it committed, so neither overwrites
+    the other's parent digests.  Roots are locked in node id order.
+    """
+    return {
+        site_node_id
+        for (site_node_id,) in db.session.query(MerkleNode.site_node_id)
+        .filter(
+            MerkleNode.site_node_id.in_(site_node_ids),
+            MerkleNode.level == app.config["MERKLE_DEPTH"],
+            MerkleNode.position == 0,
+        )
+        .order_by(MerkleNode.site_node_id)
+        .with_for_update()
+    }
+
+
+def update_leaf(sites, node_id, content_hash):
+    """Recompute one member's leaf and the digests above it in the trees of sites"""
+
+    """The trees are updated together, a query per level reads the siblings in every
+    tree and the changed digests are written in one batch.  The roots must be locked,
+    see _lock_roots().
+    """
+    if not sites:
+        return
+    fanout = app.config["MERKLE_FANOUT"]
+    depth = app.config["MERKLE_DEPTH"]
+    site_node_ids = [site._node_id for site in sites]
+    positions = [int(node_id) // fanout ** level for level in range(depth + 1)]
+    digests = {
+        site_node_id: _leaf_digest(positions[0], content_hash)
+        for site_node_id in site_node_ids
+    }
+    levels = [digests]
+    for level in range(1, depth + 1):
+        position = positions[level]
+        children = {site_node_id: [] for site_node_id in site_node_ids}
+        for site_node_id, child_position, child_digest in db.session.query(
+            MerkleNode.site_node_id, MerkleNode.position, MerkleNode.digest
+        ).filter(
+            MerkleNode.site_node_id.in_(site_node_ids),
+            MerkleNode.level == level - 1,
+            MerkleNode.position.between(
+                position * fanout, position * fanout + fanout - 1
+            ),
+            MerkleNode.position != positions[level - 1],
+            MerkleNode.digest.isnot(None),
+        ):
+            children[site_node_id].append((child_position, child_digest))
+        digests = {}
+        for site_node_id, site_children in children.items():
+            site_children.append((positions[level - 1], levels[-1][site_node_id]))
+            digests[site_node_id] = _parent_digest(sorted(site_children))
+        levels.append(digests)
+
+    existing = {
+        (row.site_node_id, row.level): row._id
+        for row in db.session.query(
+            MerkleNode._id, MerkleNode.site_node_id, MerkleNode.level
+        ).filter(
+            MerkleNode.site_node_id.in_(site_node_ids),
+            or_(
+                *[
+                    and_(MerkleNode.level == level, MerkleNode.position == position)
+                    for level, position in enumerate(positions)
+                ]
+            ),
+        )
+    }
+    now = datetime.utcnow()
+    inserts = []
+    updates = []
+    for level, level_digests in enumerate(levels):
+        for site_node_id, digest in level_digests.items():
+            row_id = existing.get((site_node_id, level))
+            if row_id is None:
+                inserts.append(
+                    {
+                        "_version": 1,
+                        "_timestamp": now,
+                        "site_node_id": site_node_id,
+                        "level": level,
+                        "position": positions[level],
+                        "digest": digest,
+                    }
+                )
+            else:
+                updates.append({"_id": row_id, "digest": digest})
+    db.session.bulk_insert_mappings(MerkleNode, inserts)
+    db.session.bulk_update_mappings(MerkleNode, updates)
+    for site in sites:
+        _set_root(site, digests[site._node_id])
+
+
+def node_saved(node, content):
+    """Bring the trees of every site the saved node belongs to up to date"""
+
+    """Returns the node ids of those sites, the caller evicts their cached content
+    once the save is committed.
+    """
+    if node.content_type_id in _member_type_ids():
+        sites = Site.query.all()  # Members of every site
+    elif isinstance(content, Site):
+        sites = [content]
+    else:
+        return []
+    with_tree = _lock_roots([site._node_id for site in sites])
+    update_leaf(
+        [site for site in sites if site._node_id in with_tree], node._id, content._hash
+    )
+    for site in sites:
+        if site._node_id not in with_tree:
+            rebuild(site)
+    return [site._node_id for site in sites]
+
+
+def rebuild_all():
+    """Rebuild the tree of every site, after changes made outside the save pipeline"""
+
+    """Returns the node ids of the sites, evict their cached content after the commit.
+    """
+    sites = Site.query.all()
+    for site in sites:
+        rebuild(site)
+    return [site._node_id for site in sites]
+
+
+def root(site):
+    """The current root digest of a site, building its tree if it has none yet"""
+    if not _has_tree(site):
+        return rebuild(site)
+    return (
+        db.session.query(MerkleNode.digest)
+        .filter_by(site_node_id=site._node_id, level=app.config["MERKLE_DEPTH"])
+        .filter_by(position=0)
+        .scalar()
+    )
+
+
+def is_published(site):
+    """True when the site's root matches the root published by its last build"""
+    current_root = root(site)
+    published_root = (
+        db.session.query(MerkleNode.published_digest)
+        .filter_by(site_node_id=site._node_id, level=app.config["MERKLE_DEPTH"])
+        .filter_by(position=0)
+        .scalar()
+    )
+    return current_root is not None and current_root == published_root
+
+
+def _differs():
+    return or_(
+        MerkleNode.digest != MerkleNode.published_digest,
+        and_(MerkleNode.digest.is_(None), MerkleNode.published_digest.isnot(None)),
+        and_(MerkleNode.digest.isnot(None), MerkleNode.published_digest.is_(None)),
+    )
+
+
+def changed_nodes(site):
+    """Ids of the member nodes added, changed or removed since the last build"""
+
+    """Descends from the root only into children of digests that differ from their
+    published digest, when most of a level differs it is scanned whole instead.
+    """
+    fanout = app.config["MERKLE_FANOUT"]
+    positions = [0]
+    for level in range(app.config["MERKLE_DEPTH"], -1, -1):
+        query = db.session.query(MerkleNode.position).filter(
+            MerkleNode.site_node_id == site._node_id,
+            MerkleNode.level == level,
+            _differs(),
+        )
+        if level == app.config["MERKLE_DEPTH"]:
+            query = query.filter(MerkleNode.position == 0)
+        elif len(positions) <= app.config["MERKLE_MAX_DESCENT"]:
+            query = query.filter(
+                or_(
+                    *[
+                        MerkleNode.position.between(
+                            position * fanout, position * fanout + fanout - 1
+                        )
+                        for position in positions
+                    ]
+                )
+            )
+        positions = [row.position for row in query.order_by(MerkleNode.position)]
+        if not positions:
+            return []
+    return positions
+
+
+def publish(site):
+    """Record the current digests as published after a successful build"""
+    MerkleNode.query.filter_by(site_node_id=site._node_id).update(
+        {MerkleNode.published_digest: MerkleNode.digest}, synchronize_session=False
+    )
+    site.last_published = datetime.utcnow()
+    db.session.add(site)
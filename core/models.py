@@ -14,7 +14,8 @@ def load_user(id):
 """Common fields for the content model."""
 
 """These are denoted with a leading single underscore to differentiate from reserved names
-in SQL Alchemy and to distinguish from unique fields."""
+in SQL Alchemy and to distinguish from unique fields.  Columns holding JSON documents are
+marked with info={"json": True} so serializers can decode them."""
 # ID is the pervasive primary key for all tables
 db.Model._id = db.Column(db.Integer, primary_key=True, index=True)
 # Everything is versioned, this combines to be a second primary key in revision tables
@@ -30,7 +31,7 @@ db.Model._hash_chain = db.Column(db.String(140))
 # Everything in the database is timestamped
 db.Model._timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
 # Everything in the database is potentially editable and therefore must be lockable
-db.Model._lock = db.Column(db.UnicodeText())
+db.Model._lock = db.Column(db.UnicodeText(), info={"json": True})
 # Everything in the database has a state that we can check for
 db.Model._state = db.Column(db.String(100))
 # Everything in the database has authorization metadata called "perms" for permissions
@@ -55,9 +56,14 @@ class Node(db.Model):
 
     user_id = db.Column(db.Integer, db.ForeignKey("user._id"))
     labels = db.Column(db.UnicodeText(), index=True)
-    first_child = db.Column(db.String(200), index=True)
-    layer_parents = db.Column(db.UnicodeText())
-    layer_children = db.Column(db.UnicodeText())
+    first_child = db.Column(db.String(200), index=True, info={"json": True})
+    # The first child association as typed columns so nodes can be joined to content
+    content_id = db.Column(db.Integer, index=True)
+    content_revision = db.Column(db.Integer)
+    content_type_id = db.Column(db.Integer, index=True)  # Content type _node_id
+    # Superseded by the node_edge table, kept for migrated data
+    layer_parents = db.Column(db.UnicodeText(), info={"json": True})
+    layer_children = db.Column(db.UnicodeText(), info={"json": True})
     layer_next_node = db.Column(db.Integer)
     layer_previous_node = db.Column(db.Integer)
 
@@ -67,26 +73,103 @@ class NodeRevision(db.Model):
 
     """Content updates first save the existing content to it's appropriate revision table
     including nodes themselves.  In this way the base tables are always the latest revision.
+    Each revision table is keyed on (_id, _version) with a unique index on (_node_id,
+    _version), so fetching a version of a node or paging its history is a range scan.
     """
 
     # content_type = db.Column(db.Integer) # After we build the type system
     user_id = db.Column(db.Integer, db.ForeignKey("user._id"))
     labels = db.Column(db.UnicodeText(), index=True)
-    first_child = db.Column(db.String(200), index=True)
+    first_child = db.Column(db.String(200), index=True, info={"json": True})
+    content_id = db.Column(db.Integer, index=True)
+    content_revision = db.Column(db.Integer)
+    content_type_id = db.Column(db.Integer, index=True)
     _version = db.Column(db.Integer, primary_key=True, index=True)  # Revision override
-    layer_parents = db.Column(db.UnicodeText())
-    layer_children = db.Column(db.UnicodeText())
+    _delta = db.Column(db.LargeBinary, info={"hashed": False})  # See core.revisions
+    layer_parents = db.Column(db.UnicodeText(), info={"json": True})
+    layer_children = db.Column(db.UnicodeText(), info={"json": True})
     layer_next_node = db.Column(db.Integer)
     layer_previous_node = db.Column(db.Integer)
 
+    __table_args__ = (
+        db.Index(
+            "ix_node_revision__node_id__version", "_node_id", "_version", unique=True
+        ),
+    )
+
+
+class NodeEdge(db.Model):
+    """A directed edge between two nodes, the graph of the content model."""
+
+    """Edges are typed by "kind" so several independent graphs can share the table, and
+    "ordinal" keeps the order of a parent's children.  Traversals are in core.graph.
+    """
+
+    parent_id = db.Column(db.Integer, db.ForeignKey("node._id"))
+    child_id = db.Column(db.Integer, db.ForeignKey("node._id"))
+    kind = db.Column(db.String(50))
+    ordinal = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index("ix_node_edge_parent_id_kind_ordinal", "parent_id", "kind", "ordinal"),
+        db.Index("ix_node_edge_child_id_kind", "child_id", "kind"),
+    )
+
+
+class MerkleNode(db.Model):
+    """One digest of the Merkle tree over the content of a site, see core.merkle"""
+
+    """Level 0 holds a digest per member node with the node id as its position, each
+    level above holds the digests of MERKLE_FANOUT children.  "published_digest" is
+    the digest at the last successful build of the site.
+    """
+
+    site_node_id = db.Column(db.Integer, db.ForeignKey("node._id"))
+    level = db.Column(db.Integer)
+    position = db.Column(db.Integer)
+    digest = db.Column(db.String(140))
+    published_digest = db.Column(db.String(140))
+
+    __table_args__ = (
+        db.Index(
+            "ix_merkle_node_site_node_id_level_position",
+            "site_node_id",
+            "level",
+            "position",
+            unique=True,
+        ),
+    )
+
+
+class Job(db.Model):
+    """A background job such as a site build, run by core.jobs"""
+
+    """"active_site_node_id" holds the site while the job is queued or running and is
+    cleared when it ends, its unique constraint allows one active job per site.  The
+    common _timestamp is touched on progress, a job that stops touching it is stale.
+    """
+
+    kind = db.Column(db.String(50), index=True)
+    site_node_id = db.Column(db.Integer, db.ForeignKey("node._id"), index=True)
+    active_site_node_id = db.Column(db.Integer, unique=True)
+    status = db.Column(db.String(20), index=True)  # queued, running, done or failed
+    stage = db.Column(db.String(50))
+    parameters = db.Column(db.UnicodeText(), info={"json": True})
+    pages_done = db.Column(db.Integer)
+    pages_total = db.Column(db.Integer)
+    started = db.Column(db.DateTime)
+    finished = db.Column(db.DateTime)
+    errors = db.Column(db.UnicodeText(), info={"json": True})
+    result = db.Column(db.UnicodeText())
+
 
 class ContentType(db.Model):
     """This table holds metadata necessary to save and render content types"""
 
     name = db.Column(db.String(200), index=True)
     content_class = db.Column(db.String(200))
-    editable_fields = db.Column(db.UnicodeText())
-    viewable_fields = db.Column(db.UnicodeText())
+    editable_fields = db.Column(db.UnicodeText(), info={"json": True})
+    viewable_fields = db.Column(db.UnicodeText(), info={"json": True})
     edit_url = db.Column(db.String(100))
     view_url = db.Column(db.String(100))
     # There will be more here for controllers and views but this gets us started
@@ -96,14 +179,24 @@ class ContentTypeRevision(db.Model):
     """This table holds metadata necessary to save and render content types"""
 
     _version = db.Column(db.Integer, primary_key=True, index=True)  # Revision override
+    _delta = db.Column(db.LargeBinary, info={"hashed": False})  # See core.revisions
     name = db.Column(db.String(200), index=True)
     content_class = db.Column(db.String(200))
-    editable_fields = db.Column(db.UnicodeText())
-    viewable_fields = db.Column(db.UnicodeText())
+    editable_fields = db.Column(db.UnicodeText(), info={"json": True})
+    viewable_fields = db.Column(db.UnicodeText(), info={"json": True})
     edit_url = db.Column(db.String(100))
     view_url = db.Column(db.String(100))
     # There will be more here for controllers and views but this gets us started
 
+    __table_args__ = (
+        db.Index(
+            "ix_content_type_revision__node_id__version",
+            "_node_id",
+            "_version",
+            unique=True,
+        ),
+    )
+
 
 class User(UserMixin, db.Model):
     """User content type"""
@@ -112,8 +205,10 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(64), index=True, unique=True)
     email = db.Column(db.String(120), index=True, unique=True)
     password_hash = db.Column(db.String(128))
-    last_login = db.Column(db.DateTime, default=datetime.utcnow)
-    roles = db.Column(db.UnicodeText())
+    last_login = db.Column(
+        db.DateTime, default=datetime.utcnow, info={"hashed": False}
+    )  # Written on every login without a new version
+    roles = db.Column(db.UnicodeText(), info={"json": True})
 
     # def __repr__(self):
     #     return {"_id": self._id, "_node_id": self.node_id, "username": self.username}
@@ -133,11 +228,20 @@ class UserRevision(UserMixin, db.Model):
     """User revision table"""
 
     _version = db.Column(db.Integer, primary_key=True, index=True)  # Revision override
+    _delta = db.Column(db.LargeBinary, info={"hashed": False})  # See core.revisions
     username = db.Column(db.String(64), index=True, unique=True)
     email = db.Column(db.String(120), index=True, unique=True)
     password_hash = db.Column(db.String(128))
-    last_login = db.Column(db.DateTime, default=datetime.utcnow)
-    roles = db.Column(db.UnicodeText())
+    last_login = db.Column(
+        db.DateTime, default=datetime.utcnow, info={"hashed": False}
+    )  # Written on every login without a new version
+    roles = db.Column(db.UnicodeText(), info={"json": True})
+
+    __table_args__ = (
+        db.Index(
+            "ix_user_revision__node_id__version", "_node_id", "_version", unique=True
+        ),
+    )
 
     def __repr__(self):
         return {"_id": self._id, "_node_id": self.node_id, "username": self.username}
@@ -167,36 +271,50 @@ class ArticleRevision(db.Model):
     # content_type = db.Column(db.Integer) # After we build the type system
     # Common fields
     _version = db.Column(db.Integer, primary_key=True, index=True)  # Revision override
+    _delta = db.Column(db.LargeBinary, info={"hashed": False})  # See core.revisions
     title = db.Column(db.String(200))
     body = db.Column(db.UnicodeText())
 
+    __table_args__ = (
+        db.Index(
+            "ix_article_revision__node_id__version", "_node_id", "_version", unique=True
+        ),
+    )
+
 
 class Site(db.Model):
     """A delivery endpoint to publish content to"""
 
     site_name = db.Column(db.String(200))
     environment_name = db.Column(db.String(200))
-    last_published = db.Column(db.DateTime)
+    last_published = db.Column(db.DateTime, info={"hashed": False})
     local_build_dir = db.Column(db.String(200))
     static_files_dir = db.Column(db.String(200))
     hosting_type = db.Column(db.String(100))
-    content_hash = db.Column(db.String(200))
+    content_hash = db.Column(db.String(200), info={"hashed": False})  # Merkle root
     index_content = db.Column(db.String(200))
-    menu_content = db.Column(db.UnicodeText())
-    groups_content = db.Column(db.UnicodeText())
+    menu_content = db.Column(db.UnicodeText(), info={"json": True})
+    groups_content = db.Column(db.UnicodeText(), info={"json": True})
 
 
 class SiteRevision(db.Model):
     """A delivery endpoint to publish content to"""
 
     _version = db.Column(db.Integer, primary_key=True, index=True)  # Revision override
+    _delta = db.Column(db.LargeBinary, info={"hashed": False})  # See core.revisions
     site_name = db.Column(db.String(200))
     environment_name = db.Column(db.String(200))
-    last_published = db.Column(db.DateTime)
+    last_published = db.Column(db.DateTime, info={"hashed": False})
     local_build_dir = db.Column(db.String(200))
     static_files_dir = db.Column(db.String(200))
     hosting_type = db.Column(db.String(100))
-    content_hash = db.Column(db.String(200))
+    content_hash = db.Column(db.String(200), info={"hashed": False})  # Merkle root
     index_content = db.Column(db.String(200))
-    menu_content = db.Column(db.UnicodeText())
-    groups_content = db.Column(db.UnicodeText())
+    menu_content = db.Column(db.UnicodeText(), info={"json": True})
+    groups_content = db.Column(db.UnicodeText(), info={"json": True})
+
+    __table_args__ = (
+        db.Index(
+            "ix_site_revision__node_id__version", "_node_id", "_version", unique=True
+        ),
+    )
@@ -0,0 +1,98 @@
+from sqlalchemy.orm import Session
+from core import db
+from core import models
+import threading
+import logging
+import json
+
+"""Process wide registry of content types and their resolved database models."""
+
+"""Content types change rarely but are looked up for every piece of content loaded or
+saved, so they are read once into memory and held here keyed by their _node_id and by
+their name.  Each entry is a dict of:
+
+    "type": the ContentType row (detached from any session, treat as read only)
+    "content_class": the resolved SQL Alchemy model class
+    "editable_fields": the parsed editable_fields JSON
+    "viewable_fields": the parsed viewable_fields JSON
+
+Anything that writes to the content_type table must call invalidate() after committing.
+"""
+
+_registry_lock = threading.Lock()
+_registry = None
+
+
+def _parse_fields(fields):
+    if not fields:
+        return {}
+    try:
+        return json.loads(fields)
+    except ValueError:
+        logging.error(f"Content type fields are not valid JSON: {fields}")
+        return {}
+
+
+def load_registry():
+    """Read every content type row and resolve its model class"""
+    global _registry
+
+    with _registry_lock:
+        # A private session so the registry rows never share an identity map with the
+        # request session, closing it leaves the rows detached but fully loaded
+        session = Session(bind=db.engine)
+        try:
+            content_types = session.query(models.ContentType).all()
+        finally:
+            session.close()
+
+        by_node_id = {}
+        by_name = {}
+        for content_type in content_types:
+            content_class = getattr(models, content_type.content_class, None)
+            if content_class is None:
+                logging.error(
+                    f"Content type '{content_type.name}' has unknown class '{content_type.content_class}'"
+                )
+                continue
+            entry = {
+                "type": content_type,
+                "content_class": content_class,
+                "editable_fields": _parse_fields(content_type.editable_fields),
+                "viewable_fields": _parse_fields(content_type.viewable_fields),
+            }
+            by_node_id[content_type._node_id] = entry
+            by_name[content_type.name] = entry
+
+        _registry = {"node_id": by_node_id, "name": by_name}
+        return _registry
+
+
+def invalidate():
+    """Drop the registry, it is rebuilt on the next lookup"""
+    global _registry
+
+    with _registry_lock:
+        _registry = None
+
+
+def _get_registry():
+    registry = _registry
+    if registry is None:
+        registry = load_registry()
+    return registry
+
+
+def get_by_node_id(node_id):
+    """Return the registry entry for a content type _node_id or None"""
+    return _get_registry()["node_id"].get(node_id)
+
+
+def get_by_name(name):
+    """Return the registry entry for a content type name or None"""
+    return _get_registry()["name"].get(name)
+
+
+def all_types():
+    """Return the registry entries of every content type"""
+    return list(_get_registry()["name"].values())
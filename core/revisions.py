@@ -0,0 +1,220 @@
+from sqlalchemy import UnicodeText, select
+from difflib import SequenceMatcher
+from functools import lru_cache
+from core import app, db
+from core import registry
+from core.models import (
+    Node,
+    NodeRevision,
+    ContentType,
+    ContentTypeRevision,
+    User,
+    UserRevision,
+    Article,
+    ArticleRevision,
+    Site,
+    SiteRevision,
+)
+import json
+import zlib
+import re
+
+"""Revision storage, full snapshots with reverse deltas in between."""
+
+"""A revision row starts out as a full copy of the content row it replaces.  When the
+next revision of the same row is saved the previous one is reduced to a delta against
+it: its text columns are set to None and "_delta" holds the zlib compressed edits that
+turn the next version's text back into its own.  Every REVISION_SNAPSHOT_INTERVAL-th
+version and the newest revision stay full, so reconstructing any version applies at
+most REVISION_SNAPSHOT_INTERVAL deltas, walking down from the nearest full row above.
+
+Only the text columns are delta encoded, the hashes, ids and other small columns stay
+in every row.  The stored _hash and _hash_chain are those of the full version.
+"""
+
+DELTA_FORMAT = 1
+
+# Content models and the revision models holding their previous versions
+REVISION_MODELS = {
+    Node: NodeRevision,
+    ContentType: ContentTypeRevision,
+    User: UserRevision,
+    Article: ArticleRevision,
+    Site: SiteRevision,
+}
+
+# Text is diffed in segments ending at a newline, a sentence or an HTML tag
+_SEGMENT = re.compile(r"[^\n.>]*[\n.>]|[^\n.>]+")
+
+
+@lru_cache(maxsize=None)
+def delta_columns(RevisionModel):
+    """The keys of the columns of a revision model stored as deltas"""
+    return tuple(
+        sorted(
+            column.key
+            for column in RevisionModel.__table__.columns
+            if isinstance(column.type, UnicodeText)
+        )
+    )
+
+
+def _segments(value):
+    return _SEGMENT.findall(value)
+
+
+def diff(value, target):
+    """Edits rebuilding value from target, [start, end] copies target segments"""
+    if value is None:
+        return None
+    if target is None:
+        return [value] if value else []
+    target_segments = _segments(target)
+    segments = _segments(value)
+
+    # Most edits are local, only the middle between the common ends is matched
+    prefix = 0
+    limit = min(len(segments), len(target_segments))
+    while prefix < limit and segments[prefix] == target_segments[prefix]:
+        prefix += 1
+    suffix = 0
+    while (
+        suffix < limit - prefix
+        and segments[-suffix - 1] == target_segments[-suffix - 1]
+    ):
+        suffix += 1
+    target_end = len(target_segments) - suffix
+    matcher = SequenceMatcher(
+        None,
+        target_segments[prefix:target_end],
+        segments[prefix : len(segments) - suffix],
+    )
+
+    ops = [[0, prefix]] if prefix else []
+    for tag, target_start, target_stop, start, end in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([prefix + target_start, prefix + target_stop])
+        elif start != end:
+            ops.append("".join(matcher.b[start:end]))
+    if suffix:
+        ops.append([target_end, len(target_segments)])
+    return ops
+
+
+def patch(ops, target):
+    """Apply the edits of diff() to target"""
+    if ops is None:
+        return None
+    target_segments = _segments(target) if target else []
+    parts = []
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(target_segments[op[0] : op[1]])
+    return "".join(parts)
+
+
+def encode_delta(RevisionModel, values, next_values):
+    """The _delta of a revision's column values against those of the next version"""
+    delta = {
+        key: diff(values.get(key), next_values.get(key))
+        for key in delta_columns(RevisionModel)
+    }
+    delta["format"] = DELTA_FORMAT
+    return zlib.compress(json.dumps(delta, separators=(",", ":")).encode(), 9)
+
+
+def decode_delta(RevisionModel, delta, next_values):
+    """The text column values a _delta encodes given those of the next version"""
+    delta = json.loads(zlib.decompress(delta))
+    if delta.get("format") != DELTA_FORMAT:
+        raise ValueError(f"Unknown revision delta format {delta.get('format')}")
+    return {
+        key: patch(delta.get(key), next_values.get(key))
+        for key in delta_columns(RevisionModel)
+    }
+
+
+def is_snapshot(version):
+    return not version or version % app.config["REVISION_SNAPSHOT_INTERVAL"] == 0
+
+
+def deltify_previous(revision):
+    """Reduce the revision before a newly saved full revision to a delta against it"""
+    RevisionModel = type(revision)
+    previous_version = (revision._version or 1) - 1
+    if is_snapshot(previous_version):
+        return None
+    previous = RevisionModel.query.get((revision._id, previous_version))
+    if previous is None or previous._delta is not None:
+        return None
+    columns = delta_columns(RevisionModel)
+    previous._delta = encode_delta(
+        RevisionModel,
+        {key: getattr(previous, key) for key in columns},
+        {key: getattr(revision, key) for key in columns},
+    )
+    for key in columns:
+        setattr(previous, key, None)
+    db.session.add(previous)
+    return previous
+
+
+def expand(RevisionModel, rows):
+    """Full column values of the revision rows (dicts) of one _id, newest first"""
+
+    """A delta row whose next version is not among the rows is returned as stored.
+    """
+    columns = delta_columns(RevisionModel)
+    expanded = []
+    by_version = {}
+    for row in sorted(rows, key=lambda row: row["_version"] or 0, reverse=True):
+        row = dict(row)
+        next_values = by_version.get((row["_version"] or 0) + 1)
+        if row.get("_delta") is not None and next_values is not None:
+            row.update(decode_delta(RevisionModel, row["_delta"], next_values))
+            row["_delta"] = None
+        if row.get("_delta") is None:
+            by_version[row["_version"] or 0] = {key: row[key] for key in columns}
+        expanded.append(row)
+    return expanded
+
+
+def _row_values(Model, row):
+    return {column.key: getattr(row, column.key) for column in Model.__table__.columns}
+
+
+def reconstruct(node_id, version):
+    """The column values of a node's content at a version as a dict, or None"""
+    node = Node.query.get(int(node_id))
+    if node is None:
+        return None
+    registered_type = registry.get_by_node_id(node.content_type_id)
+    if not registered_type:
+        return None
+    ContentClass = registered_type["content_class"]
+    content = ContentClass.query.get(node.content_id)
+    if content is not None and content._version == int(version):
+        return _row_values(ContentClass, content)
+
+    # The rows from the version up to the nearest snapshot, which is full
+    RevisionModel = REVISION_MODELS[ContentClass]
+    table = RevisionModel.__table__
+    rows = db.session.execute(
+        select([table]).where(
+            (table.c._node_id == node._id)
+            & (table.c._version >= int(version))
+            & (
+                table.c._version
+                <= int(version) + app.config["REVISION_SNAPSHOT_INTERVAL"]
+            )
+        )
+    ).fetchall()
+    for row in expand(RevisionModel, [dict(row) for row in rows]):
+        if row["_version"] == int(version):
+            if row["_delta"] is not None:
+                return None
+            del row["_delta"]
+            return row
+    return None
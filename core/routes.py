@@ -1,4 +1,4 @@
-from flask import render_template, flash, redirect, request, url_for
+from flask import render_template, flash, redirect, request, url_for, jsonify
 from flask_login import (
     current_user,
     login_user,
@@ -7,19 +7,24 @@ from flask_login import (
     login_manager,
 )
 from core import app, db, login
+from core import registry
+from core import cache as content_cache
+from core import jobs
 from core.forms import (
     LoginForm,
     EditContentTypeForm,
     EditUserForm,
     EditArticleForm,
     EditSiteForm,
-    BuildSiteForm,
+    StartSiteBuildForm,
 )
 from core.controllers import (
+    EditConflict,
     normalize_form_input,
     save_user,
     save_article,
     save_site,
+    save_content_type,
     load_node,
     load_content,
     load,
@@ -39,6 +44,7 @@ def setup_cms():
     """Check that the root user is set, if not set it and the content types."""
     if not User.query.all():  # The implied short circuit
         import core.init_cms
+    registry.load_registry()
 
 
 @app.before_request
@@ -69,8 +75,10 @@ def load_user(id):
 @app.route("/index")
 def index():
     """Route for the base URL"""
-    articles = views.view_front_page()
-    return render_template("index.html", title="", articles=articles)
+    articles, next_cursor = views.view_front_page(request.args.get("before"))
+    return render_template(
+        "index.html", title="", articles=articles, next_cursor=next_cursor
+    )
 
 
 @app.route("/login", methods=["GET", "POST"])
@@ -141,6 +149,37 @@ def view_user(node):
     )
 
 
+def merge_view(form, conflict, title):
+    """Return an edit lost to a concurrent save beside the current version"""
+
+    """The form keeps the submitted values and now carries the current version, so
+    saving it again deliberately replaces what the other editor saved.
+    """
+    content = load_content(load_node(conflict.node_id))
+    changes = []
+    for field in form:
+        if field.name.startswith("hidden_") or not hasattr(
+            content["content"], field.name
+        ):
+            continue
+        current = getattr(content["content"], field.name)
+        if str(current) != str(field.data):
+            changes.append((field.label.text, current, field.data))
+    form.hidden_content_version.data = content["content"]._version
+    form.hidden_content_hash.data = content["content"]._hash
+    return (
+        render_template(
+            "merge_conflict.html",
+            title=title,
+            form=form,
+            content=content,
+            changes=changes,
+            expected_version=conflict.expected_version,
+        ),
+        409,
+    )
+
+
 @app.route("/edit/article/", methods=["GET", "POST"])
 @app.route("/edit/article/<node>", methods=["GET", "POST"])
 @login_required
@@ -148,12 +187,14 @@ def edit_article(node=None):
     """Edit or create an article as per the <node> overloading."""
     form = EditArticleForm()
     if form.validate_on_submit():
-        save_article(normalize_form_input(form))
+        try:
+            save_article(normalize_form_input(form))
+        except EditConflict as conflict:
+            return merge_view(form, conflict, "Merge Article")
         flash("Article saved.")
         return redirect(url_for("content_control"))
     if node:  # Edit an existing article
         content = load_content(load_node(node))
-        # @TODO check locks here
         return render_template(
             "edit_article.html", title="Edit Article", form=form, content=content,
         )
@@ -187,7 +228,10 @@ def edit_site(node=None):
     form.last_site.choices = publishing_options
     form.next_site.choices = publishing_options
     if form.validate_on_submit():
-        save_site(normalize_form_input(form))
+        try:
+            save_site(normalize_form_input(form))
+        except EditConflict as conflict:
+            return merge_view(form, conflict, "Merge Site")
         flash("Site saved.")
         return redirect(url_for("site_control"))
     if node:
@@ -206,27 +250,51 @@ def edit_site(node=None):
 def view_site(node):
     """View a site using a generic view and template, POST for site actions"""
     content = views.view_node(node)
-    build_form = BuildSiteForm()
-    if build_form.validate_on_submit:
-        from core.builders import build_static_site
-
-        site_input = normalize_form_input(build_form)
-        build_output = build_static_site(site_input)
-        flash(build_output)
+    build_form = StartSiteBuildForm()
+    if build_form.validate_on_submit():
+        # Build from the stored site, never from directories posted with the form
+        site_input = {
+            "local_build_dir": content["content"].local_build_dir,
+            "static_files_dir": content["content"].static_files_dir,
+        }
+        job, submitted = jobs.submit_build(content["node"]._id, site_input)
+        if submitted:
+            flash(f"Site build queued as job {job._id}.")
+        else:
+            flash(f"This site is already being built by job {job._id}.")
+        return redirect(url_for("view_site", node=content["node"]._id))
     return render_template(
-        "view_site_and_build.html", content=content, build_form=build_form
+        "view_site_and_build.html",
+        content=content,
+        build_form=build_form,
+        build_job=jobs.latest_job(content["node"]._id),
     )
 
 
+@app.route("/jobs/<int:job_id>", methods=["GET"])
+@login_required
+def job_status(job_id):
+    """Progress of a background job as JSON, for polling"""
+    job = jobs.load_job(job_id)
+    if not job:
+        response = jsonify({"error": f"Job {job_id} not found"})
+        response.status_code = 404
+        return response
+    return jsonify(jobs.status(job))
+
+
 @app.route("/edit/content-type/", methods=["GET", "POST"])
 @app.route("/edit/content-type/<node>", methods=["GET", "POST"])
 @login_required
 def edit_content_type(node=None):
     form = EditContentTypeForm()
     if form.validate_on_submit():
-        save_content_type(normalize_form_input(form))
+        try:
+            save_content_type(normalize_form_input(form))
+        except EditConflict as conflict:
+            return merge_view(form, conflict, "Merge Content Type")
         flash("Content Type Saved")
-        return redirector(url_for("content_control"))
+        return redirect(url_for("content_control"))
     if node:
         content = load(node)
         return render_template(
@@ -258,16 +326,24 @@ def view_content_type(node):
 @app.route("/view/articles-list")
 def view_articles_list():
     """View a list of all articles by title linked to article view"""
-    table_content = views.view_all_articles()
-    return render_template("view_all_articles.html", table_content=table_content)
+    table_content, next_cursor = views.view_all_articles(request.args.get("before"))
+    return render_template(
+        "view_all_articles.html", table_content=table_content, next_cursor=next_cursor
+    )
 
 
 @app.route("/content-control")
 @login_required
 def content_control():
     """Primary content control mechanism"""
-    content = views.view_content_control()
-    return render_template("content-control.html", content=content)
+    return render_template("content-control.html")
+
+
+@app.route("/content-control/data")
+@login_required
+def content_control_data():
+    """Remote pagination, sorting and filtering endpoint for the content control table"""
+    return jsonify(views.view_content_control(request.args))
 
 
 @app.route("/site-control")
@@ -278,6 +354,13 @@ def site_control():
     return render_template("site-control.html", content=content)
 
 
+@app.route("/debug/cache", methods=["GET"])
+@login_required
+def debug_cache():
+    """Content cache hit, miss and eviction counters"""
+    return json.dumps(content_cache.stats(), indent=4)
+
+
 @app.route("/debug", methods=["GET"])
 @login_required
 def debug_something():
@@ -0,0 +1,137 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from functools import lru_cache
+from lxml.html.clean import Cleaner
+from core import app
+import multiprocessing
+import threading
+import hashlib
+
+"""HTML sanitization of content fields before they are saved."""
+
+"""Sanitized fields are rendered unescaped by the templates, so every create and update
+path runs them through here.  Each policy is a preconfigured lxml Cleaner built once
+per process, FIELD_POLICIES names the policy of each sanitized field by content class.
+
+Cleaning parses the whole document, for large pasted bodies that dominates the save.
+The output is cached by a digest of the policy and input, so an unchanged field saved
+again is not cleaned again.  Fields of SANITIZE_POOL_THRESHOLD characters or more are
+cleaned in a pool of SANITIZE_WORKERS processes, off the GIL of the request threads and
+in parallel with the other large fields of the same save or import batch.
+"""
+
+# Keyword arguments of lxml.html.clean.Cleaner for each policy
+POLICIES = {
+    "html": {},  # The defaults of lxml's clean_html()
+}
+
+# The policy of each sanitized field, by content class name
+FIELD_POLICIES = {
+    "Article": {"title": "html", "body": "html"},
+}
+
+_cache_lock = threading.Lock()
+_cache = OrderedDict()  # digest -> sanitized value
+_stats = {"hits": 0, "misses": 0, "pooled": 0}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _cleaner(policy):
+    return Cleaner(**POLICIES[policy])
+
+
+def clean(policy, value):
+    """Sanitize one value with a policy, uncached, this runs in the pool workers"""
+    return _cleaner(policy).clean_html(value)
+
+
+def _get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            # Spawned, not forked, the pool starts from request threads and a forked
+            # child would inherit their held locks and the parent's DB connections
+            _executor = ProcessPoolExecutor(
+                max_workers=app.config["SANITIZE_WORKERS"],
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _digest(policy, value):
+    return hashlib.sha256(f"{policy}\0{value}".encode()).hexdigest()
+
+
+def _cached(digest):
+    with _cache_lock:
+        value = _cache.get(digest)
+        if value is None:
+            _stats["misses"] += 1
+            return None
+        _cache.move_to_end(digest)
+        _stats["hits"] += 1
+        return value
+
+
+def _put(digest, value):
+    if app.config["SANITIZE_CACHE_SIZE"] <= 0:
+        return
+    with _cache_lock:
+        _cache[digest] = value
+        _cache.move_to_end(digest)
+        while len(_cache) > app.config["SANITIZE_CACHE_SIZE"]:
+            _cache.popitem(last=False)
+
+
+def sanitize_many(content_class_name, records):
+    """Return copies of field dicts with the fields of the content class sanitized"""
+
+    """Empty values and fields without a policy are left as they are.  Large values
+    missing from the cache are cleaned concurrently in the pool.
+    """
+    policies = FIELD_POLICIES.get(content_class_name, {})
+    sanitized = [dict(record) for record in records]
+    pending = []  # (record, key, digest, future)
+    for record in sanitized:
+        for key, policy in policies.items():
+            value = record.get(key)
+            if not value:
+                continue
+            digest = _digest(policy, value)
+            cached = _cached(digest)
+            if cached is not None:
+                record[key] = cached
+            elif (
+                app.config["SANITIZE_WORKERS"] > 0
+                and len(value) >= app.config["SANITIZE_POOL_THRESHOLD"]
+            ):
+                future = _get_executor().submit(clean, policy, value)
+                pending.append((record, key, digest, future))
+                _stats["pooled"] += 1
+            else:
+                record[key] = clean(policy, value)
+                _put(digest, record[key])
+
+    for record, key, digest, future in pending:
+        record[key] = future.result()
+        _put(digest, record[key])
+    return sanitized
+
+
+def sanitize(content_class_name, fields):
+    """Return a copy of one field dict with its sanitized fields cleaned"""
+    return sanitize_many(content_class_name, [fields])[0]
+
+
+def stats():
+    with _cache_lock:
+        return dict(_stats, size=len(_cache))
+
+
+def clear():
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,107 @@
+from sqlalchemy import DateTime
+from functools import lru_cache
+import json
+
+"""Serializers compiled once per model class from its column types."""
+
+"""dictify_content() used to inspect the type of every value of every row and sniff
+every string for JSON, here that work is done once per model: each column gets an
+encoder chosen from its type (and the info={"json": True} marker on JSON document
+columns) and rows are then converted with a plain loop over the precomputed plan.
+"""
+
+
+def _encode_datetime(value):
+    return None if value is None else str(value)
+
+
+def _decode_json(value):
+    """JSON document columns are decoded to native types, anything else is kept as is"""
+    if value and value[0] in "[{":
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _column_encoder(column):
+    if column.info.get("json"):
+        return _decode_json
+    if isinstance(column.type, DateTime):
+        return _encode_datetime
+    return None  # Values that are already JSON native
+
+
+@lru_cache(maxsize=None)
+def _compile(ContentClass, fields):
+    """Split the columns of a model into plain copies and encoded values"""
+    plain_keys = []
+    encoded_keys = []
+    for column in ContentClass.__table__.columns:
+        if fields is not None and column.key not in fields:
+            continue
+        encoder = _column_encoder(column)
+        if encoder is None:
+            plain_keys.append(column.key)
+        else:
+            encoded_keys.append((column.key, encoder))
+    plain_keys = tuple(plain_keys)
+    encoded_keys = tuple(encoded_keys)
+
+    def serialize(row):
+        values = row.__dict__
+        serialized = {key: values[key] for key in plain_keys if key in values}
+        for key, encode in encoded_keys:
+            if key in values:
+                serialized[key] = encode(values[key])
+        return serialized
+
+    return serialize
+
+
+def serializer_for(ContentClass, fields=None):
+    """Return a function converting rows of ContentClass to JSON ready dicts"""
+
+    """"fields" limits the output to those column names, for example the keys of a
+    content type's viewable_fields plus any metadata columns wanted.  Only loaded
+    attributes are serialized, deferred columns are never loaded by serializing.
+    """
+    if fields is not None:
+        fields = frozenset(fields)
+    return _compile(ContentClass, fields)
+
+
+def viewable_serializer(registered_type, extra_fields=()):
+    """The serializer for a registry entry's viewable_fields plus any extra_fields"""
+    fields = list(extra_fields) + list(registered_type["viewable_fields"].keys())
+    return serializer_for(registered_type["content_class"], fields)
+
+
+def serialize(row, fields=None):
+    """Serialize one row with the compiled serializer of its class"""
+    return serializer_for(type(row), fields)(row)
+
+
+def serialize_content(content, fields=None):
+    """Serialize a content dict to {"node": {...}, "content": {...}, "type": {...}}"""
+    return {
+        "node": serialize(content["node"]),
+        "content": serialize(content["content"], fields),
+        "type": serialize(content["type"]),
+    }
+
+
+def stream_json(items, encode=serialize_content):
+    """Yield a JSON array of encoded items a piece at a time"""
+
+    """For wrapping in a streamed Flask response so large listings are never held in
+    memory as one document, each item is encoded and emitted as it is reached.
+    """
+    yield "["
+    separator = ""
+    for item in items:
+        yield separator
+        yield json.dumps(encode(item))
+        separator = ","
+    yield "]"
@@ -0,0 +1,414 @@
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import select, func, and_, bindparam
+from core import app, db
+from core import hashing
+from core import merkle
+from core import revisions
+from core.models import (
+    Node,
+    NodeRevision,
+    ContentType,
+    ContentTypeRevision,
+    User,
+    UserRevision,
+    Article,
+    ArticleRevision,
+    Site,
+    SiteRevision,
+)
+from datetime import datetime
+from itertools import groupby
+import traceback
+import hashlib
+import logging
+import json
+import os
+
+"""Integrity verification of the _hash and _hash_chain of every row."""
+
+"""Each table is split into chunks of VERIFY_CHUNK_SIZE ids that are verified in a
+process pool.  A row's _hash is recomputed from its columns, its _hash_chain is
+recomputed from its columns with the _hash_chain of the previous version, read from
+the revision table, as the save pipeline chained it.  Revision rows stored as deltas
+are reconstructed first, see core.revisions.
+
+The checkpoint file records a digest of the stored (_id, _version, _hash, _hash_chain)
+of every verified chunk.  The next run reads only those four columns to recompute the
+digest and skips the chunks where it is unchanged, so only chunks with rows written
+since the last run are verified again.  Chunks with mismatches are always verified
+again.  Pass full=True to ignore the checkpoint.
+
+Rows hashed before the canonical encoding of core.hashing have digests of the JSON of
+whatever attributes the instance had loaded, which can't be recomputed.  rehash()
+replaces the _hash and _hash_chain of every row with the canonical ones, run it once
+after upgrading and before the first verify, it trusts the rows as they are stored.
+"""
+
+CHECKPOINT_FORMAT = 1
+
+# Content tables and the revision tables holding their previous versions, revision
+# tables hold their own previous versions
+VERIFIED_MODELS = {
+    Model.__tablename__: (Model, RevisionModel)
+    for Model, RevisionModel in (
+        (Node, NodeRevision),
+        (ContentType, ContentTypeRevision),
+        (User, UserRevision),
+        (Article, ArticleRevision),
+        (Site, SiteRevision),
+        (NodeRevision, NodeRevision),
+        (ContentTypeRevision, ContentTypeRevision),
+        (UserRevision, UserRevision),
+        (ArticleRevision, ArticleRevision),
+        (SiteRevision, SiteRevision),
+    )
+}
+
+
+def _chunk_range(chunk, chunk_size):
+    return chunk * chunk_size, (chunk + 1) * chunk_size
+
+
+def _stored_digest(connection, table, first_id, last_id):
+    """Digest of the stored hashes of a chunk, reads none of the content columns"""
+    digest = hashlib.sha256()
+    rows = 0
+    for row in connection.execute(
+        select([table.c._id, table.c._version, table.c._hash, table.c._hash_chain])
+        .where(and_(table.c._id >= first_id, table.c._id < last_id))
+        .order_by(table.c._id, table.c._version)
+    ):
+        digest.update(
+            f"{row._id}:{row._version}:{row._hash}:{row._hash_chain};".encode()
+        )
+        rows += 1
+    return digest.hexdigest(), rows
+
+
+def _previous_chains(connection, RevisionModel, first_id, last_id):
+    """(_id, _version) -> _hash_chain of the revisions in an id range"""
+    table = RevisionModel.__table__
+    return {
+        (row._id, row._version): row._hash_chain
+        for row in connection.execute(
+            select([table.c._id, table.c._version, table.c._hash_chain]).where(
+                and_(table.c._id >= first_id, table.c._id < last_id)
+            )
+        )
+    }
+
+
+def _expanded(Model, rows):
+    """Revision rows with their deltas applied, in (_id, _version) order"""
+    for _id, id_rows in groupby(rows, key=lambda row: row["_id"]):
+        expanded = revisions.expand(Model, [dict(row) for row in id_rows])
+        yield from reversed(expanded)
+
+
+def _mismatch(table_name, row, check, stored, computed):
+    return {
+        "table": table_name,
+        "_id": row["_id"],
+        "_version": row["_version"],
+        "check": check,
+        "stored": stored,
+        "computed": computed,
+    }
+
+
+def verify_row(table_name, Model, row, previous_chains):
+    """Returns the list of mismatches of one row given as a dict of its columns"""
+    mismatches = []
+    algorithm = hashing.algorithm_of(row["_hash"])
+    computed = hashing.hash_mapping(Model, row, algorithm=algorithm)
+    if computed != row["_hash"]:
+        mismatches.append(_mismatch(table_name, row, "_hash", row["_hash"], computed))
+
+    version = row["_version"] or 1
+    if version > 1:
+        previous_key = (row["_id"], version - 1)
+        if previous_key not in previous_chains:
+            mismatches.append(
+                _mismatch(table_name, row, "missing_revision", None, None)
+            )
+            return mismatches
+        previous_chain = previous_chains[previous_key]
+    else:
+        previous_chain = None
+    chain_algorithm = hashing.algorithm_of(row["_hash_chain"])
+    computed_chain = hashing.hash_mapping(
+        Model, dict(row, _hash_chain=previous_chain), True, chain_algorithm
+    )
+    if computed_chain != row["_hash_chain"]:
+        mismatches.append(
+            _mismatch(
+                table_name, row, "_hash_chain", row["_hash_chain"], computed_chain
+            )
+        )
+    return mismatches
+
+
+def _init_worker():
+    # Connections inherited from the parent process must not be shared
+    db.engine.dispose()
+
+
+def verify_chunk(task):
+    """Verify one chunk of a table, run in the process pool"""
+
+    """"task" is (table name, chunk number, chunk size, checkpointed digest or None).
+    Returns a dict of the chunk's stored digest, row counts and mismatches.
+    """
+    table_name, chunk, chunk_size, checkpointed_digest = task
+    Model, RevisionModel = VERIFIED_MODELS[table_name]
+    table = Model.__table__
+    first_id, last_id = _chunk_range(chunk, chunk_size)
+    result = {
+        "table": table_name,
+        "chunk": chunk,
+        "digest": None,
+        "rows": 0,
+        "unhashed": 0,
+        "skipped": False,
+        "last_key": None,
+        "mismatches": [],
+    }
+    try:
+        with db.engine.connect() as connection:
+            digest, rows = _stored_digest(connection, table, first_id, last_id)
+            result["digest"] = digest
+            result["rows"] = rows
+            if digest == checkpointed_digest:
+                result["skipped"] = True
+                return result
+
+            previous_chains = _previous_chains(
+                connection, RevisionModel, first_id, last_id
+            )
+            rows = connection.execute(
+                select([table])
+                .where(and_(table.c._id >= first_id, table.c._id < last_id))
+                .order_by(table.c._id, table.c._version)
+            )
+            if Model in revisions.REVISION_MODELS.values():
+                rows = _expanded(Model, rows)
+            for row in rows:
+                row = dict(row)
+                result["last_key"] = [row["_id"], row["_version"]]
+                if not row["_hash"] and not row["_hash_chain"]:
+                    result["unhashed"] += 1  # Never hashed, nothing to verify
+                    continue
+                if row.get("_delta") is not None:
+                    result["mismatches"].append(
+                        _mismatch(table_name, row, "missing_delta_base", None, None)
+                    )
+                    continue
+                result["mismatches"].extend(
+                    verify_row(table_name, Model, row, previous_chains)
+                )
+    except Exception as e:
+        logging.error(traceback.format_exc())
+        result["mismatches"].append(
+            {
+                "table": table_name,
+                "chunk": chunk,
+                "check": "error",
+                "stored": None,
+                "computed": str(e),
+            }
+        )
+    return result
+
+
+def _rehash_chunk(connection, Model, RevisionModel, first_id, last_id):
+    """Recompute and store the hashes of the rows of one chunk, returns their count"""
+    table = Model.__table__
+    previous_chains = _previous_chains(connection, RevisionModel, first_id, last_id)
+    rows = connection.execute(
+        select([table])
+        .where(and_(table.c._id >= first_id, table.c._id < last_id))
+        .order_by(table.c._id, table.c._version)
+    )
+    if Model in revisions.REVISION_MODELS.values():
+        rows = _expanded(Model, rows)
+    updates = []
+    for row in rows:
+        row = dict(row)
+        if not row["_hash"] and not row["_hash_chain"]:
+            continue  # Never hashed, as verify leaves it
+        if row.get("_delta") is not None:
+            logging.error(
+                f"Rehash skipped {table.name} {row['_id']} version {row['_version']},"
+                " its delta has no base"
+            )
+            continue
+        version = row["_version"] or 1
+        previous_chain = previous_chains.get((row["_id"], version - 1))
+        row["_hash"] = hashing.hash_mapping(Model, row)
+        row["_hash_chain"] = hashing.hash_mapping(
+            Model, dict(row, _hash_chain=previous_chain), True
+        )
+        if Model is RevisionModel:
+            # The next version of this id chains from the chain just computed
+            previous_chains[(row["_id"], version)] = row["_hash_chain"]
+        updates.append(
+            {
+                "key_id": row["_id"],
+                "key_version": row["_version"],
+                "_hash": row["_hash"],
+                "_hash_chain": row["_hash_chain"],
+            }
+        )
+    if updates:
+        key = table.c._id == bindparam("key_id")
+        if Model is RevisionModel:
+            key = and_(key, table.c._version == bindparam("key_version"))
+        connection.execute(
+            table.update()
+            .where(key)
+            .values(
+                _hash=bindparam("_hash"), _hash_chain=bindparam("_hash_chain")
+            ),
+            updates,
+        )
+    return len(updates)
+
+
+def rehash(tables=None):
+    """Replace the stored hashes with the canonical ones, returns rows per table"""
+
+    """Revision tables go first, the _hash_chain of a content row is chained from
+    the one of its previous version in the revision table.  Each chunk is committed
+    on its own.  The Merkle trees of the sites are rebuilt from the new hashes.
+    """
+    chunk_size = app.config["VERIFY_CHUNK_SIZE"]
+    table_names = sorted(
+        tables or VERIFIED_MODELS,
+        key=lambda name: VERIFIED_MODELS[name][0] is not VERIFIED_MODELS[name][1],
+    )
+    counts = {}
+    for table_name in table_names:
+        Model, RevisionModel = VERIFIED_MODELS[table_name]
+        counts[table_name] = 0
+        first_id, last_id = _id_range(Model.__table__)
+        if first_id is None:
+            continue
+        for chunk in range(first_id // chunk_size, last_id // chunk_size + 1):
+            with db.engine.begin() as connection:
+                counts[table_name] += _rehash_chunk(
+                    connection, Model, RevisionModel, *_chunk_range(chunk, chunk_size)
+                )
+    merkle.rebuild_all()
+    db.session.commit()
+    return counts
+
+
+def _id_range(table):
+    with db.engine.connect() as connection:
+        return connection.execute(
+            select([func.min(table.c._id), func.max(table.c._id)])
+        ).first()
+
+
+def load_checkpoint(path, chunk_size):
+    """The checkpoint at path, or an empty one if it is missing or doesn't apply"""
+    try:
+        with open(path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        if (
+            checkpoint.get("format") == CHECKPOINT_FORMAT
+            and checkpoint.get("chunk_size") == chunk_size
+        ):
+            return checkpoint
+    except FileNotFoundError:
+        pass
+    except ValueError:
+        logging.error(f"Verify checkpoint {path} is not valid JSON, starting over")
+    return {"format": CHECKPOINT_FORMAT, "chunk_size": chunk_size, "tables": {}}
+
+
+def save_checkpoint(path, checkpoint):
+    """Write the checkpoint atomically so an interrupted run leaves the previous one"""
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, indent=2, sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+def _update_table_checkpoint(table_checkpoint, result):
+    chunks = table_checkpoint.setdefault("chunks", {})
+    chunks[str(result["chunk"])] = {
+        "digest": result["digest"],
+        "rows": result["rows"],
+        "mismatches": len(result["mismatches"]),
+    }
+    if result["last_key"] and result["last_key"] > table_checkpoint.get(
+        "last_verified", [0, 0]
+    ):
+        table_checkpoint["last_verified"] = result["last_key"]
+    # Rolling digest of the whole table from the digests of its chunks
+    rolling_digest = hashlib.sha256()
+    for chunk in sorted(chunks, key=int):
+        rolling_digest.update(chunks[chunk]["digest"].encode())
+    table_checkpoint["digest"] = rolling_digest.hexdigest()
+
+
+def verify(checkpoint_path=None, jobs=None, tables=None, full=False):
+    """Verify every table, or the named ones, returns the report dict"""
+    chunk_size = app.config["VERIFY_CHUNK_SIZE"]
+    checkpoint_path = checkpoint_path or app.config["VERIFY_CHECKPOINT"]
+    checkpoint = load_checkpoint(checkpoint_path, chunk_size)
+    report = {
+        "started": datetime.utcnow().isoformat(),
+        "finished": None,
+        "tables": {},
+        "mismatches": [],
+    }
+
+    tasks = []
+    for table_name in tables or VERIFIED_MODELS:
+        Model, RevisionModel = VERIFIED_MODELS[table_name]
+        report["tables"][table_name] = {
+            "rows": 0,
+            "unhashed": 0,
+            "chunks_verified": 0,
+            "chunks_skipped": 0,
+        }
+        first_id, last_id = _id_range(Model.__table__)
+        if first_id is None:
+            continue
+        table_checkpoint = checkpoint["tables"].setdefault(table_name, {})
+        checkpointed_chunks = table_checkpoint.get("chunks", {})
+        for chunk in range(first_id // chunk_size, last_id // chunk_size + 1):
+            checkpointed = checkpointed_chunks.get(str(chunk))
+            if full or not checkpointed or checkpointed["mismatches"]:
+                digest = None
+            else:
+                digest = checkpointed["digest"]
+            tasks.append((table_name, chunk, chunk_size, digest))
+
+    if jobs == 1:
+        results = map(verify_chunk, tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker)
+        results = executor.map(verify_chunk, tasks)
+    try:
+        for result in results:
+            table_report = report["tables"][result["table"]]
+            table_report["rows"] += result["rows"]
+            table_report["unhashed"] += result["unhashed"]
+            if result["skipped"]:
+                table_report["chunks_skipped"] += 1
+            else:
+                table_report["chunks_verified"] += 1
+            report["mismatches"].extend(result["mismatches"])
+            if result["digest"]:
+                _update_table_checkpoint(checkpoint["tables"][result["table"]], result)
+                save_checkpoint(checkpoint_path, checkpoint)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    report["finished"] = datetime.utcnow().isoformat()
+    return report
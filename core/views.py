@@ -1,20 +1,33 @@
+from sqlalchemy import func, literal
+from sqlalchemy.orm import load_only
 from core import app, db
+from core import registry
 from core.models import Node, User, Article, Site
-from core.controllers import load, load_node, load_content, dictify_content
+from core.controllers import (
+    load,
+    load_many,
+    load_node,
+    load_content_many,
+    query_content_of_type,
+    keyset_page,
+    dictify_content,
+)
 import logging
 import traceback
+import html
 import json
-from pprint import pprint
+import math
+import re
 
 
 # This is probably the wrong way to do it, should stay in the content API
-def view_front_page():
-    raw_content = Article.query.all()
-    pprint(raw_content)
-    articles = []
-    for content in raw_content[::-1]:
-        articles.append(load(content._node_id))
-    return articles
+def view_front_page(before=None):
+    """A page of the newest articles and the cursor of the next page"""
+    raw_content, next_cursor = keyset_page(
+        Article.query, Article, before, app.config["FRONT_PAGE_SIZE"]
+    )
+    articles = load_many(content._node_id for content in raw_content)
+    return articles, next_cursor
 
 
 def view_node(node_id):
@@ -32,41 +45,114 @@ def view_node(node_id):
 
 
 def view_all():
-    all_content = []
     nodes = Node.query.all()
-    for node in nodes:
-        all_content.append(dictify_content(load_content(node)))
+    all_content = [
+        dictify_content(content.values()) for content in load_content_many(nodes)
+    ]
 
     return all_content
 
 
-def view_content_control():
-    all_content = []
-    nodes = Node.query.all()
-    for node in nodes:
-        all_content.append(load_content(node))
+def _tabulator_list(args, name):
+    """Collect Tabulator's "name[0][key]=value" query parameters into a list of dicts"""
+    items = {}
+    for key, value in args.items():
+        match = re.match(rf"^{name}\[(\d+)\]\[(\w+)\]$", key)
+        if match:
+            items.setdefault(int(match.group(1)), {})[match.group(2)] = value
+    return [items[index] for index in sorted(items)]
 
-    table_content = []
-    for content in all_content:
-        if (
-            content["content"]._hash != content["type"]._hash
-            and content["type"].name == "Article Content Type"
-        ):
-            table_content.append(
-                {
-                    "title": content["content"].title,
-                    "type": content["type"].name,
-                    "body": content["content"].body,
-                    "view": f"<a href=\"{content['type'].view_url}/{content['node']._id}\">view</a>",
-                    "edit": f"<a href=\"{content['type'].edit_url}/{content['node']._id}\">edit</a>",
-                }
+
+def view_content_control(args):
+    """One page of the content control table in Tabulator's remote pagination format"""
+
+    """Paging, sorting, the type filter and the title search are all done in SQL and only
+    the columns the table shows are selected, with bodies truncated.  Understands the
+    "page", "size", "sorters" and "filters" parameters Tabulator sends when ajaxSorting
+    and ajaxFiltering are on.
+    Returns: {"last_page": int, "data": [rows]}
+    """
+    try:
+        page = max(int(args.get("page", 1)), 1)
+        page_size = int(args.get("size", app.config["CONTENT_CONTROL_PAGE_SIZE"]))
+    except ValueError:
+        page, page_size = 1, app.config["CONTENT_CONTROL_PAGE_SIZE"]
+    page_size = min(max(page_size, 1), app.config["CONTENT_CONTROL_MAX_PAGE_SIZE"])
+
+    type_name = "Article Content Type"
+    title_search = None
+    for content_filter in _tabulator_list(args, "filters"):
+        if content_filter.get("field") == "type" and content_filter.get("value"):
+            type_name = content_filter["value"]
+        elif content_filter.get("field") == "title" and content_filter.get("value"):
+            title_search = content_filter["value"]
+
+    registered_type = registry.get_by_name(type_name)
+    if not registered_type or not hasattr(registered_type["content_class"], "title"):
+        return {"last_page": 1, "data": []}
+    content_type = registered_type["type"]
+    ContentClass = registered_type["content_class"]
+
+    query = query_content_of_type(type_name)
+    if title_search:
+        # Wildcards typed into the filter match themselves
+        title_search = re.sub(r"([\\%_])", r"\\\1", title_search)
+        query = query.filter(
+            ContentClass.title.ilike(f"%{title_search}%", escape="\\")
+        )
+    row_count = query.count()
+
+    sortable_columns = {"title": ContentClass.title, "date": ContentClass._timestamp}
+    order_by = []
+    for sorter in _tabulator_list(args, "sorters"):
+        column = sortable_columns.get(sorter.get("field"))
+        if column is not None:
+            order_by.append(
+                column.asc() if sorter.get("dir") == "asc" else column.desc()
             )
-    return json.dumps(table_content, indent=4)
+    order_by += [ContentClass._timestamp.desc(), ContentClass._id.desc()]
+
+    body_preview = app.config["CONTENT_CONTROL_BODY_PREVIEW"]
+    if hasattr(ContentClass, "body"):
+        body_column = func.substr(ContentClass.body, 1, body_preview)
+    else:
+        body_column = literal("")
+    rows = (
+        query.with_entities(
+            Node._id, ContentClass.title, body_column, ContentClass._timestamp
+        )
+        .order_by(*order_by)
+        .limit(page_size)
+        .offset((page - 1) * page_size)
+        .all()
+    )
+
+    table_content = []
+    for node_id, title, body, timestamp in rows:
+        table_content.append(
+            {
+                "title": title,
+                "type": content_type.name,
+                "date": str(timestamp),
+                "body": _text_preview(body),
+                "view": f'<a href="{content_type.view_url}/{node_id}">view</a>',
+                "edit": f'<a href="{content_type.edit_url}/{node_id}">edit</a>',
+            }
+        )
+    return {
+        "last_page": max(math.ceil(row_count / page_size), 1),
+        "data": table_content,
+    }
+
+
+def _text_preview(body):
+    """The text of a body preview, the database may have cut it inside a tag"""
+    return html.unescape(re.sub(r"<[^>]*(>|$)", "", body or ""))
 
 
 def view_site_control():
     raw_sites = Site.query.all()
-    sites = list(load(site._node_id) for site in raw_sites)
+    sites = load_many(site._node_id for site in raw_sites)
 
     table_content = []
     for site in sites:
@@ -89,26 +175,30 @@ def view_site_control():
     return json.dumps(table_content, indent=4)
 
 
-def view_all_articles():
-    articles = Article.query.all()
-    contents = []
-    for article in articles:
-        contents.append(load(article._node_id))
+def view_all_articles(before=None):
+    """A page of the article list as table JSON and the cursor of the next page"""
+    content_type = registry.get_by_name("Article Content Type")["type"]
+    articles, next_cursor = keyset_page(
+        Article.query.options(load_only("_id", "_node_id", "_timestamp", "title")),
+        Article,
+        before,
+        app.config["ARTICLE_LIST_PAGE_SIZE"],
+    )
     table_content = []
-    for content in contents:
+    for article in articles:
         table_content.append(
             {
-                "title": f"<a href=\"{content['type'].view_url}/{content['node']._id}.html\">{content['content'].title}</a>",
-                "date": str(content["content"]._timestamp),
+                "title": f"<a href=\"{content_type.view_url}/{article._node_id}.html\">{article.title}</a>",
+                "date": str(article._timestamp),
             }
         )
 
-    return json.dumps(table_content)
+    return json.dumps(table_content), next_cursor
 
 
 def view_all_articles_as_node_options():
     """Dynamically load articles as options for a form"""
-    raw_options = Article.query.all()
+    raw_options = Article.query.options(load_only("_id", "_node_id", "title")).all()
     index_content_options = []
     if raw_options:
         for option in raw_options:
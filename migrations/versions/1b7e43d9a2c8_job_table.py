@@ -0,0 +1,63 @@
+"""Job table for background site builds
+
+Revision ID: 1b7e43d9a2c8
+Revises: d5a80c3f7e19
+Create Date: 2026-10-18 15:40:18.602715
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1b7e43d9a2c8'
+down_revision = 'd5a80c3f7e19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job',
+    sa.Column('_id', sa.Integer(), nullable=False),
+    sa.Column('_version', sa.Integer(), nullable=True),
+    sa.Column('_node_id', sa.Integer(), nullable=True),
+    sa.Column('_hash', sa.String(length=140), nullable=True),
+    sa.Column('_hash_chain', sa.String(length=140), nullable=True),
+    sa.Column('_timestamp', sa.DateTime(), nullable=True),
+    sa.Column('_lock', sa.UnicodeText(), nullable=True),
+    sa.Column('_state', sa.String(length=100), nullable=True),
+    sa.Column('_perms', sa.String(length=100), nullable=True),
+    sa.Column('kind', sa.String(length=50), nullable=True),
+    sa.Column('site_node_id', sa.Integer(), nullable=True),
+    sa.Column('active_site_node_id', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('stage', sa.String(length=50), nullable=True),
+    sa.Column('parameters', sa.UnicodeText(), nullable=True),
+    sa.Column('pages_done', sa.Integer(), nullable=True),
+    sa.Column('pages_total', sa.Integer(), nullable=True),
+    sa.Column('started', sa.DateTime(), nullable=True),
+    sa.Column('finished', sa.DateTime(), nullable=True),
+    sa.Column('errors', sa.UnicodeText(), nullable=True),
+    sa.Column('result', sa.UnicodeText(), nullable=True),
+    sa.ForeignKeyConstraint(['site_node_id'], ['node._id'], ),
+    sa.PrimaryKeyConstraint('_id'),
+    sa.UniqueConstraint('active_site_node_id')
+    )
+    op.create_index(op.f('ix_job__id'), 'job', ['_id'], unique=False)
+    op.create_index(op.f('ix_job__node_id'), 'job', ['_node_id'], unique=False)
+    op.create_index(op.f('ix_job__timestamp'), 'job', ['_timestamp'], unique=False)
+    op.create_index(op.f('ix_job__version'), 'job', ['_version'], unique=False)
+    op.create_index(op.f('ix_job_kind'), 'job', ['kind'], unique=False)
+    op.create_index(op.f('ix_job_site_node_id'), 'job', ['site_node_id'], unique=False)
+    op.create_index(op.f('ix_job_status'), 'job', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_job_status'), table_name='job')
+    op.drop_index(op.f('ix_job_site_node_id'), table_name='job')
+    op.drop_index(op.f('ix_job_kind'), table_name='job')
+    op.drop_index(op.f('ix_job__version'), table_name='job')
+    op.drop_index(op.f('ix_job__timestamp'), table_name='job')
+    op.drop_index(op.f('ix_job__node_id'), table_name='job')
+    op.drop_index(op.f('ix_job__id'), table_name='job')
+    op.drop_table('job')
@@ -0,0 +1,51 @@
+"""Merkle node table for incremental site content hashes
+
+Revision ID: 4c1d9e7a2b60
+Revises: 72fb7ffdfb86
+Create Date: 2026-10-18 14:05:31.518402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1d9e7a2b60'
+down_revision = '72fb7ffdfb86'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('merkle_node',
+    sa.Column('_id', sa.Integer(), nullable=False),
+    sa.Column('_version', sa.Integer(), nullable=True),
+    sa.Column('_node_id', sa.Integer(), nullable=True),
+    sa.Column('_hash', sa.String(length=140), nullable=True),
+    sa.Column('_hash_chain', sa.String(length=140), nullable=True),
+    sa.Column('_timestamp', sa.DateTime(), nullable=True),
+    sa.Column('_lock', sa.UnicodeText(), nullable=True),
+    sa.Column('_state', sa.String(length=100), nullable=True),
+    sa.Column('_perms', sa.String(length=100), nullable=True),
+    sa.Column('site_node_id', sa.Integer(), nullable=True),
+    sa.Column('level', sa.Integer(), nullable=True),
+    sa.Column('position', sa.Integer(), nullable=True),
+    sa.Column('digest', sa.String(length=140), nullable=True),
+    sa.Column('published_digest', sa.String(length=140), nullable=True),
+    sa.ForeignKeyConstraint(['site_node_id'], ['node._id'], ),
+    sa.PrimaryKeyConstraint('_id')
+    )
+    op.create_index(op.f('ix_merkle_node__id'), 'merkle_node', ['_id'], unique=False)
+    op.create_index(op.f('ix_merkle_node__node_id'), 'merkle_node', ['_node_id'], unique=False)
+    op.create_index(op.f('ix_merkle_node__timestamp'), 'merkle_node', ['_timestamp'], unique=False)
+    op.create_index(op.f('ix_merkle_node__version'), 'merkle_node', ['_version'], unique=False)
+    op.create_index('ix_merkle_node_site_node_id_level_position', 'merkle_node', ['site_node_id', 'level', 'position'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_merkle_node_site_node_id_level_position', table_name='merkle_node')
+    op.drop_index(op.f('ix_merkle_node__version'), table_name='merkle_node')
+    op.drop_index(op.f('ix_merkle_node__timestamp'), table_name='merkle_node')
+    op.drop_index(op.f('ix_merkle_node__node_id'), table_name='merkle_node')
+    op.drop_index(op.f('ix_merkle_node__id'), table_name='merkle_node')
+    op.drop_table('merkle_node')
@@ -0,0 +1,140 @@
+"""Node edge table migrated from the layer_parents and layer_children blobs
+
+Revision ID: 72fb7ffdfb86
+Revises: baea3e2e037f
+Create Date: 2026-10-18 13:42:09.227154
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime
+import json
+
+
+# revision identifiers, used by Alembic.
+revision = '72fb7ffdfb86'
+down_revision = 'baea3e2e037f'
+branch_labels = None
+depends_on = None
+
+MIGRATION_BATCH_SIZE = 1000
+EDGE_LAYER = 'layer'
+
+
+def _parse_layer(value):
+    """Layer blobs are JSON lists of node ids, tolerate comma separated ids as well"""
+    if not value or not value.strip():
+        return []
+    try:
+        node_ids = json.loads(value)
+    except ValueError:
+        node_ids = value.split(',')
+    if not isinstance(node_ids, list):
+        node_ids = [node_ids]
+    parsed = []
+    for node_id in node_ids:
+        try:
+            parsed.append(int(node_id))
+        except (ValueError, TypeError):
+            pass
+    return parsed
+
+
+def _migrate_layers():
+    node = sa.table(
+        'node',
+        sa.column('_id', sa.Integer),
+        sa.column('layer_parents', sa.UnicodeText),
+        sa.column('layer_children', sa.UnicodeText),
+    )
+    node_edge = sa.table(
+        'node_edge',
+        sa.column('_version', sa.Integer),
+        sa.column('_timestamp', sa.DateTime),
+        sa.column('parent_id', sa.Integer),
+        sa.column('child_id', sa.Integer),
+        sa.column('kind', sa.String),
+        sa.column('ordinal', sa.Integer),
+    )
+    connection = op.get_bind()
+    existing_ids = set(row._id for row in connection.execute(sa.select([node.c._id])))
+
+    # Children carry their order, parents are only added when not already known from
+    # the other side of the relationship
+    edges = {}
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select([node.c._id, node.c.layer_parents, node.c.layer_children])
+            .where(node.c._id > last_id)
+            .where(sa.or_(node.c.layer_parents.isnot(None), node.c.layer_children.isnot(None)))
+            .order_by(node.c._id)
+            .limit(MIGRATION_BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            for ordinal, child_id in enumerate(_parse_layer(row.layer_children)):
+                edges[(row._id, child_id)] = ordinal
+            for parent_id in _parse_layer(row.layer_parents):
+                edges.setdefault((parent_id, row._id), None)
+        last_id = rows[-1]._id
+
+    now = datetime.utcnow()
+    batch = []
+    for (parent_id, child_id), ordinal in sorted(edges.items()):
+        if parent_id not in existing_ids or child_id not in existing_ids:
+            continue  # Dangling references have nothing to point at
+        batch.append(
+            {
+                '_version': 1,
+                '_timestamp': now,
+                'parent_id': parent_id,
+                'child_id': child_id,
+                'kind': EDGE_LAYER,
+                'ordinal': ordinal,
+            }
+        )
+        if len(batch) >= MIGRATION_BATCH_SIZE:
+            op.bulk_insert(node_edge, batch)
+            batch = []
+    if batch:
+        op.bulk_insert(node_edge, batch)
+
+
+def upgrade():
+    op.create_table('node_edge',
+    sa.Column('_id', sa.Integer(), nullable=False),
+    sa.Column('_version', sa.Integer(), nullable=True),
+    sa.Column('_node_id', sa.Integer(), nullable=True),
+    sa.Column('_hash', sa.String(length=140), nullable=True),
+    sa.Column('_hash_chain', sa.String(length=140), nullable=True),
+    sa.Column('_timestamp', sa.DateTime(), nullable=True),
+    sa.Column('_lock', sa.UnicodeText(), nullable=True),
+    sa.Column('_state', sa.String(length=100), nullable=True),
+    sa.Column('_perms', sa.String(length=100), nullable=True),
+    sa.Column('parent_id', sa.Integer(), nullable=True),
+    sa.Column('child_id', sa.Integer(), nullable=True),
+    sa.Column('kind', sa.String(length=50), nullable=True),
+    sa.Column('ordinal', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['child_id'], ['node._id'], ),
+    sa.ForeignKeyConstraint(['parent_id'], ['node._id'], ),
+    sa.PrimaryKeyConstraint('_id')
+    )
+    op.create_index(op.f('ix_node_edge__id'), 'node_edge', ['_id'], unique=False)
+    op.create_index(op.f('ix_node_edge__node_id'), 'node_edge', ['_node_id'], unique=False)
+    op.create_index(op.f('ix_node_edge__timestamp'), 'node_edge', ['_timestamp'], unique=False)
+    op.create_index(op.f('ix_node_edge__version'), 'node_edge', ['_version'], unique=False)
+    op.create_index('ix_node_edge_child_id_kind', 'node_edge', ['child_id', 'kind'], unique=False)
+    op.create_index('ix_node_edge_parent_id_kind_ordinal', 'node_edge', ['parent_id', 'kind', 'ordinal'], unique=False)
+    _migrate_layers()
+
+
+def downgrade():
+    op.drop_index('ix_node_edge_parent_id_kind_ordinal', table_name='node_edge')
+    op.drop_index('ix_node_edge_child_id_kind', table_name='node_edge')
+    op.drop_index(op.f('ix_node_edge__version'), table_name='node_edge')
+    op.drop_index(op.f('ix_node_edge__timestamp'), table_name='node_edge')
+    op.drop_index(op.f('ix_node_edge__node_id'), table_name='node_edge')
+    op.drop_index(op.f('ix_node_edge__id'), table_name='node_edge')
+    op.drop_table('node_edge')
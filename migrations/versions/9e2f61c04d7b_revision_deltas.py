@@ -0,0 +1,163 @@
+"""Delta compressed revision rows
+
+Revision ID: 9e2f61c04d7b
+Revises: 4c1d9e7a2b60
+Create Date: 2026-10-18 14:31:12.804377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from difflib import SequenceMatcher
+import json
+import zlib
+import re
+
+
+# revision identifiers, used by Alembic.
+revision = '9e2f61c04d7b'
+down_revision = '4c1d9e7a2b60'
+branch_labels = None
+depends_on = None
+
+MIGRATION_BATCH_SIZE = 200  # Row ids per batch, with all of their versions
+SNAPSHOT_INTERVAL = 10  # REVISION_SNAPSHOT_INTERVAL at the time of this migration
+DELTA_FORMAT = 1
+
+# The text columns of each revision table stored as deltas, as in core.revisions
+DELTA_COLUMNS = {
+    'node_revision': ('_lock', 'labels', 'layer_children', 'layer_parents'),
+    'content_type_revision': ('_lock', 'editable_fields', 'viewable_fields'),
+    'user_revision': ('_lock', 'roles'),
+    'article_revision': ('_lock', 'body'),
+    'site_revision': ('_lock', 'groups_content', 'menu_content'),
+}
+
+# Copied from core.revisions so this migration keeps working as that module changes
+_SEGMENT = re.compile(r"[^\n.>]*[\n.>]|[^\n.>]+")
+
+
+def _diff(value, target):
+    if value is None:
+        return None
+    if target is None:
+        return [value] if value else []
+    target_segments = _SEGMENT.findall(target)
+    segments = _SEGMENT.findall(value)
+    prefix = 0
+    limit = min(len(segments), len(target_segments))
+    while prefix < limit and segments[prefix] == target_segments[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and segments[-suffix - 1] == target_segments[-suffix - 1]:
+        suffix += 1
+    target_end = len(target_segments) - suffix
+    matcher = SequenceMatcher(None, target_segments[prefix:target_end], segments[prefix:len(segments) - suffix])
+    ops = [[0, prefix]] if prefix else []
+    for tag, target_start, target_stop, start, end in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([prefix + target_start, prefix + target_stop])
+        elif start != end:
+            ops.append(''.join(matcher.b[start:end]))
+    if suffix:
+        ops.append([target_end, len(target_segments)])
+    return ops
+
+
+def _patch(ops, target):
+    if ops is None:
+        return None
+    target_segments = _SEGMENT.findall(target) if target else []
+    parts = []
+    for op_ in ops:
+        if isinstance(op_, str):
+            parts.append(op_)
+        else:
+            parts.extend(target_segments[op_[0]:op_[1]])
+    return ''.join(parts)
+
+
+def _table(table_name):
+    return sa.table(
+        table_name,
+        sa.column('_id', sa.Integer),
+        sa.column('_version', sa.Integer),
+        sa.column('_delta', sa.LargeBinary),
+        *[sa.column(key, sa.UnicodeText) for key in DELTA_COLUMNS[table_name]]
+    )
+
+
+def _batches(table):
+    """The rows of MIGRATION_BATCH_SIZE ids at a time, grouped by id"""
+    connection = op.get_bind()
+    last_id = None
+    while True:
+        query = sa.select([table.c._id]).distinct().order_by(table.c._id)
+        if last_id is not None:
+            query = query.where(table.c._id > last_id)
+        ids = [row._id for row in connection.execute(query.limit(MIGRATION_BATCH_SIZE))]
+        if not ids:
+            break
+        rows_by_id = {}
+        for row in connection.execute(sa.select([table]).where(table.c._id.in_(ids))):
+            rows_by_id.setdefault(row._id, {})[row._version or 0] = dict(row)
+        yield rows_by_id
+        last_id = ids[-1]
+
+
+def _compress(table_name):
+    """Every revision but the newest of a row and the snapshots becomes a delta"""
+    columns = DELTA_COLUMNS[table_name]
+    table = _table(table_name)
+    connection = op.get_bind()
+    for rows_by_id in _batches(table):
+        for _id, versions in rows_by_id.items():
+            for version, row in versions.items():
+                next_row = versions.get(version + 1)
+                if not version or version % SNAPSHOT_INTERVAL == 0 or next_row is None:
+                    continue
+                delta = {key: _diff(row[key], next_row[key]) for key in columns}
+                delta['format'] = DELTA_FORMAT
+                values = {key: None for key in columns}
+                values['_delta'] = zlib.compress(json.dumps(delta, separators=(',', ':')).encode(), 9)
+                connection.execute(
+                    table.update()
+                    .where(table.c._id == _id)
+                    .where(table.c._version == version)
+                    .values(**values)
+                )
+
+
+def _expand(table_name):
+    """Write the full text columns back into every delta row"""
+    columns = DELTA_COLUMNS[table_name]
+    table = _table(table_name)
+    connection = op.get_bind()
+    for rows_by_id in _batches(table):
+        for _id, versions in rows_by_id.items():
+            for version in sorted(versions, reverse=True):
+                row = versions[version]
+                next_row = versions.get(version + 1)
+                if row['_delta'] is None or next_row is None or next_row['_delta'] is not None:
+                    continue
+                delta = json.loads(zlib.decompress(row['_delta']))
+                values = {key: _patch(delta.get(key), next_row[key]) for key in columns}
+                row.update(values, _delta=None)
+                connection.execute(
+                    table.update()
+                    .where(table.c._id == _id)
+                    .where(table.c._version == version)
+                    .values(**values)
+                )
+
+
+def upgrade():
+    for table_name in DELTA_COLUMNS:
+        op.add_column(table_name, sa.Column('_delta', sa.LargeBinary(), nullable=True))
+        _compress(table_name)
+
+
+def downgrade():
+    for table_name in DELTA_COLUMNS:
+        _expand(table_name)
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.drop_column('_delta')
@@ -0,0 +1,101 @@
+"""Typed first child columns on node and node_revision
+
+Revision ID: baea3e2e037f
+Revises: 035599489d45
+Create Date: 2026-10-18 13:20:41.512903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import json
+
+
+# revision identifiers, used by Alembic.
+revision = 'baea3e2e037f'
+down_revision = '035599489d45'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _backfill(table_name):
+    """Copy the first_child JSON into the typed columns a batch at a time"""
+    table = sa.table(
+        table_name,
+        sa.column('_id', sa.Integer),
+        sa.column('_version', sa.Integer),
+        sa.column('first_child', sa.String),
+        sa.column('content_id', sa.Integer),
+        sa.column('content_revision', sa.Integer),
+        sa.column('content_type_id', sa.Integer),
+    )
+    connection = op.get_bind()
+    last_key = (0, 0)
+    while True:
+        rows = connection.execute(
+            sa.select([table.c._id, table.c._version, table.c.first_child])
+            .where(table.c.first_child.isnot(None))
+            .where(
+                sa.or_(
+                    table.c._id > last_key[0],
+                    sa.and_(
+                        table.c._id == last_key[0],
+                        sa.func.coalesce(table.c._version, 0) > last_key[1],
+                    ),
+                )
+            )
+            .order_by(table.c._id, table.c._version)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for row in rows:
+            try:
+                first_child = json.loads(row.first_child)
+                updates.append(
+                    {
+                        'b_id': row._id,
+                        'b_version': row._version or 0,
+                        'b_content_id': int(first_child['content_id']),
+                        'b_content_revision': first_child.get('content_revision'),
+                        'b_content_type_id': int(first_child['content_type_id']),
+                    }
+                )
+            except (ValueError, KeyError, TypeError):
+                pass  # Leave unparsable associations for manual repair
+        if updates:
+            connection.execute(
+                table.update()
+                .where(table.c._id == sa.bindparam('b_id'))
+                .where(sa.func.coalesce(table.c._version, 0) == sa.bindparam('b_version'))
+                .values(
+                    content_id=sa.bindparam('b_content_id'),
+                    content_revision=sa.bindparam('b_content_revision'),
+                    content_type_id=sa.bindparam('b_content_type_id'),
+                ),
+                updates,
+            )
+        last_key = (rows[-1]._id, rows[-1]._version or 0)
+
+
+def upgrade():
+    for table_name in ('node', 'node_revision'):
+        op.add_column(table_name, sa.Column('content_id', sa.Integer(), nullable=True))
+        op.add_column(table_name, sa.Column('content_revision', sa.Integer(), nullable=True))
+        op.add_column(table_name, sa.Column('content_type_id', sa.Integer(), nullable=True))
+        op.create_index(op.f('ix_{}_content_id'.format(table_name)), table_name, ['content_id'], unique=False)
+        op.create_index(op.f('ix_{}_content_type_id'.format(table_name)), table_name, ['content_type_id'], unique=False)
+        _backfill(table_name)
+
+
+def downgrade():
+    for table_name in ('node_revision', 'node'):
+        op.drop_index(op.f('ix_{}_content_type_id'.format(table_name)), table_name=table_name)
+        op.drop_index(op.f('ix_{}_content_id'.format(table_name)), table_name=table_name)
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.drop_column('content_type_id')
+            batch_op.drop_column('content_revision')
+            batch_op.drop_column('content_id')
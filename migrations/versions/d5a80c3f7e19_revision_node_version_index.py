@@ -0,0 +1,33 @@
+"""Unique (_node_id, _version) index on the revision tables
+
+Revision ID: d5a80c3f7e19
+Revises: 9e2f61c04d7b
+Create Date: 2026-10-18 15:02:47.160938
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a80c3f7e19'
+down_revision = '9e2f61c04d7b'
+branch_labels = None
+depends_on = None
+
+REVISION_TABLES = (
+    'node_revision',
+    'content_type_revision',
+    'user_revision',
+    'article_revision',
+    'site_revision',
+)
+
+
+def upgrade():
+    for table_name in REVISION_TABLES:
+        op.create_index('ix_{}__node_id__version'.format(table_name), table_name, ['_node_id', '_version'], unique=True)
+
+
+def downgrade():
+    for table_name in REVISION_TABLES:
+        op.drop_index('ix_{}__node_id__version'.format(table_name), table_name=table_name)
@@ -1,7 +1,7 @@
 """ Ochyro
 """
 from core import app, db
-from core.models import Node, ContentType, User, Article
+from core.models import Node, NodeEdge, ContentType, User, Article
 
 
 @app.shell_context_processor
@@ -9,6 +9,7 @@ def make_shell_context():
     return {
         "db": db,
         "Node": Node,
+        "NodeEdge": NodeEdge,
         "ContentType": ContentType,
         "User": User,
         "Article": Article,